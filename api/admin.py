@@ -1,3 +1,47 @@
 from django.contrib import admin
+from . import models
+from .services import ApiTokenService
 
-# Register your models here.
+class VoucherApiAdmin(admin.ModelAdmin):
+    """
+    Admin of VoucherApi objects, whose string representation is the code of their voucher.
+
+    The vouchers are fetched by a join (`list_select_related` for the change list, `get_queryset` for
+    the other pages), and picked by ID rather than from a select listing every voucher.
+    """
+    list_display = ['__str__', 'description']
+    list_select_related = ['voucher']
+    raw_id_fields = ['voucher']
+    search_fields = ['voucher__code']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('voucher')
+
+admin.site.register(models.VoucherApi, VoucherApiAdmin)
+
+
+class ApiTokenAdmin(admin.ModelAdmin):
+    """
+    Admin of API tokens, listing and revoking them.
+
+    Tokens are created with the `create_api_token` management command, as a token is only shown once
+    and only its hash is stored.
+    """
+    list_display = ['__str__', 'key_prefix', 'user', 'is_active', 'created_at']
+    list_filter = ['is_active']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    readonly_fields = ['user', 'key_prefix', 'is_active', 'created_at']
+    search_fields = ['name', 'key_prefix', 'user__username']
+    actions = ['revoke_tokens']
+    api_token_service = ApiTokenService()
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Revoke selected API tokens')
+    def revoke_tokens(self, request, queryset):
+        revoked = self.api_token_service.revoke_tokens(queryset)
+        self.message_user(request, f'Revoked {revoked} API tokens.')
+
+admin.site.register(models.ApiToken, ApiTokenAdmin)
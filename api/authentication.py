@@ -0,0 +1,109 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from .models import ApiToken
+
+
+class ApiTokenCache:
+    """
+    In-process cache of the tokens resolved by `CachedTokenAuthentication`, with their users, keyed by token hash,
+    so an authenticated API request costs no query once its token is cached.
+
+    Entries expire after `API_TOKEN_CACHE_TIMEOUT` seconds, and the least recently used entries are evicted
+    beyond `API_TOKEN_CACHE_SIZE` entries. Saving or deleting a token or a user invalidates its entries in the
+    process performing the write (see `signals.py`); other processes see the change once their entries expire.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key_hash):
+        """
+        Returns the cached user and token of a token hash, or None if it is not cached (or expired).
+        """
+        with self.lock:
+            entry = self.entries.get(key_hash)
+            if entry is None:
+                return None
+            user, token, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key_hash]
+                return None
+            self.entries.move_to_end(key_hash)
+        return copy.copy(user), token
+
+    def set(self, key_hash, user, token):
+        with self.lock:
+            self.entries[key_hash] = (user, token, time.monotonic() + settings.API_TOKEN_CACHE_TIMEOUT)
+            self.entries.move_to_end(key_hash)
+            while len(self.entries) > settings.API_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key_hash):
+        with self.lock:
+            self.entries.pop(key_hash, None)
+
+    def invalidate_many(self, key_hashes):
+        with self.lock:
+            for key_hash in key_hashes:
+                self.entries.pop(key_hash, None)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key_hash in [key_hash for key_hash, (user, token, expires_at) in self.entries.items() if user.pk == user_id]:
+                del self.entries[key_hash]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+api_token_cache = ApiTokenCache()
+
+
+class CachedTokenAuthentication(BaseAuthentication):
+    """
+    DRF authentication with the API tokens of `ApiToken`, sent as `Authorization: Token <token>`.
+
+    Tokens are looked up by hash, on the primary database (a token created moments ago may be missing from
+    the read replica), and resolved tokens are kept in `api_token_cache`, so a request with a cached token
+    queries neither the tokens, the users nor the sessions. Revoked tokens and inactive users are rejected.
+
+    Attributes:
+    - `keyword` (str): Keyword of the `Authorization` header.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        authorization = get_authorization_header(request).split()
+        if not authorization or authorization[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(authorization) != 2:
+            raise AuthenticationFailed('Invalid token header: expected a single token.')
+        try:
+            key = authorization[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header: the token contains invalid characters.')
+        key_hash = ApiToken.hash_key(key)
+        resolved = api_token_cache.get(key_hash)
+        if resolved is None:
+            token = (
+                ApiToken.objects.using(DEFAULT_DB_ALIAS)
+                .select_related('user')
+                .filter(key_hash=key_hash, is_active=True, user__is_active=True)
+                .first()
+            )
+            if token is None:
+                raise AuthenticationFailed('Invalid token.')
+            api_token_cache.set(key_hash, token.user, token)
+            resolved = copy.copy(token.user), token
+        return resolved
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,75 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.renderers import StreamingJSONRenderer
+from api.serializers import ValuesSerializer, VoucherSerializer
+from voucher_management.models import Voucher
+from voucher_management.services import VoucherManagementService
+
+
+class Command(BaseCommand):
+    """
+    Management command comparing the voucher listing serialization paths.
+
+    For each size, the same vouchers are rendered to JSON with `VoucherSerializer` and `JSONRenderer`, and from
+    `values()` rows with `ValuesSerializer` and `StreamingJSONRenderer`; both outputs must be identical.
+    Missing vouchers are generated inside a transaction that is rolled back at the end.
+
+    Example:
+    - `python manage.py bench_voucher_listing --sizes 10000 100000`
+    """
+
+    help = 'Benchmarks the values() listing serialization path against VoucherSerializer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help='Numbers of vouchers to serialize.')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per path (best is kept).')
+
+    def time_best(self, function, repeat):
+        best_time, result = None, None
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - started_at
+            best_time = elapsed if best_time is None else min(best_time, elapsed)
+        return best_time, result
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        with transaction.atomic():
+            missing = sizes[-1] - Voucher.objects.count()
+            if missing > 0:
+                self.stdout.write(f'Generating {missing} vouchers (rolled back at the end)...')
+                VoucherManagementService().generate_vouchers(
+                    missing,
+                    prefix='BENCH-',
+                    description='Benchmark voucher – 10% off',
+                    discount_percentage=10,
+                    expiration_date=timezone.now() + timedelta(days=30),
+                )
+            for size in sizes:
+                queryset = Voucher.objects.order_by('id')[:size]
+                values_serializer = ValuesSerializer(VoucherSerializer())
+
+                def render_serializer():
+                    return JSONRenderer().render(VoucherSerializer(queryset, many=True).data)
+
+                def render_values():
+                    rows = queryset.values(*values_serializer.get_values_field_names())
+                    return b''.join(StreamingJSONRenderer().iter_render_list(
+                        map(values_serializer.to_representation, rows.iterator(chunk_size=2000))
+                    ))
+
+                serializer_time, serializer_output = self.time_best(render_serializer, options['repeat'])
+                values_time, values_output = self.time_best(render_values, options['repeat'])
+                if serializer_output != values_output:
+                    raise CommandError(f'The values() listing of {size} vouchers differs from VoucherSerializer')
+                self.stdout.write(
+                    f'{size} vouchers: VoucherSerializer {serializer_time:.3f}s, values() path {values_time:.3f}s '
+                    f'({serializer_time / values_time:.1f}x faster, {len(values_output)} identical bytes)'
+                )
+            transaction.set_rollback(True)
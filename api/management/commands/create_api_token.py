@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from api.services import ApiTokenService
+
+
+class Command(BaseCommand):
+    """
+    Management command creating an API token for a user, and printing it.
+
+    The token is only stored hashed: it is printed once and can not be shown again. Tokens are revoked
+    from the admin.
+
+    Example:
+    - `python manage.py create_api_token terminal01 --name "Store 12, till 3"`
+    """
+
+    help = 'Creates an API token for a user and prints it (once).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Username of the user the token authenticates.')
+        parser.add_argument('--name', default='', help='Name of the token, e.g. the terminal using it.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get_by_natural_key(options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+        token, key = ApiTokenService().create_token(user, options['name'])
+        if options['verbosity'] > 1:
+            self.stdout.write(self.style.SUCCESS(f'Created the API token {token.key_prefix}… for {user}'))
+        self.stdout.write(key)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from voucher_system.idempotency import IdempotencyStore, idempotency_store
+
+
+class Command(BaseCommand):
+    """
+    Management command deleting the expired idempotency keys in bounded batches (see
+    `IdempotencyStore.purge_expired`).
+
+    Run periodically (e.g. every hour from cron), so the table only holds the keys of the last
+    `IDEMPOTENCY_KEY_TIMEOUT` seconds.
+
+    Example:
+    - `python manage.py purge_idempotency_keys --batch-size 1000 --pause 0.05`
+    """
+
+    help = 'Deletes the expired idempotency keys in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=IdempotencyStore.purge_batch_size,
+                            help='Number of keys deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Number of seconds to sleep between batches, letting requests write.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        purged = idempotency_store.purge_expired(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully deleted {purged} expired idempotency keys'))
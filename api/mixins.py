@@ -0,0 +1,193 @@
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from voucher_management.versions import voucher_versions
+from voucher_system.idempotency import idempotency_store
+from .renderers import StreamingJSONRenderer
+from .serializers import ValuesSerializer
+
+
+class SparseFieldsetMixin:
+    """
+    Generic API view mixin limiting read responses to the fields listed in the `fields` query parameter
+    (e.g. `?fields=code,is_active`).
+
+    The requested fields are validated against the serializer fields before the view runs, narrow the
+    serializer output and, for fields backed by model columns, the columns selected by the queryset.
+    The parameter is ignored by writes, which always accept and return every field.
+
+    Attributes:
+    - `fields_query_param` (str): Name of the query parameter listing the requested fields.
+    - `requested_fields` (list): Fields requested by the current request (None for every field).
+    """
+    fields_query_param = 'fields'
+    requested_fields = None
+
+    def get_requested_fields(self):
+        """
+        Returns the fields requested by the client, or None if every field should be returned.
+
+        Raises:
+        - ValidationError: If an unknown field is requested.
+        """
+        fields_query = self.request.query_params.get(self.fields_query_param)
+        if self.request.method not in permissions.SAFE_METHODS or not fields_query:
+            return None
+        requested_fields = list(dict.fromkeys(field.strip() for field in fields_query.split(',') if field.strip()))
+        available_fields = self.get_serializer_class()().fields
+        unknown_fields = [field for field in requested_fields if field not in available_fields]
+        if unknown_fields:
+            raise ValidationError({
+                self.fields_query_param: [f'Unknown fields: {", ".join(unknown_fields)}.'],
+            })
+        return requested_fields
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.requested_fields = self.get_requested_fields()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.requested_fields:
+            model_field_names = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = queryset.only(*[field for field in self.requested_fields if field in model_field_names])
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.requested_fields:
+            kwargs['fields'] = self.requested_fields
+        return super().get_serializer(*args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    Generic API view mixin answering conditional GET requests (`If-None-Match`, `If-Modified-Since`) from a
+    version stamp, before the main query and the serializer run.
+
+    The strong ETag of a response is computed from the version stamp, the request URL (including the query
+    parameters) and the accepted media type, and sent with `Last-Modified` on every successful response.
+    HTML (browsable API) responses embed a CSRF token, so they are never answered with a 304.
+
+    The version stamp is the version of the voucher listings by default (see `VoucherVersions.get_listing_version`);
+    views whose responses depend on a narrower version (e.g. a single voucher) override `get_version_stamp`.
+    """
+
+    def get_version_stamp(self):
+        """
+        Returns the version the response depends on and the date it last changed.
+
+        Returns:
+        - tuple: A version (any value with a stable `repr`) and the date of the last change (datetime or None).
+        """
+        return voucher_versions.get_listing_version()
+
+    def get_etag(self, version):
+        request = self.request
+        return voucher_versions.get_etag(version, request.build_absolute_uri(), request.accepted_media_type)
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.media_type == 'text/html':
+            return super().get(request, *args, **kwargs)
+        version, last_modified = self.get_version_stamp()
+        etag = self.get_etag(version)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ValuesListMixin:
+    """
+    Generic list API view mixin serving JSON listings from `values()` rows through `ValuesSerializer`,
+    streamed by `StreamingJSONRenderer`, instead of `ModelSerializer` instances.
+
+    The response body is byte-for-byte identical to the regular listing. Other formats (e.g. the browsable API),
+    indented JSON and serializers with fields that are not plain model columns use the regular listing.
+    The primary key is always selected, as the pagination cursors are positioned on it.
+
+    Attributes:
+    - `values_iterator_chunk_size` (int): Number of rows fetched at once when the listing is not paginated.
+    """
+    values_iterator_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        serializer = self.get_serializer()
+        if (
+            not isinstance(renderer, StreamingJSONRenderer)
+            or renderer.get_indent(request.accepted_media_type, self.get_renderer_context()) is not None
+            or not ValuesSerializer.supports(serializer)
+        ):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        values_serializer = ValuesSerializer(serializer, extra_field_names=[queryset.model._meta.pk.attname])
+        queryset = queryset.values(*values_serializer.get_values_field_names())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            rows = page
+            envelope = self.get_paginated_response([]).data
+        else:
+            rows = queryset.iterator(chunk_size=self.values_iterator_chunk_size)
+            envelope = None
+        return StreamingHttpResponse(
+            renderer.iter_render_list(map(values_serializer.to_representation, rows), envelope),
+            content_type=renderer.media_type,
+        )
+
+
+class IdempotentCreateMixin:
+    """
+    Generic create API view mixin running creations sent with an `Idempotency-Key` header once (see
+    `IdempotencyStore`): retries with the same key are answered with the response of the first attempt,
+    with an `Idempotent-Replayed: true` header, without touching the database.
+
+    Responses are stored with their status code, data and `Location` header. Failed attempts (e.g. invalid data)
+    are not stored, so they run again when retried. A key sent while its first attempt is running is answered
+    with a 409, and a key reused with another payload with a 422. Anonymous clients share the scope of their keys.
+
+    Attributes:
+    - `idempotency_operation` (str): Name of the operation the keys are scoped to (defaults to the view name).
+    """
+    idempotency_operation = None
+
+    def get_create_result(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        headers = {name: response[name] for name in ('Location',) if response.has_header(name)}
+        return response.status_code, response.data, headers
+
+    def create(self, request, *args, **kwargs):
+        try:
+            request_key = idempotency_store.get_request_key(
+                request,
+                self.idempotency_operation or type(self).__name__,
+                request.data,
+            )
+        except ValueError as e:
+            raise ValidationError({idempotency_store.header: [str(e)]})
+        if request_key is None:
+            return super().create(request, *args, **kwargs)
+        state, result = idempotency_store.run(*request_key, self.get_create_result, request, *args, **kwargs)
+        if state == idempotency_store.IN_PROGRESS:
+            return Response(
+                {'detail': f'A request with this {idempotency_store.header} is in progress.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if state == idempotency_store.MISMATCH:
+            return Response(
+                {'detail': f'This {idempotency_store.header} was already used with another payload.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        status_code, data, headers = result
+        response = Response(data, status=status_code, headers=headers)
+        if state == idempotency_store.REPLAYED:
+            response['Idempotent-Replayed'] = 'true'
+        return response
@@ -1,3 +1,5 @@
+import hashlib
+from django.conf import settings
 from django.db import models
 from voucher_management.models import Voucher
 
@@ -24,3 +26,60 @@ class VoucherApi(models.Model):
         - str: String representation of the VoucherApi instance.
         """
         return self.voucher.code
+
+
+class ApiToken(models.Model):
+    """
+    Model class representing an API token authenticating a user (see `CachedTokenAuthentication`).
+
+    Only the SHA-256 hash of the token is stored: the token itself is shown once, when it is created
+    (see `ApiTokenService.create_token`). Tokens are random and long, so a fast hash is enough.
+
+    Fields:
+    - `user` (ForeignKey): The user the token authenticates.
+    - `name` (CharField): Name of the token, e.g. the terminal using it.
+    - `key_prefix` (CharField): First characters of the token, identifying it.
+    - `key_hash` (CharField): SHA-256 hash of the token (hexadecimal, unique).
+    - `is_active` (BooleanField): Whether the token authenticates its user (false once revoked).
+    - `created_at` (DateTimeField): Date of creation of the token.
+
+    Methods:
+    - `hash_key`: Returns the hash of a token.
+    - `__str__`: Returns the name of the token, or its prefix.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    key_prefix = models.CharField(max_length=8, editable=False)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def __str__(self):
+        return self.name or f'{self.key_prefix}…'
+
+
+class IdempotencyKey(models.Model):
+    """
+    Model class representing an `Idempotency-Key` sent with a request, and the result of the request
+    (see `IdempotencyStore`).
+
+    Fields:
+    - `key` (CharField): The key, scoped to the operation and the user sending it (unique).
+    - `fingerprint` (CharField): SHA-256 hash of the payload of the request that claimed the key.
+    - `completed` (BooleanField): Whether the request completed and its result is stored.
+    - `result` (BinaryField): The pickled result of the request, once completed.
+    - `expires_at` (DateTimeField): Date after which the claim or the result is dropped (indexed, so
+      expired keys are purged in batches).
+    """
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    completed = models.BooleanField(default=False)
+    result = models.BinaryField(null=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination ordered by primary key.
+
+    Each page is fetched with `id > <last id of the previous page>` on the primary key index, so its cost does
+    not depend on the position of the page or the size of the table (unlike OFFSET pagination), and the cursors
+    stay stable while rows are inserted or deleted.
+
+    Attributes:
+    - `ordering` (str): Field the pages are ordered by (unique and immutable).
+    - `page_size_query_param` (str): Query parameter overriding the page size (`PAGE_SIZE` setting by default).
+    - `max_page_size` (int): Maximum page size a client can request.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
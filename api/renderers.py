@@ -0,0 +1,56 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.compat import SHORT_SEPARATORS, LONG_SEPARATORS
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that can also render a list of items incrementally, as an iterator of byte chunks.
+
+    The chunks produced by `iter_render_list` concatenate to exactly the bytes `render` returns for the same data.
+    """
+
+    def get_encoder(self):
+        return self.encoder_class(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=SHORT_SEPARATORS if self.compact else LONG_SEPARATORS,
+        )
+
+    def encode(self, encoder, data):
+        return encoder.encode(data).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+    def iter_render_list(self, items, envelope=None, results_key='results', chunk_size=1000):
+        """
+        Renders a list of items into JSON one chunk of items at a time.
+
+        Parameters:
+        - `items` (iterable): The items of the list (already converted to primitive values).
+        - `envelope` (dict): Data the list is wrapped in, as its last value under `results_key`
+          (e.g. the next and previous links of a page).
+        - `results_key` (str): Key of the list in the envelope.
+        - `chunk_size` (int): Number of items encoded at once.
+
+        Yields:
+        - bytes: Consecutive chunks of the JSON document.
+        """
+        encoder = self.get_encoder()
+        if envelope is None:
+            head, tail = b'[', b']'
+        else:
+            assert list(envelope)[-1] == results_key, 'The list must be the last value of the envelope'
+            head, tail = self.encode(encoder, {**envelope, results_key: []}).rsplit(b'[]', 1)
+            head += b'['
+            tail = b']' + tail
+        yield head
+        item_separator = encoder.item_separator.encode()
+        chunk = []
+        first_chunk = True
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield (b'' if first_chunk else item_separator) + self.encode(encoder, chunk)[1:-1]
+                first_chunk = False
+                chunk = []
+        if chunk:
+            yield (b'' if first_chunk else item_separator) + self.encode(encoder, chunk)[1:-1]
+        yield tail
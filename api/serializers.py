@@ -1,15 +1,48 @@
-from rest_framework import serializers
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+from voucher_redemption.models import ArchivedVoucherRedemption
 from .models import Voucher, VoucherApi
 
 
-class VoucherSerializer(serializers.ModelSerializer):
+class VoucherCodeField(serializers.CharField):
+    """
+    Serializer field for voucher codes that normalizes the submitted code before it is validated,
+    so the uniqueness check compares normalized codes.
+    """
+    def to_internal_value(self, data):
+        return Voucher.normalize_code(super().to_internal_value(data))
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer accepting an optional `fields` argument that limits the fields it serializes.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class VoucherSerializer(DynamicFieldsModelSerializer):
     """
     Serializer class for the Voucher model.
 
+    Fields:
+    - `code` (VoucherCodeField): Unique voucher code, stored in its normalized form.
+
     Meta:
     - `model` (Model): Voucher model.
     - `fields` (list): List of fields to include in the serialization (all fields in this case).
     """
+    code = VoucherCodeField(
+        max_length=20,
+        validators=[UniqueValidator(queryset=Voucher.objects.all())],
+    )
+
     class Meta:
         model = Voucher
         fields = '__all__'
@@ -19,10 +52,182 @@ class VoucherApiSerializer(serializers.ModelSerializer):
     """
     Serializer class for the VoucherApi model.
 
+    The associated voucher is nested inline when reading; writes set it by ID with `voucher_id`.
+    Querysets serialized with it should `select_related('voucher')`.
+
+    Fields:
+    - `voucher` (VoucherSerializer): The associated voucher (read-only).
+    - `voucher_id` (PrimaryKeyRelatedField): ID of the associated voucher (write-only, one VoucherApi per voucher).
+
     Meta:
     - `model` (Model): VoucherApi model.
     - `fields` (list): List of fields to include in the serialization (all fields in this case).
     """
+    voucher = VoucherSerializer(read_only=True)
+    voucher_id = serializers.PrimaryKeyRelatedField(
+        source='voucher',
+        queryset=Voucher.objects.all(),
+        write_only=True,
+        validators=[UniqueValidator(queryset=VoucherApi.objects.all())],
+    )
+
     class Meta:
         model = VoucherApi
         fields = '__all__'
+
+
+class RedemptionAnalyticsQuerySerializer(serializers.Serializer):
+    """
+    Serializer validating the query parameters of the redemption analytics.
+
+    Fields:
+    - `hours` (IntegerField): Number of hours of the hourly series (default: 24, at most a week).
+    - `days` (IntegerField): Number of days of the daily series and of the ranking (default: 30, at most a year).
+    - `top` (IntegerField): Number of vouchers in the ranking (default: 10).
+    - `voucher` (IntegerField): ID of a voucher to restrict the series to (optional).
+    """
+    hours = serializers.IntegerField(min_value=1, max_value=168, default=24)
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+    top = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    voucher = serializers.IntegerField(min_value=1, required=False)
+
+
+class RedemptionHistoryQuerySerializer(serializers.Serializer):
+    """
+    Serializer validating the query parameters of the redemption history: exactly one of `user` and `voucher`.
+
+    Fields:
+    - `user` (IntegerField): ID of the user whose redemptions are listed.
+    - `voucher` (IntegerField): ID of the voucher whose redemptions are listed.
+    - `cursor` (CharField): Cursor of the page (first page if omitted).
+    - `page_size` (IntegerField): Number of redemptions per page (default: the history page size).
+    """
+    user = serializers.IntegerField(min_value=1, required=False)
+    voucher = serializers.IntegerField(min_value=1, required=False)
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=500, required=False)
+
+    def validate(self, attrs):
+        if ('user' in attrs) == ('voucher' in attrs):
+            raise serializers.ValidationError('Expected either a user or a voucher.')
+        return attrs
+
+
+class RedemptionHistorySerializer(serializers.Serializer):
+    """
+    Serializer of the live and archived redemptions of the redemption history.
+
+    Fields:
+    - `id` (IntegerField): ID of the redemption (kept by the archival).
+    - `user` (IntegerField): ID of the user who redeemed the voucher.
+    - `voucher` (IntegerField): ID of the redeemed voucher.
+    - `code` (CharField): Code of the redeemed voucher.
+    - `redeemed_at` (DateTimeField): Date of the redemption.
+    - `archived` (BooleanField): Whether the redemption was archived.
+    """
+    id = serializers.IntegerField()
+    user = serializers.IntegerField(source='user_id')
+    voucher = serializers.IntegerField(source='voucher_id')
+    code = serializers.CharField(source='voucher.code')
+    redeemed_at = serializers.DateTimeField()
+    archived = serializers.SerializerMethodField()
+
+    def get_archived(self, redemption):
+        return isinstance(redemption, ArchivedVoucherRedemption)
+
+
+class RedemptionRequestSerializer(serializers.Serializer):
+    """
+    Serializer validating the body of a redemption request.
+
+    Fields:
+    - `code` (CharField): Code of the voucher to redeem (case-insensitive).
+    """
+    code = serializers.CharField(max_length=Voucher._meta.get_field('code').max_length)
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer producing the representation of a ModelSerializer from `values()` rows, without
+    instantiating model objects or running the per-field attribute lookups of `ModelSerializer`.
+
+    The converters are the `to_representation` of the serializer fields, computed once; fields whose
+    representation of a database value is the value itself (booleans, strings and integers) are skipped,
+    and ISO 8601 datetime fields resolve their timezone once instead of for every value.
+
+    Attributes:
+    - `identity_field_classes` (tuple): Serializer field classes that represent database values unchanged.
+    """
+    identity_field_classes = (serializers.BooleanField, serializers.CharField, serializers.IntegerField)
+
+    def __init__(self, serializer, extra_field_names=()):
+        """
+        Parameters:
+        - `serializer` (ModelSerializer): Serializer whose representation is produced.
+        - `extra_field_names` (iterable): Model fields to also select in `values()` rows (e.g. for pagination),
+          which are removed from the representation.
+        """
+        self.field_names = [name for name, field in serializer.fields.items() if not field.write_only]
+        self.extra_field_names = [name for name in extra_field_names if name not in self.field_names]
+        self.converters = [
+            (name, self.get_converter(serializer.fields[name]))
+            for name in self.field_names
+            if not isinstance(serializer.fields[name], self.identity_field_classes)
+        ]
+
+    def get_converter(self, field):
+        """
+        Returns the function converting the database values of a serializer field into their representation.
+        """
+        if not isinstance(field, serializers.DateTimeField):
+            return field.to_representation
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return field.to_representation
+
+        def convert_datetime(value):
+            if isinstance(value, str) or timezone.is_naive(value):
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+
+        return convert_datetime
+
+    @staticmethod
+    def supports(serializer):
+        """
+        Checks whether every readable field of a ModelSerializer is a model column of the same name.
+
+        Parameters:
+        - `serializer` (ModelSerializer): The serializer to check.
+
+        Returns:
+        - bool: True if the serializer output can be built from `values()` rows.
+        """
+        model_field_names = {field.attname for field in serializer.Meta.model._meta.concrete_fields}
+        return all(
+            field.source == name and name in model_field_names
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        )
+
+    def to_representation(self, row):
+        """
+        Converts a `values()` row (a dict with the `field_names` then `extra_field_names` keys) into its representation.
+        """
+        for name, convert in self.converters:
+            value = row[name]
+            if value is not None:
+                row[name] = convert(value)
+        for name in self.extra_field_names:
+            del row[name]
+        return row
+
+    def get_values_field_names(self):
+        """
+        Returns the fields to select in the `values()` rows.
+        """
+        return self.field_names + self.extra_field_names
@@ -0,0 +1,352 @@
+import secrets
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+from rest_framework.validators import UniqueValidator
+from voucher_management.cache import voucher_cache
+from voucher_management.code_filter import voucher_code_filter
+from voucher_management.services import VoucherManagementService
+from voucher_management.signals import suppress_voucher_signals
+from voucher_management.versions import voucher_versions
+from voucher_system.db_retry import database_lock_retry
+from .authentication import api_token_cache
+from .models import ApiToken, Voucher
+from .serializers import VoucherSerializer
+
+
+class VoucherBulkService:
+    """
+    Service class creating, partially updating and deleting vouchers in bulk.
+
+    Items are processed in chunks of `chunk_size`, validated with a single `VoucherSerializer` instance
+    (checking the uniqueness of the codes once per chunk) and written in one transaction per chunk, with
+    `bulk_create`, one `executemany` per set of updated fields, or a single delete. The result of every item is reported in input order; invalid items are skipped without failing
+    their chunk, while a database error rolls back (and fails) the whole chunk.
+
+    Updated and deleted vouchers are identified by their `id` or, without an `id`, by their `code`.
+
+    Attributes:
+    - `CREATED`, `UPDATED`, `DELETED`: Statuses of the items that were written.
+    - `INVALID`: Status of the items rejected by validation (or identifying a voucher twice in a chunk).
+    - `NOT_FOUND`: Status of the items identifying no voucher.
+    - `FAILED`: Status of the items of a chunk rolled back by a database error.
+    - `chunk_size` (int): Number of items written per transaction (below the query parameter limit of SQLite).
+    - `voucher_management_service` (VoucherManagementService): Service writing the voucher updates.
+    """
+
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    INVALID = 'invalid'
+    NOT_FOUND = 'not_found'
+    FAILED = 'failed'
+
+    chunk_size = 500
+    voucher_management_service = VoucherManagementService()
+
+    def get_chunks(self, items):
+        for start in range(0, len(items), self.chunk_size):
+            yield start, items[start:start + self.chunk_size]
+
+    def validate(self, serializer, item):
+        """
+        Validates one item with a (reused) serializer.
+
+        Returns:
+        - tuple: The validated data (None if invalid) and the errors (None if valid).
+        """
+        if not isinstance(item, dict):
+            return None, {'non_field_errors': ['Expected a voucher object.']}
+        try:
+            return serializer.run_validation(item), None
+        except ValidationError as e:
+            return None, as_serializer_error(e)
+
+    def get_identifier_error(self, item):
+        """
+        Returns the errors of an item that does not identify a voucher by an integer `id` or a string `code`, else None.
+        """
+        if not isinstance(item, dict):
+            return {'non_field_errors': ['Expected a voucher object.']}
+        if 'id' in item:
+            if isinstance(item['id'], int) and not isinstance(item['id'], bool):
+                return None
+            return {'id': ['A valid integer is required.']}
+        if isinstance(item.get('code'), str):
+            return None
+        return {'non_field_errors': ['Expected the id or the code of a voucher.']}
+
+    def get_vouchers_by_identifier(self, items):
+        """
+        Loads the vouchers identified by the `id` (or, without an `id`, the `code`) of valid items, in two queries.
+
+        Parameters:
+        - `items` (list): Items without identifier errors.
+
+        Returns:
+        - list: The voucher of each item (None if it identifies no voucher).
+        """
+        voucher_ids = [item['id'] for item in items if 'id' in item]
+        voucher_codes = [Voucher.normalize_code(item['code']) for item in items if 'id' not in item]
+        vouchers_by_id = Voucher.objects.in_bulk(voucher_ids) if voucher_ids else {}
+        vouchers_by_code = Voucher.objects.in_bulk(voucher_codes, field_name='code') if voucher_codes else {}
+        return [
+            vouchers_by_id.get(item['id']) if 'id' in item
+            else vouchers_by_code.get(Voucher.normalize_code(item['code']))
+            for item in items
+        ]
+
+    def find_vouchers(self, results, start, chunk):
+        """
+        Loads the vouchers identified by the items of a chunk, recording the results of the items identifying none.
+
+        Returns:
+        - list: Tuples of the index in the chunk, the item and the voucher of each item identifying a voucher.
+        """
+        identified_items = []
+        for index, item in enumerate(chunk):
+            errors = self.get_identifier_error(item)
+            if errors:
+                results[start + index] = {'status': self.INVALID, 'errors': errors}
+            else:
+                identified_items.append((index, item))
+        vouchers = self.get_vouchers_by_identifier([item for index, item in identified_items])
+        found = []
+        for (index, item), voucher in zip(identified_items, vouchers):
+            if voucher is None:
+                results[start + index] = {
+                    'status': self.NOT_FOUND,
+                    'errors': {'non_field_errors': ['No voucher with this id or code.']},
+                }
+            else:
+                found.append((index, item, voucher))
+        return found
+
+    def write_chunk(self, results, start, write, written_items):
+        """
+        Runs the writes of a chunk in one transaction, retried on lock contention (see `DatabaseLockRetry`),
+        marking its written items as failed if it is rolled back.
+
+        Returns:
+        - bool: Whether the transaction was committed.
+        """
+        def atomic_write():
+            with transaction.atomic():
+                write()
+                voucher_versions.bump_catalog()
+
+        try:
+            database_lock_retry.run(atomic_write, operation='bulk_write')
+        except DatabaseError as e:
+            for index in written_items:
+                results[start + index] = {'status': self.FAILED, 'errors': {'non_field_errors': [str(e)]}}
+            return False
+        return True
+
+    def get_serializer(self, partial=False):
+        """
+        Returns a VoucherSerializer validating items without the per-item query of the unique code validator,
+        along with the message of that validator. Codes are checked once per chunk instead (see `get_code_owners`).
+        """
+        serializer = VoucherSerializer(partial=partial)
+        code_field = serializer.fields['code']
+        unique_validators = [validator for validator in code_field.validators if isinstance(validator, UniqueValidator)]
+        code_field.validators = [validator for validator in code_field.validators if validator not in unique_validators]
+        return serializer, unique_validators[0].message
+
+    def get_code_owners(self, codes):
+        """
+        Returns the IDs of the vouchers using the given normalized codes, keyed by code.
+        """
+        return dict(Voucher.objects.filter(code__in=list(codes)).values_list('code', 'id')) if codes else {}
+
+    def create_vouchers(self, items):
+        """
+        Creates vouchers from a list of voucher representations.
+
+        Parameters:
+        - `items` (list): Voucher dicts, as accepted by `VoucherSerializer`.
+
+        Returns:
+        - list: The result of each item: its `status`, and the `id` of the created voucher or the `errors`.
+        """
+        results = [None] * len(items)
+        serializer, unique_code_message = self.get_serializer()
+        for start, chunk in self.get_chunks(items):
+            validated_items = []
+            for index, item in enumerate(chunk):
+                validated_data, errors = self.validate(serializer, item)
+                if errors:
+                    results[start + index] = {'status': self.INVALID, 'errors': errors}
+                else:
+                    validated_items.append((index, validated_data))
+            code_owners = self.get_code_owners({validated_data['code'] for index, validated_data in validated_items})
+            vouchers, written_items = [], []
+            for index, validated_data in validated_items:
+                if validated_data['code'] in code_owners:
+                    results[start + index] = {'status': self.INVALID, 'errors': {'code': [unique_code_message]}}
+                    continue
+                code_owners[validated_data['code']] = None
+                vouchers.append(Voucher(**validated_data))
+                written_items.append(index)
+            if not vouchers:
+                continue
+
+            def write():
+                for voucher in vouchers:
+                    # IDs set by an attempt rolled back on lock contention.
+                    voucher.id = None
+                Voucher.objects.bulk_create(vouchers)
+
+            if self.write_chunk(results, start, write, written_items):
+                for index, voucher in zip(written_items, vouchers):
+                    results[start + index] = {'status': self.CREATED, 'id': voucher.id}
+                    voucher_code_filter.add(voucher.code)
+        return results
+
+    def update_vouchers(self, items):
+        """
+        Partially updates vouchers, each identified by the `id` (or, without an `id`, the `code`) of its item.
+
+        Vouchers updating the same set of fields are written together (see `VoucherManagementService.update_voucher_fields`),
+        so the fields an item does not update are never written back, and their versions are incremented in the database.
+
+        Parameters:
+        - `items` (list): Dicts with the `id` or `code` of a voucher and the fields to update.
+
+        Returns:
+        - list: The result of each item: its `status`, and the `id` of the updated voucher or the `errors`.
+        """
+        results = [None] * len(items)
+        serializer, unique_code_message = self.get_serializer(partial=True)
+        for start, chunk in self.get_chunks(items):
+            validated_items, voucher_ids = [], set()
+            for index, item, voucher in self.find_vouchers(results, start, chunk):
+                if voucher.id in voucher_ids:
+                    results[start + index] = {
+                        'status': self.INVALID,
+                        'errors': {'non_field_errors': ['Duplicate voucher in this chunk of updates.']},
+                    }
+                    continue
+                serializer.instance = voucher
+                validated_data, errors = self.validate(serializer, {k: v for k, v in item.items() if k != 'id'})
+                if errors:
+                    results[start + index] = {'status': self.INVALID, 'errors': errors}
+                    continue
+                voucher_ids.add(voucher.id)
+                validated_items.append((index, voucher, validated_data))
+            code_owners = self.get_code_owners({
+                validated_data['code'] for index, voucher, validated_data in validated_items if 'code' in validated_data
+            })
+            vouchers_by_fields, written_items, written_voucher_ids = {}, [], []
+            for index, voucher, validated_data in validated_items:
+                code = validated_data.get('code')
+                if code is not None and code_owners.setdefault(code, voucher.id) != voucher.id:
+                    results[start + index] = {'status': self.INVALID, 'errors': {'code': [unique_code_message]}}
+                    continue
+                for field_name, value in validated_data.items():
+                    setattr(voucher, field_name, value)
+                vouchers_by_fields.setdefault(tuple(sorted(validated_data)), []).append(voucher)
+                written_items.append(index)
+                written_voucher_ids.append(voucher.id)
+            if not written_items:
+                continue
+
+            def write():
+                for field_names, vouchers in vouchers_by_fields.items():
+                    if field_names:
+                        self.voucher_management_service.update_voucher_fields(vouchers, field_names)
+                transaction.on_commit(
+                    lambda voucher_ids=written_voucher_ids: voucher_cache.invalidate_many(voucher_ids)
+                )
+
+            if self.write_chunk(results, start, write, written_items):
+                for index, voucher_id in zip(written_items, written_voucher_ids):
+                    results[start + index] = {'status': self.UPDATED, 'id': voucher_id}
+                for vouchers in vouchers_by_fields.values():
+                    for voucher in vouchers:
+                        voucher_code_filter.add(voucher.code)
+        return results
+
+    def delete_vouchers(self, items):
+        """
+        Deletes vouchers, each identified by the `id` (or, without an `id`, the `code`) of its item,
+        along with their redemptions.
+
+        The per-voucher signal handlers are suppressed: each chunk bumps the catalog version once, and
+        invalidates the cached vouchers and marks their codes stale in the code filter once committed.
+
+        Parameters:
+        - `items` (list): Dicts with the `id` or `code` of a voucher.
+
+        Returns:
+        - list: The result of each item: its `status`, and the `id` of the deleted voucher or the `errors`.
+        """
+        results = [None] * len(items)
+        for start, chunk in self.get_chunks(items):
+            written_items, voucher_ids, voucher_codes = [], [], []
+            for index, item, voucher in self.find_vouchers(results, start, chunk):
+                written_items.append(index)
+                voucher_ids.append(voucher.id)
+                voucher_codes.append(voucher.code)
+            if not written_items:
+                continue
+
+            def write():
+                with suppress_voucher_signals():
+                    Voucher.objects.filter(id__in=voucher_ids).delete()
+                transaction.on_commit(lambda voucher_ids=voucher_ids: voucher_cache.invalidate_many(voucher_ids))
+
+            if self.write_chunk(results, start, write, written_items):
+                for index, voucher_id in zip(written_items, voucher_ids):
+                    results[start + index] = {'status': self.DELETED, 'id': voucher_id}
+                for voucher_code in voucher_codes:
+                    voucher_code_filter.discard(voucher_code)
+        return results
+
+
+class ApiTokenService:
+    """
+    Service class creating and revoking the API tokens of `CachedTokenAuthentication`.
+
+    Attributes:
+    - `key_bytes` (int): Number of random bytes of a token.
+    """
+
+    key_bytes = 32
+
+    def create_token(self, user, name=''):
+        """
+        Creates an API token for a user.
+
+        Parameters:
+        - `user` (User): The user the token authenticates.
+        - `name` (str): Name of the token, e.g. the terminal using it.
+
+        Returns:
+        - tuple: The ApiToken, and the token itself, which is not stored and can not be shown again.
+        """
+        key = secrets.token_urlsafe(self.key_bytes)
+        token = ApiToken.objects.create(
+            user=user,
+            name=name,
+            key_prefix=key[:ApiToken._meta.get_field('key_prefix').max_length],
+            key_hash=ApiToken.hash_key(key),
+        )
+        return token, key
+
+    def revoke_tokens(self, tokens):
+        """
+        Revokes API tokens, invalidating their cached resolutions once revoked.
+
+        Parameters:
+        - `tokens` (QuerySet): The ApiToken objects to revoke.
+
+        Returns:
+        - int: The number of tokens revoked.
+        """
+        with transaction.atomic():
+            key_hashes = list(tokens.filter(is_active=True).values_list('key_hash', flat=True))
+            revoked = ApiToken.objects.filter(key_hash__in=key_hashes).update(is_active=False)
+            transaction.on_commit(lambda: api_token_cache.invalidate_many(key_hashes))
+        return revoked
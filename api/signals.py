@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import api_token_cache
+from .models import ApiToken
+
+
+@receiver(post_save, sender=ApiToken)
+@receiver(post_delete, sender=ApiToken)
+def invalidate_api_token(sender, instance, **kwargs):
+    """
+    Invalidates the cached resolution of a token once the transaction saving or deleting it commits.
+    """
+    key_hash = instance.key_hash
+    transaction.on_commit(lambda: api_token_cache.invalidate(key_hash))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_api_tokens(sender, instance, **kwargs):
+    """
+    Invalidates the cached resolutions of the tokens of a user once the transaction saving or deleting it commits,
+    so changes to the user (e.g. deactivation or permissions) apply to its next API request.
+    """
+    user_id = instance.pk
+    transaction.on_commit(lambda: api_token_cache.invalidate_user(user_id))
@@ -1,3 +1,590 @@
-from django.test import TestCase
+import datetime
+import json
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from voucher_management.cache import voucher_cache
+from voucher_management.models import VoucherCatalog
+from voucher_redemption.models import VoucherRedemption
+from voucher_redemption.services import VoucherRedemptionService
+from voucher_management.versions import voucher_versions
+from .admin import VoucherApiAdmin
+from .models import ApiToken, Voucher, VoucherApi
+from .pagination import IdCursorPagination
+from .renderers import StreamingJSONRenderer
+from .serializers import ValuesSerializer
+from .views import VoucherAPIBulkView, VoucherAPIListView
+from .services import ApiTokenService, VoucherBulkService
+
+
+class VoucherApiQueryCountTests(TestCase):
+    """
+    Tests that listing VoucherApi objects costs a constant number of queries, whatever the page size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        vouchers = Voucher.objects.bulk_create(Voucher(code=f'CODE{i}') for i in range(30))
+        VoucherApi.objects.bulk_create(VoucherApi(voucher=voucher, description=f'API {i}') for i, voucher in enumerate(vouchers))
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def count_queries(self, url, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        url = reverse('api_voucher_api_list')
+        small_page_queries, response = self.count_queries(f'{url}?page_size=2')
+        large_page_queries, response = self.count_queries(f'{url}?page_size=30')
+        self.assertEqual(small_page_queries, large_page_queries)
+        self.assertEqual(len(response.json()['results']), 30)
+        self.assertEqual(response.json()['results'][0]['voucher']['code'], 'CODE0')
+
+    def test_browsable_list_query_count_does_not_depend_on_page_size(self):
+        url = reverse('api_voucher_api_list')
+        small_page_queries, response = self.count_queries(f'{url}?page_size=2', HTTP_ACCEPT='text/html')
+        large_page_queries, response = self.count_queries(f'{url}?page_size=30', HTTP_ACCEPT='text/html')
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_admin_changelist_query_count_does_not_depend_on_page_size(self):
+        self.client.force_login(self.admin_user)
+        url = reverse('admin:api_voucherapi_changelist')
+        with mock.patch.object(VoucherApiAdmin, 'list_per_page', 2):
+            small_page_queries, response = self.count_queries(url)
+        large_page_queries, response = self.count_queries(url)
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_create_nests_voucher(self):
+        voucher = Voucher.objects.create(code='NEW')
+        response = self.client.post(
+            reverse('api_voucher_api_list'),
+            {'voucher_id': voucher.id, 'description': 'New API'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['voucher']['code'], 'NEW')
+        response = self.client.post(
+            reverse('api_voucher_api_list'),
+            {'voucher_id': voucher.id, 'description': 'Duplicate'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class VoucherCursorPaginationTests(TestCase):
+    """
+    Tests that the voucher API pages are positioned by ID cursors.
+    """
+
+    def setUp(self):
+        cache.clear()
+        Voucher.objects.bulk_create(Voucher(code=f'PAGE{i}') for i in range(5))
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def get_codes(self, page):
+        return [voucher['code'] for voucher in page['results']]
+
+    def test_pages_follow_the_id_order(self):
+        page = self.get_page(f'{reverse("api_voucher_list")}?page_size=2')
+        self.assertIsNone(page['previous'])
+        pages = [self.get_codes(page)]
+        while page['next']:
+            page = self.get_page(page['next'])
+            pages.append(self.get_codes(page))
+        self.assertEqual(pages, [['PAGE0', 'PAGE1'], ['PAGE2', 'PAGE3'], ['PAGE4']])
+        self.assertEqual(self.get_codes(self.get_page(page['previous'])), ['PAGE2', 'PAGE3'])
+
+    def test_full_last_page_has_no_next_link(self):
+        page = self.get_page(f'{reverse("api_voucher_list")}?page_size=5')
+        self.assertEqual(len(page['results']), 5)
+        self.assertIsNone(page['next'])
+
+    def test_deleted_vouchers_do_not_shift_pages(self):
+        page = self.get_page(f'{reverse("api_voucher_list")}?page_size=2')
+        Voucher.objects.filter(code__in=['PAGE0', 'PAGE2']).delete()
+        self.assertEqual(self.get_codes(self.get_page(page['next'])), ['PAGE3', 'PAGE4'])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(IdCursorPagination, 'max_page_size', 3):
+            page = self.get_page(f'{reverse("api_voucher_list")}?page_size=100')
+        self.assertEqual(self.get_codes(page), ['PAGE0', 'PAGE1', 'PAGE2'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(f'{reverse("api_voucher_list")}?cursor=invalid').status_code, 404)
+
+
+class SparseFieldsetTests(TestCase):
+    """
+    Tests that `?fields=` limits the fields of read responses and the columns their queries select.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.voucher = Voucher.objects.create(code='SPARSE', discount_percentage=10, description='Sparse voucher')
+
+    def test_list_selects_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_voucher_list'), {'fields': 'code, is_active,code'})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(b''.join(response.streaming_content))['results']
+        self.assertEqual(results, [{'code': 'SPARSE', 'is_active': True}])
+        voucher_queries = [query['sql'] for query in queries if 'FROM "voucher_management_voucher"' in query['sql']]
+        self.assertTrue(voucher_queries)
+        self.assertFalse([sql for sql in voucher_queries if 'description' in sql])
+
+    def test_detail_returns_requested_fields(self):
+        url = reverse('api_voucher_detail', args=[self.voucher.id])
+        response = self.client.get(url, {'fields': 'code,discount_percentage'})
+        self.assertEqual(response.json(), {'code': 'SPARSE', 'discount_percentage': 10})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('api_voucher_list'), {'fields': 'code,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown fields: secret.']})
+
+    def test_writes_return_every_field(self):
+        response = self.client.patch(
+            f'{reverse("api_voucher_detail", args=[self.voucher.id])}?fields=code',
+            {'discount_percentage': 20},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['discount_percentage'], 20)
+        self.assertEqual(response.json()['description'], 'Sparse voucher')
+
+
+class StreamedVoucherListingTests(TestCase):
+    """
+    Tests that voucher listings rendered from `values()` rows match the regular listings byte for byte.
+    """
+
+    def setUp(self):
+        cache.clear()
+        expiration_date = timezone.make_aware(datetime.datetime(2030, 1, 2, 3, 4, 5, 678000), datetime.timezone.utc)
+        Voucher.objects.bulk_create([
+            Voucher(code='STREAM1', description='Line\u2028separator \u00e9', expiration_date=expiration_date),
+            Voucher(code='STREAM2', redemption_type=Voucher.X_TIMES_REDEMPTION, redemption_limit=3),
+            Voucher(code='STREAM3', is_active=False),
+        ])
+
+    def get_listing(self, **params):
+        response = self.client.get(reverse('api_voucher_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_streamed_listing_matches_regular_listing(self):
+        for params in ({}, {'page_size': 2}, {'fields': 'expiration_date,code'}):
+            with self.subTest(params=params):
+                streamed = self.get_listing(**params)
+                with mock.patch.object(ValuesSerializer, 'supports', return_value=False):
+                    self.assertEqual(streamed, self.get_listing(**params))
+
+    def test_unpaginated_listing_is_streamed_as_a_list(self):
+        with mock.patch.object(VoucherAPIListView, 'pagination_class', None):
+            listing = json.loads(self.get_listing())
+        self.assertEqual([voucher['code'] for voucher in listing], ['STREAM1', 'STREAM2', 'STREAM3'])
+
+    def test_indented_listing_is_not_streamed(self):
+        response = self.client.get(reverse('api_voucher_list'), HTTP_ACCEPT='application/json; indent=2')
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_chunks_concatenate_to_rendered_data(self):
+        renderer = StreamingJSONRenderer()
+        items = [{'index': index, 'text': '\u2029'} for index in range(5)]
+        envelope = {'next': None, 'results': []}
+        for chunk_size in (1, 2, 5, 10):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    b''.join(renderer.iter_render_list(items, envelope, chunk_size=chunk_size)),
+                    renderer.render({'next': None, 'results': items}),
+                )
+                self.assertEqual(b''.join(renderer.iter_render_list(items, chunk_size=chunk_size)), renderer.render(items))
+        self.assertEqual(b''.join(renderer.iter_render_list([], envelope)), renderer.render(envelope))
+
+
+class ConditionalVoucherDetailTests(TestCase):
+    """
+    Tests that conditional GETs of a voucher are answered from its version in the database.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.voucher = Voucher.objects.create(code='ETAG', discount_percentage=10)
+        self.url = reverse('api_voucher_detail', args=[self.voucher.id])
+
+    def test_unchanged_voucher_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_write_of_another_process_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        # Written without the signals, as by another process whose cache invalidations are not seen here.
+        Voucher.objects.filter(pk=self.voucher.pk).update(discount_percentage=50, version=F('version') + 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['discount_percentage'], 50)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_missing_voucher(self):
+        self.assertEqual(self.client.get(reverse('api_voucher_detail', args=[0])).status_code, 404)
+
+
+class ConditionalVoucherListTests(TestCase):
+    """
+    Tests that conditional GETs of the voucher list follow the redemptions, which do not write the catalog row.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.voucher = Voucher.objects.create(code='LISTED', discount_percentage=10)
+        self.user = User.objects.create_user('lister')
+
+    def test_redemption_changes_etag_without_bumping_catalog(self):
+        etag = self.client.get(reverse('api_voucher_list'))['ETag']
+        self.assertEqual(self.client.get(reverse('api_voucher_list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        catalog_version = voucher_versions.get_catalog_version()[0]
+        self.assertEqual(VoucherRedemptionService().redeem(self.user, self.voucher), VoucherRedemptionService.REDEEMED)
+        self.assertEqual(voucher_versions.get_catalog_version()[0], catalog_version)
+        response = self.client.get(reverse('api_voucher_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['results'][0]['redemption_count'], 1)
+
+
+class VoucherBulkAPITests(TestCase):
+    """
+    Tests the results of the bulk create, update and delete endpoints, item by item and chunk by chunk.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('bulk', 'bulk@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin_user)
+        self.voucher = Voucher.objects.create(code='BULK', discount_percentage=10, description='Bulk voucher')
+
+    def send(self, method, items):
+        response = getattr(self.client, method)(reverse('api_voucher_bulk'), items, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get_statuses(self, response):
+        return [result['status'] for result in response['results']]
+
+    def test_create(self):
+        response = self.send('post', [
+            {'code': 'new1', 'discount_percentage': 5},
+            {'code': 'bulk'},
+            {'code': 'NEW1'},
+            {'code': 'NEW2', 'discount_percentage': -1},
+            'NEW3',
+        ])
+        self.assertEqual(self.get_statuses(response), ['created', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertEqual((response['created'], response['invalid']), (1, 4))
+        self.assertEqual(list(response['results'][1]['errors']), ['code'])
+        self.assertEqual(Voucher.objects.get(pk=response['results'][0]['id']).code, 'NEW1')
+
+    def test_update(self):
+        other = Voucher.objects.create(code='OTHER')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.send('patch', [
+                {'id': self.voucher.id, 'discount_percentage': 20},
+                {'code': 'other', 'is_active': False},
+                {'code': 'BULK', 'description': 'Twice'},
+                {'id': other.id, 'code': 'BULK'},
+                {'id': 0, 'is_active': False},
+                {'id': '1'},
+            ])
+        self.assertEqual(
+            self.get_statuses(response), ['updated', 'updated', 'invalid', 'invalid', 'not_found', 'invalid'],
+        )
+        self.voucher.refresh_from_db()
+        self.assertEqual((self.voucher.discount_percentage, self.voucher.description), (20, 'Bulk voucher'))
+        self.assertEqual(self.voucher.version, 2)
+        self.assertFalse(Voucher.objects.get(pk=other.pk).is_active)
+        response = self.client.get(reverse('api_voucher_detail', args=[self.voucher.id]))
+        self.assertEqual(response.json()['discount_percentage'], 20)
+
+    def test_delete(self):
+        other = Voucher.objects.create(code='OTHER')
+        response = self.send('delete', [{'id': self.voucher.id}, {'code': 'other'}, {'code': 'MISSING'}, {}])
+        self.assertEqual(self.get_statuses(response), ['deleted', 'deleted', 'not_found', 'invalid'])
+        self.assertFalse(Voucher.objects.filter(pk__in=[self.voucher.pk, other.pk]).exists())
+
+    def test_delete_side_effects_run_once_per_chunk(self):
+        vouchers = Voucher.objects.bulk_create([Voucher(code=f'CHUNK{i}') for i in range(3)])
+        voucher_cache.get(vouchers[0].id)
+        with (
+            mock.patch.object(VoucherBulkService, 'chunk_size', 2),
+            mock.patch.object(voucher_versions, 'bump_catalog', wraps=voucher_versions.bump_catalog) as bump_catalog,
+            mock.patch.object(voucher_cache, 'invalidate', wraps=voucher_cache.invalidate) as invalidate,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.send('delete', [{'id': voucher.id} for voucher in vouchers])
+        self.assertEqual(self.get_statuses(response), ['deleted'] * 3)
+        self.assertEqual(bump_catalog.call_count, 2)
+        invalidate.assert_not_called()
+        self.assertIsNone(voucher_cache.get(vouchers[0].id))
+
+    def test_failed_chunk_is_rolled_back_alone(self):
+        bulk_create = Voucher.objects.bulk_create
+        calls = []
+
+        def fail_first_chunk(vouchers, *args, **kwargs):
+            calls.append(len(vouchers))
+            if len(calls) == 1:
+                raise IntegrityError('Chunk failed')
+            return bulk_create(vouchers, *args, **kwargs)
+
+        with mock.patch.object(VoucherBulkService, 'chunk_size', 2), \
+                mock.patch.object(Voucher.objects, 'bulk_create', side_effect=fail_first_chunk):
+            response = self.send('post', [{'code': f'CHUNK{i}'} for i in range(3)])
+        self.assertEqual(self.get_statuses(response), ['failed', 'failed', 'created'])
+        self.assertEqual(calls, [2, 1])
+        self.assertEqual(list(Voucher.objects.filter(code__startswith='CHUNK').values_list('code', flat=True)), ['CHUNK2'])
+
+    def test_request_must_be_a_bounded_list(self):
+        self.assertEqual(
+            self.client.post(reverse('api_voucher_bulk'), {'code': 'X'}, content_type='application/json').status_code,
+            400,
+        )
+        with mock.patch.object(VoucherAPIBulkView, 'max_items', 1):
+            response = self.client.delete(
+                reverse('api_voucher_bulk'), [{'id': 1}, {'id': 2}], content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.post(reverse('api_voucher_bulk'), [], content_type='application/json').status_code, 401)
+
+
+class VoucherImportAPITests(TestCase):
+    """
+    Tests the admin-only voucher import upload.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('importer', 'importer@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+
+    def upload(self, name, content, **data):
+        return self.client.post(reverse('api_voucher_import'), {'file': SimpleUploadedFile(name, content), **data})
+
+    def test_upload_imports_rows_and_reports_rejections(self):
+        self.assertEqual(self.upload('vouchers.csv', b'code,discount_percentage,redemption_type\n').status_code, 401)
+        self.client.force_login(self.admin_user)
+        response = self.upload(
+            'vouchers.txt',
+            b'\xef\xbb\xbfcode,discount_percentage,redemption_type\nUPLOAD1,10,single\nUPLOAD2,,single\n',
+            format='csv',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['rejected_rows'][0]['line'], 3)
+        self.assertEqual(list(response.json()['rejected_rows'][0]['errors']), ['discount_percentage'])
+        self.assertTrue(Voucher.objects.filter(code='UPLOAD1').exists())
+        self.assertEqual(self.upload('vouchers.xml', b'<vouchers/>').status_code, 400)
+
+
+@skipUnless('replica' in settings.DATABASES, 'No read replica database (see voucher_system.settings_test).')
+@override_settings(DATABASE_REPLICA_ALIAS='replica')
+class ReadReplicaRoutingTests(TransactionTestCase):
+    """
+    Tests that the reads of read-only views go to the read replica, and that clients that wrote read from the primary.
+
+    Reads in a transaction always go to the primary, so the tests do not run in one (as `TestCase` would).
+    """
+
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def setUp(self):
+        for alias, code in (('default', 'PRIMARY'), ('replica', 'REPLICA')):
+            VoucherCatalog.objects.using(alias).get_or_create(id=voucher_versions.catalog_id)
+            Voucher.objects.using(alias).bulk_create([Voucher(code=code)])
+
+    def get_codes(self):
+        response = self.client.get(reverse('api_voucher_list'))
+        self.assertEqual(response.status_code, 200)
+        return [voucher['code'] for voucher in json.loads(b''.join(response.streaming_content))['results']]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.get_codes(), ['REPLICA'])
+
+    def test_reads_go_to_primary_without_replica(self):
+        with override_settings(DATABASE_REPLICA_ALIAS=None):
+            self.assertEqual(self.get_codes(), ['PRIMARY'])
+
+    def test_client_reads_its_writes_from_primary(self):
+        response = self.client.post(reverse('api_voucher_list'), {'code': 'NEW'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('db_primary_until', response.cookies)
+        self.assertEqual(self.get_codes(), ['PRIMARY', 'NEW'])
+        self.client.cookies['db_primary_until'] = '0'
+        self.assertEqual(self.get_codes(), ['REPLICA'])
+
+
+class IdempotentCreateTests(TestCase):
+    """
+    Tests that voucher creations sent with an Idempotency-Key header run once.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def create(self, code, key):
+        return self.client.post(
+            reverse('api_voucher_list'),
+            {'code': code},
+            content_type='application/json',
+            headers={'Idempotency-Key': key},
+        )
+
+    def test_retry_replays_first_response(self):
+        response = self.create('IDEMPOTENT', 'create-1')
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.create('IDEMPOTENT', 'create-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse([query for query in queries if 'voucher' in query['sql'] and 'api_idempotencykey' not in query['sql']])
+        self.assertEqual(Voucher.objects.filter(code='IDEMPOTENT').count(), 1)
+
+    def test_key_outlives_other_cached_data(self):
+        self.assertEqual(self.create('SHARED', 'create-4').status_code, 201)
+        cache.clear()
+        self.assertEqual(self.create('SHARED', 'create-4')['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_with_another_payload(self):
+        self.assertEqual(self.create('FIRST', 'create-2').status_code, 201)
+        self.assertEqual(self.create('SECOND', 'create-2').status_code, 422)
+        self.assertFalse(Voucher.objects.filter(code='SECOND').exists())
+
+    def test_failed_attempt_is_not_stored(self):
+        Voucher.objects.create(code='TAKEN')
+        self.assertEqual(self.create('TAKEN', 'create-3').status_code, 400)
+        Voucher.objects.filter(code='TAKEN').delete()
+        self.assertEqual(self.create('TAKEN', 'create-3').status_code, 201)
+
+
+class RedemptionAPITests(TestCase):
+    """
+    Tests the outcomes of the JSON redemption API, and that retries with an Idempotency-Key are replayed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('terminal', password='password')
+        Voucher.objects.create(code='POS15', discount_percentage=15)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def redeem(self, code, **headers):
+        return self.client.post(reverse('api_redemptions'), {'code': code}, content_type='application/json', headers=headers)
+
+    def test_outcomes(self):
+        response = self.redeem('pos15')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'code': 'pos15', 'outcome': 'redeemed', 'discount_percentage': 15})
+        response = self.redeem('POS15')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'code': 'POS15', 'outcome': 'already_redeemed'})
+        self.assertEqual(self.redeem('UNKNOWN').status_code, 404)
+        self.assertEqual(self.redeem('').status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.redeem('POS15').status_code, 401)
+
+    def test_retry_replays_outcome(self):
+        self.assertEqual(self.redeem('POS15', **{'Idempotency-Key': 'pos-1'}).status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.redeem('POS15', **{'Idempotency-Key': 'pos-1'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['outcome'], 'redeemed')
+        self.assertFalse([query for query in queries if 'voucher' in query['sql'] and 'api_idempotencykey' not in query['sql']])
+        self.assertEqual(VoucherRedemption.objects.count(), 1)
+
+    def test_token_request_skips_session_work(self):
+        self.client.logout()
+        _, key = ApiTokenService().create_token(self.user, 'Till 2')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.redeem('POS15', Authorization=f'Token {key}')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+        self.assertFalse({'sessionid', 'csrftoken', 'messages'} & set(response.cookies))
+
+    def test_busy_outcome_is_not_stored(self):
+        with mock.patch.object(VoucherRedemptionService, 'create_voucher_redemption', return_value=VoucherRedemptionService.BUSY):
+            response = self.redeem('POS15', **{'Idempotency-Key': 'pos-2'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.redeem('POS15', **{'Idempotency-Key': 'pos-2'}).status_code, 201)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """
+    Tests that API tokens authenticate their user without auth queries once cached, and stop on revocation.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pos', password='password')
+        Voucher.objects.create(code='TOKEN5')
+
+    def setUp(self):
+        cache.clear()
+        self.token, self.key = ApiTokenService().create_token(self.user, 'Till 1')
+
+    def redeem(self, key):
+        return self.client.post(
+            reverse('api_redemptions'),
+            {'code': 'TOKEN5'},
+            content_type='application/json',
+            headers={'Authorization': f'Token {key}'},
+        )
+
+    def test_cached_token_costs_no_auth_query(self):
+        self.assertEqual(self.redeem(self.key).status_code, 201)
+        self.assertNotEqual(self.token.key_hash, self.key)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.redeem(self.key).status_code, 409)
+        auth_tables = ('api_apitoken', 'auth_user', 'django_session')
+        self.assertFalse([query for query in queries if any(table in query['sql'] for table in auth_tables)])
+
+    def test_invalid_and_revoked_tokens(self):
+        self.assertEqual(self.redeem('invalid').status_code, 401)
+        self.assertEqual(self.redeem(self.key).status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ApiTokenService().revoke_tokens(ApiToken.objects.filter(pk=self.token.pk)), 1)
+        self.assertEqual(self.redeem(self.key).status_code, 401)
+
+    def test_deactivated_user(self):
+        self.assertEqual(self.redeem(self.key).status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.redeem(self.key).status_code, 401)
 
-# Create your tests here.
@@ -1,8 +1,19 @@
 from django.urls import path, include
-from .views import VoucherAPIListView, VoucherAPIDetailView
+from .views import (
+    VoucherAPIListView, VoucherAPIDetailView, VoucherAPIImportView, VoucherAPIBulkView,
+    VoucherApiListView, VoucherApiDetailView, RedemptionAnalyticsAPIView, RedemptionHistoryAPIView,
+    RedemptionAPIView,
+)
 
 
 urlpatterns = [
     path('vouchers/', VoucherAPIListView.as_view(), name='api_voucher_list'),
     path('vouchers/<int:pk>/', VoucherAPIDetailView.as_view(), name='api_voucher_detail'),
+    path('vouchers/import/', VoucherAPIImportView.as_view(), name='api_voucher_import'),
+    path('vouchers/bulk/', VoucherAPIBulkView.as_view(), name='api_voucher_bulk'),
+    path('voucher-apis/', VoucherApiListView.as_view(), name='api_voucher_api_list'),
+    path('voucher-apis/<int:pk>/', VoucherApiDetailView.as_view(), name='api_voucher_api_detail'),
+    path('redemption-analytics/', RedemptionAnalyticsAPIView.as_view(), name='api_redemption_analytics'),
+    path('redemption-history/', RedemptionHistoryAPIView.as_view(), name='api_redemption_history'),
+    path('redemptions/', RedemptionAPIView.as_view(), name='api_redemptions'),
 ]
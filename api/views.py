@@ -1,51 +1,371 @@
-from rest_framework import generics
+import io
+import os
+from collections import Counter
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+from voucher_management.cache import voucher_cache
+from voucher_management.services import VoucherManagementService
+from voucher_management.versions import voucher_versions
+from voucher_redemption.rollups import redemption_rollups
+from voucher_redemption.services import VoucherRedemptionService
+from voucher_system.idempotency import idempotency_store
+from .mixins import ConditionalGetMixin, IdempotentCreateMixin, SparseFieldsetMixin, ValuesListMixin
+from .renderers import StreamingJSONRenderer
+from .services import VoucherBulkService
 from .models import Voucher, VoucherApi
-from .serializers import VoucherSerializer, VoucherApiSerializer
+from .serializers import (
+    RedemptionAnalyticsQuerySerializer, RedemptionHistoryQuerySerializer, RedemptionHistorySerializer,
+    RedemptionRequestSerializer,
+    VoucherSerializer, VoucherApiSerializer,
+)
 
 
-class VoucherAPIListView(generics.ListCreateAPIView):
+class VoucherAPIListView(
+    IdempotentCreateMixin, ConditionalGetMixin, SparseFieldsetMixin, ValuesListMixin, generics.ListCreateAPIView,
+):
     """
     API view for listing and creating Voucher objects.
 
+    Listings are paginated with cursors ordered by ID (see `IdCursorPagination`), can be limited to
+    some fields with `?fields=` (see `SparseFieldsetMixin`) and are rendered from `values()` rows
+    when requested as JSON (see `ValuesListMixin`). Their ETag is derived from the version of the
+    voucher listings (see `ConditionalGetMixin`). Creations sent with an `Idempotency-Key` header run once
+    (see `IdempotentCreateMixin`).
+
     Attributes:
     - `queryset` (QuerySet): Set of Voucher objects.
     - `serializer_class` (Serializer): Serializer class for Voucher objects.
+    - `renderer_classes` (list): Streaming JSON and browsable API renderers.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
     """ 
     queryset = Voucher.objects.all()
     serializer_class = VoucherSerializer
+    renderer_classes = [StreamingJSONRenderer, BrowsableAPIRenderer]
+    use_read_replica = True
 
 
-class VoucherAPIDetailView(generics.RetrieveUpdateDestroyAPIView):
+class VoucherAPIDetailView(ConditionalGetMixin, SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     API view for retrieving, updating, and deleting a specific Voucher object.
 
+    Retrieved vouchers can be limited to some fields with `?fields=` (see `SparseFieldsetMixin`), and
+    their ETag is derived from the version of the voucher (see `ConditionalGetMixin`), read from the primary
+    database rather than the voucher cache, which is per process and misses the writes of other processes.
+
     Attributes:
     - `queryset` (QuerySet): Set of Voucher objects.
     - `serializer_class` (Serializer): Serializer class for Voucher objects.
+    - `voucher` (Voucher): The voucher read by the current safe request, once loaded.
+    - `version` (int): The version of the voucher read from the database by the current conditional GET.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
     """
     queryset = Voucher.objects.all()
     serializer_class = VoucherSerializer
+    voucher = None
+    version = None
+    use_read_replica = True
+
+    def get_object(self):
+        """
+        Returns the requested voucher, read through the voucher cache (once per request) for safe (read-only)
+        methods. Writes load the voucher from the database so they never save a stale snapshot.
+        """
+        if self.request.method not in permissions.SAFE_METHODS:
+            return super().get_object()
+        if self.voucher is None:
+            voucher = voucher_cache.get(self.kwargs[self.lookup_field])
+            if voucher is not None and self.version is not None and voucher.version != self.version:
+                # Cached before a write of another process.
+                voucher_cache.invalidate(voucher.pk)
+                voucher = voucher_cache.get(voucher.pk)
+            if voucher is None:
+                raise Http404
+            self.check_object_permissions(self.request, voucher)
+            self.voucher = voucher
+        return self.voucher
+
+    def get_version_stamp(self):
+        """
+        Returns the version of the voucher, read from the primary database with one primary key lookup
+        (the voucher cache also loads vouchers from the primary database).
+        """
+        voucher_id = self.kwargs[self.lookup_field]
+        stamp = (
+            Voucher.objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk=voucher_id)
+            .values_list('version', 'updated_at')
+            .first()
+        )
+        if stamp is None:
+            raise Http404
+        self.version, updated_at = stamp
+        return (voucher_id, self.version), updated_at
+
+
+class VoucherAPIImportView(APIView):
+    """
+    Admin-only API view importing vouchers from an uploaded CSV or JSONL file.
+
+    The file is sent as the `file` field of a multipart request; its format is inferred from its extension
+    unless a `format` field is given. The file is read one row at a time and valid rows are upserted in batches.
+
+    Attributes:
+    - `permission_classes` (list): Restricts the view to staff users.
+    - `parser_classes` (list): Accepts multipart uploads.
+    - `voucher_management_service` (VoucherManagementService): Service importing the vouchers.
+    - `max_reported_rejections` (int): Maximum number of rejected rows listed in the response.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+    voucher_management_service = VoucherManagementService()
+    max_reported_rejections = 100
+
+    def post(self, request, *args, **kwargs):
+        uploaded_file = request.FILES.get('file')
+        if uploaded_file is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('format') or os.path.splitext(uploaded_file.name)[1].lstrip('.').lower()
+        if file_format not in self.voucher_management_service.import_formats:
+            return Response(
+                {'format': [f'Supported formats: {", ".join(self.voucher_management_service.import_formats)}.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        rejected_rows = []
+
+        def reject(line_number, row, errors):
+            if len(rejected_rows) < self.max_reported_rejections:
+                rejected_rows.append({'line': line_number, 'errors': errors, 'row': row})
+
+        file = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+        results = self.voucher_management_service.import_vouchers(
+            self.voucher_management_service.read_voucher_rows(file, file_format),
+            reject=reject,
+        )
+        results['rejected_rows'] = rejected_rows
+        return Response(results)
+
+
+class VoucherAPIBulkView(APIView):
+    """
+    Admin-only API view creating (POST), partially updating (PATCH) and deleting (DELETE) vouchers in bulk.
+
+    The request body is a JSON array of items: voucher objects to create, objects with the `id` or `code`
+    of a voucher and the fields to update, or objects with the `id` or `code` of a voucher to delete.
+    Items are validated with `VoucherSerializer` and written in chunks, one transaction per chunk
+    (see `VoucherBulkService`). The response lists the result of every item, in request order, along
+    with the number of items per status.
+
+    Attributes:
+    - `permission_classes` (list): Restricts the view to staff users.
+    - `voucher_bulk_service` (VoucherBulkService): Service writing the vouchers.
+    - `max_items` (int): Maximum number of items per request.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    voucher_bulk_service = VoucherBulkService()
+    max_items = 50000
+
+    def get_items(self, request):
+        """
+        Returns the items of the request body, or None if the body is not a JSON array of at most `max_items` items.
+        """
+        items = request.data
+        if not isinstance(items, list) or len(items) > self.max_items:
+            return None
+        return items
+
+    def get_response(self, items, write):
+        if items is None:
+            return Response(
+                {'non_field_errors': [f'Expected a list of at most {self.max_items} items.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        results = write(items)
+        return Response({**Counter(result['status'] for result in results), 'results': results})
+
+    def post(self, request, *args, **kwargs):
+        return self.get_response(self.get_items(request), self.voucher_bulk_service.create_vouchers)
+
+    def patch(self, request, *args, **kwargs):
+        return self.get_response(self.get_items(request), self.voucher_bulk_service.update_vouchers)
+
+    def delete(self, request, *args, **kwargs):
+        return self.get_response(self.get_items(request), self.voucher_bulk_service.delete_vouchers)
 
 
 class VoucherApiListView(generics.ListCreateAPIView):
     """
-    API view for listing and creating VoucherApi objects.
+    API view for listing and creating VoucherApi objects, with their vouchers nested inline.
+
+    The vouchers are fetched by a join (`select_related`), so a page costs the same number of queries
+    whatever its size.
 
     Attributes:
-    - `queryset` (QuerySet): Set of VoucherApi objects.
+    - `queryset` (QuerySet): Set of VoucherApi objects, with their vouchers.
     - `serializer_class` (Serializer): Serializer class for VoucherApi objects.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
     """
-    queryset = VoucherApi.objects.all()
+    queryset = VoucherApi.objects.select_related('voucher')
     serializer_class = VoucherApiSerializer
+    use_read_replica = True
 
 
 class VoucherApiDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
-    API view for retrieving, updating, and deleting a specific VoucherApi object.
+    API view for retrieving, updating, and deleting a specific VoucherApi object, with its voucher nested inline.
 
     Attributes:
-    - `queryset` (QuerySet): Set of VoucherApi objects.
+    - `queryset` (QuerySet): Set of VoucherApi objects, with their vouchers.
     - `serializer_class` (Serializer): Serializer class for VoucherApi objects.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
     """
-    queryset = VoucherApi.objects.all()
+    queryset = VoucherApi.objects.select_related('voucher')
     serializer_class = VoucherApiSerializer
+    use_read_replica = True
+
+
+class RedemptionAnalyticsAPIView(APIView):
+    """
+    Admin-only API view returning the redemption analytics: the total number of redemptions, the hourly
+    and daily series, and the most redeemed vouchers (or, with `voucher`, the series of one voucher).
+
+    The analytics are read from the redemption rollups only (see `RedemptionRollups.get_summary`), never
+    from the redemptions. The query parameters are validated by `RedemptionAnalyticsQuerySerializer`.
+
+    Attributes:
+    - `permission_classes` (list): Restricts the view to staff users.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    use_read_replica = True
+
+    def get(self, request, *args, **kwargs):
+        query = RedemptionAnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(redemption_rollups.get_summary(
+            hours=query.validated_data['hours'],
+            days=query.validated_data['days'],
+            top=query.validated_data['top'],
+            voucher_id=query.validated_data.get('voucher'),
+        ))
+
+
+class RedemptionHistoryAPIView(APIView):
+    """
+    Admin-only API view listing the redemptions of a user (`user`) or of a voucher (`voucher`), newest first,
+    merging the live and the archived redemptions.
+
+    Pages are keyset-paginated with the `cursor` query parameter
+    (see `VoucherRedemptionService.get_redemption_history_page`); the response links to the `next`
+    (older) and `previous` (newer) pages.
+
+    Attributes:
+    - `permission_classes` (list): Restricts the view to staff users.
+    - `voucher_redemption_service` (VoucherRedemptionService): Service reading the redemptions.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    voucher_redemption_service = VoucherRedemptionService()
+    use_read_replica = True
+
+    def get_page_url(self, request, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+
+    def get(self, request, *args, **kwargs):
+        query = RedemptionHistoryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        page = self.voucher_redemption_service.get_redemption_history_page(
+            user=query.validated_data.get('user'),
+            voucher=query.validated_data.get('voucher'),
+            cursor=query.validated_data.get('cursor'),
+            page_size=query.validated_data.get('page_size'),
+        )
+        return Response({
+            'next': self.get_page_url(request, page['next_cursor']),
+            'previous': self.get_page_url(request, page['previous_cursor']),
+            'results': RedemptionHistorySerializer(page['redemptions'], many=True).data,
+        })
+
+
+class RedemptionAPIView(APIView):
+    """
+    API view redeeming a voucher for the authenticated user in a single request, e.g. for point-of-sale terminals.
+
+    The body (`{"code": ...}`) is validated by `RedemptionRequestSerializer`, and the response is the compact
+    `outcome` of the redemption (see `VoucherRedemptionService.redeem`) with a status code per outcome: no message
+    is stored in the session, no page is rendered and the history is not queried. Requests sent with an
+    `Idempotency-Key` header redeem the voucher once; retries are answered with the outcome of the first attempt
+    (see `IdempotencyStore`), except busy outcomes, which can be retried.
+
+    Attributes:
+    - `permission_classes` (list): Restricts the view to authenticated users.
+    - `voucher_redemption_service` (VoucherRedemptionService): Service redeeming the vouchers.
+    - `voucher_management_service` (VoucherManagementService): Service looking up the vouchers.
+    - `outcome_statuses` (dict): HTTP status code of each redemption outcome.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    voucher_redemption_service = VoucherRedemptionService()
+    voucher_management_service = VoucherManagementService()
+    outcome_statuses = {
+        VoucherRedemptionService.REDEEMED: status.HTTP_201_CREATED,
+        VoucherRedemptionService.EXHAUSTED: status.HTTP_409_CONFLICT,
+        VoucherRedemptionService.ALREADY_REDEEMED: status.HTTP_409_CONFLICT,
+        VoucherRedemptionService.MISSING: status.HTTP_404_NOT_FOUND,
+        VoucherRedemptionService.BUSY: status.HTTP_503_SERVICE_UNAVAILABLE,
+    }
+
+    def redeem(self, user, voucher_code):
+        """
+        Redeems the voucher with a code for a user.
+
+        Returns:
+        - tuple: The redemption outcome, and the discount percentage of the voucher (None unless redeemed).
+        """
+        voucher = self.voucher_management_service.get_voucher_by_code(voucher_code)
+        outcome = self.voucher_redemption_service.redeem(user, voucher)
+        return outcome, voucher.discount_percentage if outcome == VoucherRedemptionService.REDEEMED else None
+
+    def post(self, request, *args, **kwargs):
+        serializer = RedemptionRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        voucher_code = serializer.validated_data['code']
+        try:
+            request_key = idempotency_store.get_request_key(request, 'api_redeem_voucher', {'code': voucher_code})
+        except ValueError as e:
+            raise ValidationError({idempotency_store.header: [str(e)]})
+        if request_key is None:
+            outcome, discount_percentage = self.redeem(request.user, voucher_code)
+        else:
+            state, result = idempotency_store.run(
+                *request_key,
+                self.redeem,
+                request.user,
+                voucher_code,
+                should_store=lambda result: result[0] != VoucherRedemptionService.BUSY,
+            )
+            if state == idempotency_store.IN_PROGRESS:
+                return Response(
+                    {'detail': f'A request with this {idempotency_store.header} is in progress.'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if state == idempotency_store.MISMATCH:
+                return Response(
+                    {'detail': f'This {idempotency_store.header} was already used with another payload.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            outcome, discount_percentage = result
+        data = {'code': voucher_code, 'outcome': outcome}
+        if discount_percentage is not None:
+            data['discount_percentage'] = discount_percentage
+        response = Response(data, status=self.outcome_statuses[outcome])
+        if outcome == VoucherRedemptionService.BUSY:
+            response['Retry-After'] = '1'
+        return response
@@ -1,9 +1,9 @@
 from django.urls import path, include
-from .views import DashboardView
+from .views import DashboardHomeView
 
 
 urlpatterns = [
-    path('', DashboardView.as_view(), name='dashboard'),
+    path('', DashboardHomeView.as_view(), name='dashboard'),
     path('voucher-management/', include('voucher_management.urls')),
     path('voucher-redemption/', include('voucher_redemption.urls')),
 ]
\ No newline at end of file
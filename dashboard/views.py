@@ -1,6 +1,8 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.shortcuts import render
 from django.views import View
 from django.conf import settings
+from voucher_redemption.rollups import redemption_rollups
 
 
 class DashboardView(LoginRequiredMixin, View):
@@ -22,3 +24,34 @@ class DashboardView(LoginRequiredMixin, View):
             }
         },
     }
+
+
+class DashboardHomeView(DashboardView):
+    """
+    View of the dashboard home page, showing the redemption analytics to staff users.
+
+    The analytics are read from the redemption rollups only (see `RedemptionRollups.get_summary`),
+    so the page costs a few indexed queries whatever the number of redemptions.
+
+    Attributes:
+    - `template` (str): The template name for rendering the view.
+    - `base_context` (dict): Base context for the view.
+    - `use_read_replica` (bool): Reads of GET requests may go to the read replica (see `ReplicaRouter`).
+    """
+
+    template = 'dashboard/home.html'
+    use_read_replica = True
+    base_context = {
+        'application_name': 'Dashboard',
+    }
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        voucher_management_access = user.is_staff or user.is_superuser
+        context = {
+            'voucher_management_access': voucher_management_access,
+            'redemption_analytics': redemption_rollups.get_summary() if voucher_management_access else None,
+        }
+        context.update(self.dashboard_context)
+        context.update(self.base_context)
+        return render(request, self.template, context)
@@ -0,0 +1,207 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router
+from .models import Voucher
+
+
+class VoucherCache:
+    """
+    Read-through cache of vouchers built on Django's cache framework.
+
+    Vouchers are stored as compact snapshots (a tuple of the concrete field values) keyed by voucher ID,
+    with a secondary key mapping each normalized code to its voucher ID. Every voucher has a version stamp
+    that is stored along with its snapshot; invalidating a voucher replaces the stamp, so any snapshot
+    cached before (including one written by a read racing with the invalidation) is never served again.
+
+    Only the cache API shared by all backends is used, so it works with the local-memory and file-based
+    backends. Note that the local-memory backend is per process: invalidations are only seen by the
+    process that performed the write, other processes serve their snapshot until `VOUCHER_CACHE_TIMEOUT`.
+
+    Vouchers are always loaded from the default (primary) database, never from the read replica, so a
+    lagging replica can not store a stale snapshot under the current version stamp.
+
+    Attributes:
+    - `key_prefix` (str): Prefix of all the cache keys used by the voucher cache.
+    - `field_names` (list): Attribute names of the voucher fields stored in a snapshot.
+    """
+
+    key_prefix = 'voucher_cache'
+    field_names = [field.attname for field in Voucher._meta.concrete_fields]
+
+    @property
+    def cache(self):
+        return caches[settings.VOUCHER_CACHE_ALIAS]
+
+    @property
+    def timeout(self):
+        return settings.VOUCHER_CACHE_TIMEOUT
+
+    def get_version_key(self, voucher_id):
+        return f'{self.key_prefix}:version:{voucher_id}'
+
+    def get_voucher_key(self, voucher_id):
+        return f'{self.key_prefix}:id:{voucher_id}'
+
+    def get_code_key(self, voucher_code):
+        return f'{self.key_prefix}:code:{voucher_code}'
+
+    def get_version(self, voucher_id):
+        """
+        Returns the current version stamp of a voucher, creating one if the voucher has none yet.
+
+        Version stamps are timestamps rather than counters, so a stamp evicted from the cache is
+        replaced by a new value instead of restarting from a value that older snapshots may be stored under.
+
+        Parameters:
+        - `voucher_id` (int): The ID of the voucher.
+
+        Returns:
+        - int: The version stamp of the voucher.
+        """
+        version_key = self.get_version_key(voucher_id)
+        version = self.cache.get(version_key)
+        if version is None:
+            self.cache.add(version_key, time.time_ns(), timeout=None)
+            version = self.cache.get(version_key)
+        return version
+
+    def to_snapshot(self, voucher):
+        return tuple(getattr(voucher, field_name) for field_name in self.field_names)
+
+    def from_snapshot(self, snapshot):
+        return Voucher.from_db(router.db_for_read(Voucher), self.field_names, snapshot)
+
+    def set(self, voucher, version=None):
+        """
+        Stores a voucher snapshot in the cache.
+
+        Parameters:
+        - `voucher` (Voucher): The voucher to store.
+        - `version` (int): The version stamp read before the voucher was loaded (defaults to the current one).
+        """
+        if version is None:
+            version = self.get_version(voucher.id)
+        self.cache.set_many({
+            self.get_voucher_key(voucher.id): (version, self.to_snapshot(voucher)),
+            self.get_code_key(voucher.code): voucher.id,
+        }, timeout=self.timeout)
+
+    def get(self, voucher_id):
+        """
+        Retrieve a voucher by its ID, loading it from the database on a cache miss.
+
+        Parameters:
+        - `voucher_id` (int): The ID of the voucher to retrieve.
+
+        Returns:
+        - A Voucher instance if found, else None.
+        """
+        version = self.get_version(voucher_id)
+        cached = self.cache.get(self.get_voucher_key(voucher_id))
+        if cached is not None and cached[0] == version:
+            return self.from_snapshot(cached[1])
+        voucher = Voucher.objects.using(DEFAULT_DB_ALIAS).filter(id=voucher_id).first()
+        if voucher:
+            self.set(voucher, version)
+        return voucher
+
+    def get_by_code(self, voucher_code):
+        """
+        Retrieve a voucher by its normalized code, loading it from the database on a cache miss.
+
+        Parameters:
+        - `voucher_code` (str): The normalized code of the voucher.
+
+        Returns:
+        - A Voucher instance if found, else None.
+        """
+        voucher_id = self.cache.get(self.get_code_key(voucher_code))
+        if voucher_id is not None:
+            voucher = self.get(voucher_id)
+            if voucher and voucher.code == voucher_code:
+                return voucher
+        voucher_id = Voucher.objects.using(DEFAULT_DB_ALIAS).filter(code=voucher_code).values_list('id', flat=True).first()
+        if voucher_id is None:
+            return None
+        voucher = self.get(voucher_id)
+        if voucher and voucher.code == voucher_code:
+            return voucher
+        return None
+
+    async def aget_version(self, voucher_id):
+        """
+        Async version of `get_version`.
+        """
+        version_key = self.get_version_key(voucher_id)
+        version = await self.cache.aget(version_key)
+        if version is None:
+            await self.cache.aadd(version_key, time.time_ns(), timeout=None)
+            version = await self.cache.aget(version_key)
+        return version
+
+    async def aset(self, voucher, version=None):
+        """
+        Async version of `set`.
+        """
+        if version is None:
+            version = await self.aget_version(voucher.id)
+        await self.cache.aset_many({
+            self.get_voucher_key(voucher.id): (version, self.to_snapshot(voucher)),
+            self.get_code_key(voucher.code): voucher.id,
+        }, timeout=self.timeout)
+
+    async def aget(self, voucher_id):
+        """
+        Async version of `get`, loading the voucher with the async ORM on a cache miss.
+        """
+        version = await self.aget_version(voucher_id)
+        cached = await self.cache.aget(self.get_voucher_key(voucher_id))
+        if cached is not None and cached[0] == version:
+            return self.from_snapshot(cached[1])
+        voucher = await Voucher.objects.using(DEFAULT_DB_ALIAS).filter(id=voucher_id).afirst()
+        if voucher:
+            await self.aset(voucher, version)
+        return voucher
+
+    async def aget_by_code(self, voucher_code):
+        """
+        Async version of `get_by_code`, loading the voucher with the async ORM on a cache miss.
+        """
+        voucher_id = await self.cache.aget(self.get_code_key(voucher_code))
+        if voucher_id is not None:
+            voucher = await self.aget(voucher_id)
+            if voucher and voucher.code == voucher_code:
+                return voucher
+        voucher_id = await Voucher.objects.using(DEFAULT_DB_ALIAS).filter(code=voucher_code).values_list('id', flat=True).afirst()
+        if voucher_id is None:
+            return None
+        voucher = await self.aget(voucher_id)
+        if voucher and voucher.code == voucher_code:
+            return voucher
+        return None
+
+    def invalidate(self, voucher_id):
+        """
+        Invalidates every cached snapshot of a voucher by replacing its version stamp.
+
+        Parameters:
+        - `voucher_id` (int): The ID of the voucher to invalidate.
+        """
+        self.cache.set(self.get_version_key(voucher_id), time.time_ns(), timeout=None)
+
+    def invalidate_many(self, voucher_ids):
+        """
+        Invalidates every cached snapshot of several vouchers at once.
+
+        Parameters:
+        - `voucher_ids` (iterable): The IDs of the vouchers to invalidate.
+        """
+        version = time.time_ns()
+        self.cache.set_many(
+            {self.get_version_key(voucher_id): version for voucher_id in voucher_ids},
+            timeout=None,
+        )
+
+
+voucher_cache = VoucherCache()
@@ -0,0 +1,257 @@
+import datetime
+import hashlib
+import math
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils import timezone
+from .models import Voucher, VoucherCatalog
+from .versions import voucher_versions
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings, answering whether an item may have been added or definitely was not.
+
+    Attributes:
+    - `capacity` (int): Number of items the filter is sized for.
+    - `error_rate` (float): False-positive probability of the filter once it holds `capacity` items.
+    - `size` (int): Number of bits of the filter.
+    - `hash_count` (int): Number of bit positions set for each item.
+    - `count` (int): Approximate number of distinct items added to the filter (an item setting no new bit,
+      such as an item added again, is not counted).
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def get_positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first_hash = int.from_bytes(digest[:8], 'little')
+        second_hash = int.from_bytes(digest[8:], 'little') | 1
+        return [(first_hash + i * second_hash) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        bits = self.bits
+        added = False
+        for position in self.get_positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.get_positions(item))
+
+
+class VoucherCodeFilter:
+    """
+    In-process Bloom filter of all the normalized voucher codes, used to answer "definitely does not exist"
+    for unknown codes without querying the database.
+
+    The filter is built on first use and kept up to date as follows:
+    - Vouchers saved or deleted in this process are added to (or marked stale in) the filter by signal handlers.
+    - Every `VOUCHER_CODE_FILTER_REFRESH_INTERVAL` seconds, the version of the voucher catalog is read and, if any
+      voucher was written since the last refresh, the codes of the vouchers written (created, renamed, updated or
+      redeemed, as found by the index on `updated_at`) since then are added to the filter. The scan starts
+      `refresh_overlap` before the previous one, so writes committed a while after their `updated_at` are not missed.
+    - The `rebuild_voucher_code_filter` management command increments the filter generation stored in the
+      voucher catalog row; every process rebuilds its filter at its next refresh.
+
+    Deleted or renamed codes cannot be removed from a Bloom filter; they only make the filter answer
+    "may exist" (a false positive, costing one lookup) until it is rebuilt. The codes, the catalog version
+    and the generation are always read from the default (primary) database, as a code missed on a lagging
+    read replica would be rejected.
+
+    Attributes:
+    - `min_capacity` (int): Minimum number of codes the filter is sized for.
+    - `refresh_overlap` (datetime.timedelta): Margin by which a refresh scan starts before the previous one.
+    """
+
+    min_capacity = 1000
+    refresh_overlap = datetime.timedelta(seconds=60)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom_filter = None
+        self.generation = None
+        self.catalog_version = None
+        self.updated_since = None
+        self.refreshed_at = 0
+        self.stale_codes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.false_positives = 0
+
+    def get_catalog_state(self):
+        """
+        Returns the version of the voucher catalog and the filter generation, read from the primary database.
+        """
+        catalog = (
+            VoucherCatalog.objects.using(DEFAULT_DB_ALIAS)
+            .filter(id=voucher_versions.catalog_id)
+            .values_list('version', 'code_filter_generation')
+            .first()
+        )
+        return catalog or (None, 0)
+
+    def build(self):
+        """
+        Builds the filter from every voucher code in the database, sized for twice the current number
+        of vouchers so the error rate holds while the catalog grows.
+        """
+        with self.lock:
+            catalog_version, generation = self.get_catalog_state()
+            started_at = timezone.now()
+            capacity = max(Voucher.objects.using(DEFAULT_DB_ALIAS).count() * 2, self.min_capacity)
+            bloom_filter = BloomFilter(capacity, settings.VOUCHER_CODE_FILTER_ERROR_RATE)
+            codes = Voucher.objects.using(DEFAULT_DB_ALIAS).values_list('code', flat=True)
+            for voucher_code in codes.iterator(chunk_size=10000):
+                bloom_filter.add(voucher_code)
+            self.bloom_filter = bloom_filter
+            self.generation = generation
+            self.catalog_version = catalog_version
+            self.updated_since = started_at - self.refresh_overlap
+            self.refreshed_at = time.monotonic()
+            self.stale_codes = 0
+
+    def refresh(self):
+        """
+        Rebuilds the filter if a rebuild was requested or it outgrew its capacity, otherwise adds the
+        codes of the vouchers written since the last refresh (if the catalog version changed).
+        """
+        catalog_version, generation = self.get_catalog_state()
+        bloom_filter = self.bloom_filter
+        if generation != self.generation or bloom_filter.count > bloom_filter.capacity:
+            self.build()
+            return
+        with self.lock:
+            if catalog_version != self.catalog_version:
+                started_at = timezone.now()
+                codes = (
+                    Voucher.objects.using(DEFAULT_DB_ALIAS)
+                    .filter(updated_at__gte=self.updated_since)
+                    .values_list('code', flat=True)
+                )
+                for voucher_code in codes.iterator(chunk_size=10000):
+                    self.bloom_filter.add(voucher_code)
+                self.catalog_version = catalog_version
+                self.updated_since = started_at - self.refresh_overlap
+            self.refreshed_at = time.monotonic()
+
+    def request_rebuild(self):
+        """
+        Increments the filter generation stored in the voucher catalog row, so every process rebuilds
+        its filter at its next refresh, and rebuilds the filter of this process.
+        """
+        updated = VoucherCatalog.objects.filter(id=voucher_versions.catalog_id).update(
+            code_filter_generation=F('code_filter_generation') + 1,
+        )
+        if not updated:
+            VoucherCatalog.objects.get_or_create(id=voucher_versions.catalog_id, defaults={'code_filter_generation': 1})
+        self.build()
+
+    def might_contain(self, voucher_code):
+        """
+        Checks whether a voucher with the given normalized code may exist.
+
+        Parameters:
+        - `voucher_code` (str): The normalized voucher code.
+
+        Returns:
+        - bool: False if no voucher has this code, True if one may have it.
+        """
+        if not settings.VOUCHER_CODE_FILTER_ENABLED:
+            return True
+        self.update()
+        return self.contains(voucher_code)
+
+    async def amight_contain(self, voucher_code):
+        """
+        Async version of `might_contain`: the filter is only built or refreshed (which queries the database)
+        in a worker thread, other lookups are answered in the event loop.
+        """
+        if not settings.VOUCHER_CODE_FILTER_ENABLED:
+            return True
+        if self.is_due():
+            await sync_to_async(self.update)()
+        return self.contains(voucher_code)
+
+    def is_due(self):
+        """
+        Returns whether the filter has to be built, or refreshed as the refresh interval elapsed.
+        """
+        return (
+            self.bloom_filter is None
+            or time.monotonic() - self.refreshed_at > settings.VOUCHER_CODE_FILTER_REFRESH_INTERVAL
+        )
+
+    def update(self):
+        """
+        Builds the filter on first use, or refreshes it once the refresh interval elapsed.
+        """
+        if self.bloom_filter is None:
+            self.build()
+        elif self.is_due():
+            self.refresh()
+
+    def contains(self, voucher_code):
+        self.lookups += 1
+        if voucher_code in self.bloom_filter:
+            return True
+        self.hits += 1
+        return False
+
+    def add(self, voucher_code):
+        """
+        Adds a normalized voucher code to the filter (a no-op until the filter is built).
+        """
+        bloom_filter = self.bloom_filter
+        if bloom_filter is not None:
+            bloom_filter.add(voucher_code)
+
+    def discard(self, voucher_code):
+        """
+        Records that a voucher code no longer exists. Its bits stay set until the filter is rebuilt.
+        """
+        self.stale_codes += 1
+
+    def record_false_positive(self):
+        """
+        Records a code the filter reported as possibly existing that the database did not find.
+        """
+        self.false_positives += 1
+
+    def get_stats(self):
+        """
+        Returns the counters and sizing of the filter.
+
+        Returns:
+        - dict: Number of lookups, hits (lookups answered "does not exist" without a query),
+          false positives, codes in the filter, stale codes, capacity, size in bits and hash count.
+        """
+        bloom_filter = self.bloom_filter
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'false_positives': self.false_positives,
+            'codes': bloom_filter.count if bloom_filter else 0,
+            'stale_codes': self.stale_codes,
+            'capacity': bloom_filter.capacity if bloom_filter else 0,
+            'size': bloom_filter.size if bloom_filter else 0,
+            'hash_count': bloom_filter.hash_count if bloom_filter else 0,
+        }
+
+
+voucher_code_filter = VoucherCodeFilter()
@@ -1,4 +1,5 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from django.forms import fields, widgets
 
 from .models import Voucher
@@ -19,6 +20,7 @@ class UpdateVoucherForm(forms.Form):
     """
     code = fields.CharField(
         required=False,
+        max_length=20,
     )
     description = fields.CharField(
         required=False,
@@ -26,6 +28,7 @@ class UpdateVoucherForm(forms.Form):
     discount_percentage = fields.IntegerField(
         required=False,
         label="Discount Percentage",
+        min_value=0,
     )
     redemption_type = fields.ChoiceField(
         required=False,
@@ -35,6 +38,7 @@ class UpdateVoucherForm(forms.Form):
     x_times_redemption_limit = fields.IntegerField(
         required=False,
         label="X Times Redemption Limit",
+        min_value=1,
     )
     expiration_date = fields.DateTimeField(
         required=False,
@@ -46,6 +50,12 @@ class UpdateVoucherForm(forms.Form):
         initial=True,
     )
 
+    def clean_code(self):
+        """
+        Returns the submitted voucher code in its normalized form.
+        """
+        return Voucher.normalize_code(self.cleaned_data.get('code'))
+
 
 class CreateVoucherForm(forms.Form):
     """
@@ -59,12 +69,15 @@ class CreateVoucherForm(forms.Form):
     - `x_times_redemption_limit` (IntegerField): X times redemption limit (optional).
     - `expiration_date` (DateTimeField): Expiration date (optional, with date picker widget).
     """
-    code = fields.CharField()
+    code = fields.CharField(
+        max_length=20,
+    )
     description = fields.CharField(
         required=False,
     )
     discount_percentage = fields.IntegerField(
         label="Discount Percentage",
+        min_value=0,
     )
     redemption_type = fields.ChoiceField(
         label="Redemption Type",
@@ -73,9 +86,96 @@ class CreateVoucherForm(forms.Form):
     x_times_redemption_limit = fields.IntegerField(
         label="X Times Redemption Limit",
         required=False,
+        min_value=1,
     )
     expiration_date = fields.DateTimeField(
         label="Expiration Date",
         required=False,
         widget=widgets.TextInput(attrs={'type': 'date'})
     )
+
+    def clean_code(self):
+        """
+        Returns the submitted voucher code in its normalized form.
+        """
+        return Voucher.normalize_code(self.cleaned_data.get('code'))
+
+    @classmethod
+    def clean_data(cls, data):
+        """
+        Validates data with the fields of the form without instantiating it.
+
+        Instantiating a form deep-copies all of its fields, which dominates the cost of validating
+        many rows (e.g. when importing vouchers); the class-level fields are stateless and can be shared.
+
+        Parameters:
+        - `data` (dict): The submitted voucher data.
+
+        Returns:
+        - tuple: The cleaned data and the errors (lists of messages keyed by field name).
+        """
+        cleaned_data = {}
+        errors = {}
+        for name, field in cls.base_fields.items():
+            try:
+                cleaned_data[name] = field.clean(field.widget.value_from_datadict(data, {}, name))
+            except ValidationError as e:
+                errors[name] = e.messages
+        if 'code' in cleaned_data:
+            cleaned_data['code'] = Voucher.normalize_code(cleaned_data['code'])
+        return cleaned_data, errors
+
+
+class VoucherListFilterForm(forms.Form):
+    """
+    Form for searching, filtering and sorting the voucher list (submitted with GET).
+
+    Fields:
+    - `search` (CharField): Prefix of the voucher codes (optional).
+    - `is_active` (ChoiceField): Active status (optional).
+    - `redemption_type` (ChoiceField): Redemption type (optional).
+    - `expired` (ChoiceField): Expiry status (optional).
+    - `sort` (ChoiceField): Field the list is sorted by, prefixed with `-` for a descending order (hidden).
+    """
+    SORT_FIELDS = ['code', 'discount_percentage', 'redemption_count', 'expiration_date']
+    STATUS_CHOICES = [('', 'Any'), ('true', 'Yes'), ('false', 'No')]
+
+    search = fields.CharField(
+        required=False,
+        max_length=20,
+        label="Code Prefix",
+        widget=widgets.TextInput(attrs={'class': 'form-control'}),
+    )
+    is_active = fields.TypedChoiceField(
+        required=False,
+        label="Active",
+        choices=STATUS_CHOICES,
+        coerce=lambda value: value == 'true',
+        empty_value=None,
+        widget=widgets.Select(attrs={'class': 'form-select'}),
+    )
+    redemption_type = fields.ChoiceField(
+        required=False,
+        label="Redemption Type",
+        choices=[('', 'Any')] + Voucher.REDEMPTION_LIMIT_CHOICES,
+        widget=widgets.Select(attrs={'class': 'form-select'}),
+    )
+    expired = fields.TypedChoiceField(
+        required=False,
+        label="Expired",
+        choices=STATUS_CHOICES,
+        coerce=lambda value: value == 'true',
+        empty_value=None,
+        widget=widgets.Select(attrs={'class': 'form-select'}),
+    )
+    sort = fields.ChoiceField(
+        required=False,
+        choices=[('', 'ID')] + [(prefix + field, field) for field in SORT_FIELDS for prefix in ('', '-')],
+        widget=widgets.HiddenInput,
+    )
+
+    def clean_search(self):
+        """
+        Returns the submitted code prefix in its normalized form.
+        """
+        return Voucher.normalize_code(self.cleaned_data.get('search'))
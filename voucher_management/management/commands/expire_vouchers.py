@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from voucher_management.services import VoucherManagementService
+from voucher_system.db_retry import database_lock_retry
+
+
+class Command(BaseCommand):
+    """
+    Management command deactivating the expired vouchers in bounded batches (see
+    `VoucherManagementService.deactivate_expired_vouchers`).
+
+    Run once (e.g. every minute from cron), or with `--interval` as a long-running loop.
+
+    Example:
+    - `python manage.py expire_vouchers --interval 60 --batch-size 500 --pause 0.05`
+    """
+
+    help = 'Deactivates the expired vouchers in bounded batches, once or every --interval seconds.'
+    voucher_management_service = VoucherManagementService()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=VoucherManagementService.expiration_batch_size,
+                            help='Number of vouchers deactivated per transaction.')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Number of seconds to sleep between batches, letting redemptions write.')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Sweep every INTERVAL seconds until interrupted, instead of once.')
+
+    def sweep(self, options):
+        started_at = time.monotonic()
+
+        def report_progress(deactivated):
+            self.stdout.write(f'{deactivated} vouchers deactivated')
+
+        deactivated = self.voucher_management_service.deactivate_expired_vouchers(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=report_progress if options['verbosity'] > 1 else None,
+        )
+        if deactivated or options['verbosity'] > 1:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully deactivated {deactivated} expired vouchers in {time.monotonic() - started_at:.1f}s'
+            ))
+        if options['verbosity'] > 1:
+            for operation, counts in database_lock_retry.get_stats().items():
+                self.stdout.write(f'{operation}: {counts}')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['interval'] is None:
+            self.sweep(options)
+            return
+        try:
+            while True:
+                started_at = time.monotonic()
+                close_old_connections()
+                self.sweep(options)
+                time.sleep(max(0, options['interval'] - (time.monotonic() - started_at)))
+        except KeyboardInterrupt:
+            pass
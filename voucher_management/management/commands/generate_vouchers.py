@@ -0,0 +1,64 @@
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from voucher_management.models import Voucher
+from voucher_management.services import VoucherManagementService
+
+
+class Command(BaseCommand):
+    """
+    Management command generating vouchers with distinct random codes in bulk.
+
+    Example:
+    - `python manage.py generate_vouchers 1000000 --prefix SUMMER- --discount-percentage 10`
+    """
+
+    help = 'Generates vouchers with distinct random codes in bulk.'
+    voucher_management_service = VoucherManagementService()
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of vouchers to generate.')
+        parser.add_argument('--prefix', default='', help='Prefix of every code.')
+        parser.add_argument('--length', type=int, default=VoucherManagementService.code_length,
+                            help='Number of random characters of each code (excluding the prefix).')
+        parser.add_argument('--alphabet', default=VoucherManagementService.code_alphabet,
+                            help='Characters the random part of the codes is made of.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Only generate the vouchers missing to reach COUNT vouchers with the prefix.')
+        parser.add_argument('--batch-size', type=int, default=VoucherManagementService.generation_batch_size,
+                            help='Number of vouchers inserted per transaction.')
+        parser.add_argument('--description', default=None)
+        parser.add_argument('--discount-percentage', type=int, default=0)
+        parser.add_argument('--redemption-type', default=Voucher.SINGLE_REDEMPTION,
+                            choices=[choice for choice, label in Voucher.REDEMPTION_LIMIT_CHOICES])
+        parser.add_argument('--redemption-limit', type=int, default=None,
+                            help='Redemption limit of X times redemption vouchers.')
+
+    def handle(self, *args, **options):
+        if options['redemption_type'] == Voucher.X_TIMES_REDEMPTION and not options['redemption_limit']:
+            raise CommandError('X times redemption vouchers require --redemption-limit')
+        started_at = time.monotonic()
+
+        def report_progress(created, total):
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(f'{created}/{total} vouchers created ({created / elapsed:.0f} vouchers/s)')
+
+        try:
+            created = self.voucher_management_service.generate_vouchers(
+                options['count'],
+                length=options['length'],
+                alphabet=options['alphabet'],
+                prefix=options['prefix'],
+                resume=options['resume'],
+                batch_size=options['batch_size'],
+                progress=report_progress if options['verbosity'] > 0 else None,
+                description=options['description'],
+                discount_percentage=options['discount_percentage'],
+                redemption_type=options['redemption_type'],
+                redemption_limit=options['redemption_limit'],
+            )
+        except (ValueError, ValidationError) as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully generated {created} vouchers in {time.monotonic() - started_at:.1f}s'
+        ))
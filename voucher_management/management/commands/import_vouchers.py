@@ -0,0 +1,54 @@
+import csv
+import json
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from voucher_management.services import VoucherManagementService
+
+
+class Command(BaseCommand):
+    """
+    Management command importing vouchers from a CSV or JSONL file.
+
+    Rows use the fields of the voucher creation form (`code`, `description`, `discount_percentage`, `redemption_type`,
+    `x_times_redemption_limit`, `expiration_date`). Existing vouchers with the same code are updated.
+
+    Example:
+    - `python manage.py import_vouchers partner_vouchers.csv --report rejected.csv`
+    """
+
+    help = 'Imports vouchers from a CSV or JSONL file, writing the rejected rows to a report.'
+    voucher_management_service = VoucherManagementService()
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the CSV or JSONL file to import.')
+        parser.add_argument('--format', choices=VoucherManagementService.import_formats,
+                            help='Format of the file (default: inferred from the file extension).')
+        parser.add_argument('--report', help='Path of the rejected rows report (default: PATH.rejected.csv).')
+        parser.add_argument('--batch-size', type=int, default=VoucherManagementService.import_batch_size,
+                            help='Number of vouchers upserted per transaction.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in VoucherManagementService.import_formats:
+            raise CommandError('Cannot infer the file format from its extension, use --format')
+        report_path = options['report'] or f'{path}.rejected.csv'
+        started_at = time.monotonic()
+        with open(path, newline='', encoding='utf-8-sig') as file, \
+                open(report_path, 'w', newline='', encoding='utf-8') as report:
+            report_writer = csv.writer(report)
+            report_writer.writerow(['line', 'errors', 'row'])
+
+            def reject(line_number, row, errors):
+                report_writer.writerow([line_number, json.dumps(errors), json.dumps(row)])
+
+            results = self.voucher_management_service.import_vouchers(
+                self.voucher_management_service.read_voucher_rows(file, file_format),
+                batch_size=options['batch_size'],
+                reject=reject,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported vouchers in {time.monotonic() - started_at:.1f}s: {results["created"]} created, '
+            f'{results["updated"]} updated, {results["rejected"]} rejected (see {report_path})'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from voucher_management.code_filter import voucher_code_filter
+
+
+class Command(BaseCommand):
+    """
+    Management command rebuilding the voucher code filter.
+
+    The filter generation is incremented in the voucher catalog row, so every process using the database
+    rebuilds its own filter at its next refresh.
+    """
+
+    help = 'Rebuilds the Bloom filter of voucher codes and prints its statistics.'
+
+    def handle(self, *args, **options):
+        voucher_code_filter.request_rebuild()
+        for name, value in voucher_code_filter.get_stats().items():
+            self.stdout.write(f'{name}: {value}')
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the voucher code filter'))
@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+
+class Command(BaseCommand):
+    """
+    Management command copying the default SQLite database into the read replica, with SQLite's online
+    backup API: the copy is a consistent snapshot, taken while the default database keeps serving writes,
+    and readers of the replica see either the previous or the new snapshot.
+
+    Run once (e.g. every few seconds from a supervisor), or with `--interval` as a long-running loop.
+    The replica lags behind the default database by up to the interval; clients that wrote keep reading
+    from the default database for `DATABASE_REPLICA_STICKY_SECONDS` (see `ReadReplicaMiddleware`).
+
+    Example:
+    - `python manage.py sync_read_replica --interval 2`
+    """
+
+    help = 'Copies the default SQLite database into the read replica, once or every --interval seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica',
+                            help='Alias of the read replica database.')
+        parser.add_argument('--pages', type=int, default=-1,
+                            help='Number of pages copied per step (all at once by default).')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Copy every INTERVAL seconds until interrupted, instead of once.')
+
+    def sync(self, options):
+        started_at = time.monotonic()
+        source, replica = connections[DEFAULT_DB_ALIAS], connections[options['database']]
+        source.ensure_connection()
+        replica.ensure_connection()
+        source.connection.backup(replica.connection, pages=options['pages'])
+        if options['verbosity'] > 1:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully copied the database into {options["database"]} in {time.monotonic() - started_at:.2f}s'
+            ))
+
+    def handle(self, *args, **options):
+        if options['database'] not in connections or options['database'] == DEFAULT_DB_ALIAS:
+            raise CommandError(
+                f'Unknown read replica database {options["database"]!r} '
+                '(set VOUCHER_READ_REPLICA_NAME to the path of the replica)'
+            )
+        for alias in (DEFAULT_DB_ALIAS, options['database']):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'The {alias} database is not a SQLite database')
+        if options['interval'] is None:
+            self.sync(options)
+            return
+        try:
+            while True:
+                started_at = time.monotonic()
+                close_old_connections()
+                self.sync(options)
+                time.sleep(max(0, options['interval'] - (time.monotonic() - started_at)))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:09
+
+from collections import Counter
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def normalize_code(code):
+    """
+    Returns the normalized form of a voucher code (surrounding whitespace removed, upper case), as of
+    `Voucher.normalize_code` when this migration was written.
+    """
+    if not code:
+        return code
+    return code.strip().upper()
+
+
+def normalize_voucher_codes(apps, schema_editor):
+    """
+    Stores every voucher code in its normalized (trimmed, upper case) form, as computed in Python for the
+    code lookups (the database functions only trim spaces, and only upper-case ASCII letters on SQLite).
+
+    Raises an error listing the colliding codes if two existing vouchers only differ by case or
+    surrounding whitespace, as they cannot both be kept under the normalized unique code.
+    """
+    Voucher = apps.get_model('voucher_management', 'Voucher')
+    normalized_codes = Counter()
+    renamed_vouchers = []
+    for voucher_id, code in Voucher.objects.values_list('id', 'code').iterator(chunk_size=2000):
+        normalized_code = normalize_code(code)
+        normalized_codes[normalized_code] += 1
+        if normalized_code != code:
+            renamed_vouchers.append(Voucher(id=voucher_id, code=normalized_code))
+    collisions = sorted(code for code, vouchers in normalized_codes.items() if vouchers > 1)
+    if collisions:
+        raise RuntimeError(
+            'Cannot normalize voucher codes, the following codes collide when compared '
+            f'case-insensitively: {", ".join(collisions)}. Rename or delete the duplicates and retry.'
+        )
+    Voucher.objects.bulk_update(renamed_vouchers, ['code'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0005_voucher_redemption_limit'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_voucher_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='voucher',
+            constraint=models.CheckConstraint(check=models.Q(('code', django.db.models.functions.text.Upper(django.db.models.functions.text.Trim('code')))), name='voucher_code_normalized'),
+        ),
+    ]
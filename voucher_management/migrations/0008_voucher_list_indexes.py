@@ -0,0 +1,25 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0007_voucher_version_voucher_updated_at_vouchercatalog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['discount_percentage', 'id'], name='voucher_discount_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['redemption_count', 'id'], name='voucher_redeemed_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['expiration_date', 'id'], name='voucher_expiration_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0008_voucher_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['is_active', 'expiration_date'], name='voucher_active_expiration_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.11 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0009_voucher_active_expiration_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vouchercatalog',
+            name='code_filter_generation',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['updated_at'], name='voucher_updated_at_idx'),
+        ),
+    ]
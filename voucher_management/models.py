@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Trim, Upper
 
 
 class Voucher(models.Model):
@@ -20,6 +22,15 @@ class Voucher(models.Model):
     - `redemption_limit` (PositiveIntegerField): Redemption limit for the voucher (nullable, blank allowed).
     - `redemption_count` (PositiveIntegerField): Current redemption count for the voucher (default: 0).
     - `is_active` (BooleanField): Indicates whether the voucher is active (default: True).
+    - `version` (PositiveBigIntegerField): Version of the voucher, incremented on every write (including redemptions).
+    - `updated_at` (DateTimeField): Date of the last write to the voucher.
+
+    Meta:
+    - `constraints`: Codes are stored in their normalized (trimmed, upper case) form, so case-insensitive
+      lookups can use the unique index on `code`.
+    - `indexes`: Indexes on each sortable column of the voucher list (besides the unique `code`) and the ID,
+      serving its keyset pages in order, on the status and expiration date, serving the expiration sweeps, and
+      on the date of the last write, serving the refreshes of the voucher code filter.
     """
     SINGLE_REDEMPTION = 'single'
     MULTIPLE_REDEMPTION = 'multiple'
@@ -43,3 +54,76 @@ class Voucher(models.Model):
     redemption_limit = models.PositiveIntegerField(null=True, blank=True)
     redemption_count = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    version = models.PositiveBigIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(code=Upper(Trim('code'))),
+                name='voucher_code_normalized',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['discount_percentage', 'id'], name='voucher_discount_id_idx'),
+            models.Index(fields=['redemption_count', 'id'], name='voucher_redeemed_id_idx'),
+            models.Index(fields=['expiration_date', 'id'], name='voucher_expiration_id_idx'),
+            models.Index(fields=['is_active', 'expiration_date'], name='voucher_active_expiration_idx'),
+            models.Index(fields=['updated_at'], name='voucher_updated_at_idx'),
+        ]
+
+    @staticmethod
+    def normalize_code(code):
+        """
+        Returns the normalized form of a voucher code (surrounding whitespace removed, upper case).
+
+        Parameters:
+        - `code` (str): The voucher code to normalize.
+
+        Returns:
+        - str: The normalized voucher code, or the given value unchanged if it is empty.
+        """
+        if not code:
+            return code
+        return code.strip().upper()
+
+    def clean(self):
+        """
+        Normalizes the voucher code before model validation (including the uniqueness check).
+        """
+        super().clean()
+        self.code = self.normalize_code(self.code)
+
+    def save(self, *args, **kwargs):
+        """
+        Normalizes the voucher code before saving the voucher, and increments the version of existing vouchers.
+
+        The version is incremented in the database (rather than from the loaded value) so concurrent writes
+        each get their own version, then reloaded.
+        """
+        self.code = self.normalize_code(self.code)
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        self.version = F('version') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+
+class VoucherCatalog(models.Model):
+    """
+    Model holding the version of the voucher catalog (the whole voucher table), in a single row.
+
+    Fields:
+    - `version` (PositiveBigIntegerField): Version of the catalog, incremented on every voucher creation,
+      update and deletion (not on redemptions, see `VoucherVersions`).
+    - `updated_at` (DateTimeField): Date of the last change of the catalog version.
+    - `code_filter_generation` (PositiveBigIntegerField): Generation of the voucher code filter, incremented
+      to make every process rebuild its filter (see `VoucherCodeFilter`).
+    """
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    code_filter_generation = models.PositiveBigIntegerField(default=0)
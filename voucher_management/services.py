@@ -1,7 +1,23 @@
+import base64
+import csv
+import datetime
+import json
+import secrets
+import time
 from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Length
+from django.utils import timezone
+from .cache import voucher_cache
+from .code_filter import voucher_code_filter
 from .models import Voucher
+from .versions import voucher_versions
 from .forms import CreateVoucherForm, UpdateVoucherForm
 from voucher_redemption.services import VoucherRedemptionService
+from voucher_system.db_retry import database_lock_retry
 
 
 class VoucherManagementService:
@@ -10,13 +26,34 @@ class VoucherManagementService:
 
     Attributes:
     - `voucher_redemption_service`: An instance of VoucherRedemptionService for handling voucher redemption operations.
+    - `code_alphabet`: Default alphabet of generated voucher codes (upper case, without look-alike characters).
+    - `code_length`: Default length of generated voucher codes (excluding the prefix).
+    - `generation_batch_size`: Default number of vouchers inserted per transaction when generating vouchers.
+    - `generation_max_idle_batches`: Number of consecutive generated batches whose codes were all in use already
+      after which a voucher generation gives up.
+    - `import_batch_size`: Default number of vouchers upserted per transaction when importing vouchers.
+    - `import_formats`: Supported formats of voucher import files.
+    - `import_update_fields`: Fields of existing vouchers overwritten by an import.
+    - `list_page_size`: Default number of vouchers per page of the voucher list.
+    - `expiration_batch_size`: Default number of vouchers deactivated per transaction when sweeping expired vouchers.
     """
 
     voucher_redemption_service = VoucherRedemptionService()
+    code_alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+    code_length = 10
+    generation_batch_size = 10000
+    generation_max_idle_batches = 20
+    import_batch_size = 1000
+    import_formats = ['csv', 'jsonl']
+    import_update_fields = [
+        'description', 'discount_percentage', 'expiration_date', 'redemption_type', 'redemption_limit',
+    ]
+    list_page_size = 50
+    expiration_batch_size = 500
 
     def get_voucher(self, id):
         """
-        Retrieve a voucher by its ID.
+        Retrieve a voucher by its ID, going through the voucher cache.
 
         Parameters:
         - `id` (int): The ID of the voucher to retrieve.
@@ -26,16 +63,17 @@ class VoucherManagementService:
         """
         voucher = None
         if id:
-            try:
-                voucher = Voucher.objects.get(id=id)
-            except Voucher.DoesNotExist:
-                return voucher
+            voucher = voucher_cache.get(id)
         return voucher
 
     def get_voucher_by_code(self, voucher_code):
         """
         Retrieve a voucher by its unique code (case-insensitive).
 
+        Codes are stored normalized. Codes the voucher code filter knows do not exist are rejected
+        without a query; other lookups go through the voucher cache and, on a cache miss, are an exact
+        match on the unique index of `code`.
+
         Parameters:
         - `voucher_code` (str): The unique code of the voucher.
 
@@ -44,12 +82,35 @@ class VoucherManagementService:
         """
         voucher = None
         if voucher_code:
-            try:
-                voucher = Voucher.objects.get(code__iexact=voucher_code)
-            except Voucher.DoesNotExist:
+            voucher_code = Voucher.normalize_code(voucher_code)
+            if not voucher_code_filter.might_contain(voucher_code):
                 return voucher
+            voucher = voucher_cache.get_by_code(voucher_code)
+            if voucher is None:
+                voucher_code_filter.record_false_positive()
         return voucher
     
+    async def aget_voucher_by_code(self, voucher_code):
+        """
+        Async version of `get_voucher_by_code`, for async views: the voucher code filter and the voucher cache
+        are read without blocking the event loop, and cache misses load the voucher with the async ORM.
+
+        Parameters:
+        - `voucher_code` (str): The unique code of the voucher.
+
+        Returns:
+        - A Voucher instance if found, else None.
+        """
+        voucher = None
+        if voucher_code:
+            voucher_code = Voucher.normalize_code(voucher_code)
+            if not await voucher_code_filter.amight_contain(voucher_code):
+                return voucher
+            voucher = await voucher_cache.aget_by_code(voucher_code)
+            if voucher is None:
+                voucher_code_filter.record_false_positive()
+        return voucher
+
     def update_voucher(self, request, voucher_id):
         """
         Updates a voucher based on the provided voucher ID and form data.
@@ -65,6 +126,9 @@ class VoucherManagementService:
 
         Note:
         - The update involves extracting and applying the changed fields from the form to the existing voucher.
+        - The voucher is loaded from the database rather than the voucher cache, and the redemption count is
+          left out of the saved fields, so a concurrent redemption is never overwritten.
+        - The save is retried on lock contention (see `write_voucher`).
         """
         form = UpdateVoucherForm(request.POST)
         if form.is_valid():
@@ -74,17 +138,19 @@ class VoucherManagementService:
             for changed_data_field in changed_data_fields: 
                 fields_to_be_updated[changed_data_field] = form_cleaned_data.get(changed_data_field)
             try:
-                voucher = self.get_voucher(voucher_id)
+                voucher = Voucher.objects.get(id=voucher_id)
                 voucher.code = fields_to_be_updated.get('code', voucher.code)
                 voucher.description = fields_to_be_updated.get('description', voucher.description)
                 voucher.discount_percentage = fields_to_be_updated.get('discount_percentage', voucher.discount_percentage)
                 voucher.expiration_date = fields_to_be_updated.get('expiration_date', voucher.expiration_date)
                 voucher.redemption_type = fields_to_be_updated.get('redemption_type', voucher.redemption_type)
                 voucher.redemption_limit = self.voucher_redemption_service.get_redemption_limit(form)
-                voucher.redemption_count = fields_to_be_updated.get('redemption_count', voucher.redemption_count)
                 voucher.is_active = fields_to_be_updated.get('is_active', voucher.is_active)
+                self.write_voucher(lambda: voucher.save(update_fields=[
+                    'code', 'description', 'discount_percentage', 'expiration_date',
+                    'redemption_type', 'redemption_limit', 'is_active',
+                ]), 'update_voucher')
                 messages.success(request, f'Successfully Updated Voucher')
-                voucher.save()
             except Exception as e:
                 messages.error(request, f'Failed to Update Voucher')
         else:
@@ -105,6 +171,7 @@ class VoucherManagementService:
 
         Note:
         - The creation involves extracting relevant data from the form and attempting to create a new Voucher object.
+        - The creation is retried on lock contention (see `write_voucher`).
         """
         form = CreateVoucherForm(request.POST)
         if form.is_valid():
@@ -112,14 +179,14 @@ class VoucherManagementService:
             redemption_type = form_cleaned_data.get('redemption_type')
             redemption_limit = self.voucher_redemption_service.get_redemption_limit(form)
             try:
-                Voucher.objects.create(
+                self.write_voucher(lambda: Voucher.objects.create(
                     code = form_cleaned_data.get('code'),
                     discount_percentage = form_cleaned_data.get('discount_percentage'),
                     description = form_cleaned_data.get('description'),
                     redemption_type = redemption_type,
                     redemption_limit = redemption_limit,
                     expiration_date = form_cleaned_data.get('expiration_date'),
-                )
+                ), 'create_voucher')
                 messages.success(request, f'Successfully Created Voucher')
             except Exception as e:
                 messages.error(request, f'Failed to Create Voucher')
@@ -137,10 +204,556 @@ class VoucherManagementService:
         Side Effects:
         - If the voucher is successfully deleted, a success message is added to the Django messages framework.
         - If an exception occurs during the deletion process, an error message is added to the Django messages framework.
+
+        Note:
+        - The deletion is retried on lock contention (see `write_voucher`).
         """
         try:
             voucher = self.get_voucher(voucher_id)
-            voucher.delete()
+            self.write_voucher(voucher.delete, 'delete_voucher')
             messages.success(request, f'Successfully Deleted Voucher')
         except Exception as e:
             messages.error(request, f'Failed to Delete Voucher')
+
+    def write_voucher(self, write, operation):
+        """
+        Runs a voucher write, along with the writes of its signal receivers, in one transaction,
+        retried with a bounded exponential backoff on lock contention (see `DatabaseLockRetry`).
+
+        Parameters:
+        - `write` (callable): The write to run.
+        - `operation` (str): Name of the write in the lock retry statistics.
+
+        Returns:
+        - The return value of the write.
+        """
+        def atomic_write():
+            with transaction.atomic():
+                return write()
+
+        return database_lock_retry.run(atomic_write, operation=operation)
+
+    def get_prefix_range(self, prefix):
+        """
+        Returns the lookup matching the codes starting with a prefix as a range on `code`.
+
+        Unlike `code__startswith` (a LIKE on SQLite, which is case-insensitive and cannot use the
+        unique index of `code`), the range is resolved with an index range scan.
+
+        Parameters:
+        - `prefix` (str): The normalized code prefix.
+
+        Returns:
+        - dict: Keyword arguments to filter a Voucher queryset with.
+        """
+        return {
+            'code__gte': prefix,
+            'code__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1),
+        }
+
+    def filter_vouchers(self, queryset, search=None, is_active=None, redemption_type=None, expired=None):
+        """
+        Filters a Voucher queryset for the voucher list.
+
+        Parameters:
+        - `queryset` (QuerySet): The vouchers to filter.
+        - `search` (str): Normalized prefix of the voucher codes, matched as a range on the index of `code`.
+        - `is_active` (bool): Active status of the vouchers (None for any).
+        - `redemption_type` (str): Redemption type of the vouchers (empty for any).
+        - `expired` (bool): Whether the vouchers are expired (None for any).
+
+        Returns:
+        - QuerySet: The filtered vouchers.
+        """
+        if search:
+            queryset = queryset.filter(**self.get_prefix_range(search))
+        if is_active is not None:
+            queryset = queryset.filter(is_active=is_active)
+        if redemption_type:
+            queryset = queryset.filter(redemption_type=redemption_type)
+        if expired is not None:
+            expired_filter = Q(expiration_date__lte=timezone.now())
+            queryset = queryset.filter(expired_filter) if expired else queryset.exclude(expired_filter)
+        return queryset
+
+    def get_keyset_segments(self, field, descending):
+        """
+        Returns the segments of a list sorted by a field then by ID, in the order they are read.
+
+        Vouchers without a value for a nullable field are sorted as the lowest values. They are read as a
+        separate segment (before the others in ascending order, after them in descending order), so every
+        segment is a range of the index on the field and the ID.
+
+        Returns:
+        - list: Tuples of whether the segment holds the NULL values, its filter and its ordering.
+        """
+        pk_ordering = '-id' if descending else 'id'
+        if field.primary_key:
+            return [(False, Q(), [pk_ordering])]
+        value_segment = (
+            False,
+            Q(**{f'{field.name}__isnull': False}) if field.null else Q(),
+            [f'-{field.name}' if descending else field.name, pk_ordering],
+        )
+        if not field.null:
+            return [value_segment]
+        null_segment = (True, Q(**{f'{field.name}__isnull': True}), [pk_ordering])
+        return [value_segment, null_segment] if descending else [null_segment, value_segment]
+
+    def get_keyset_filter(self, field, value, pk, descending):
+        """
+        Returns the filter matching the vouchers of a segment after the voucher with the given field value and ID.
+
+        The filter leads with an inclusive bound on the field, so it is resolved as a seek into the index
+        rather than a scan from the start of the index.
+        """
+        after = 'lt' if descending else 'gt'
+        pk_after = Q(**{f'id__{after}': pk})
+        if field.primary_key or value is None:
+            return pk_after
+        return Q(**{f'{field.name}__{after}e': value}) & (Q(**{f'{field.name}__{after}': value}) | pk_after)
+
+    def encode_list_cursor(self, direction, field, voucher):
+        value = field.value_from_object(voucher)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        cursor = json.dumps([direction, value, voucher.pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_list_cursor(self, cursor, field):
+        """
+        Returns the direction, field value and ID of a voucher list cursor, or None if the cursor is invalid.
+        """
+        try:
+            direction, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if direction not in ('next', 'previous') or not isinstance(pk, int):
+                return None
+            return direction, field.to_python(value), pk
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    def get_voucher_page(self, queryset, sort='', cursor=None, page_size=None):
+        """
+        Returns a page of the voucher list, using keyset pagination.
+
+        Pages are positioned after (or before) the sort value and ID of the last (or first) voucher of the
+        page the cursor was taken from, instead of with OFFSET, and the vouchers are not counted, so the cost
+        of a page does not grow with the number of vouchers (given an index on the sort field and the ID).
+
+        Parameters:
+        - `queryset` (QuerySet): The (filtered) vouchers to list.
+        - `sort` (str): Field the vouchers are sorted by, prefixed with `-` for a descending order (by ID if empty).
+        - `cursor` (str): Cursor of the page, as returned in `next_cursor` or `previous_cursor` (first page if None).
+        - `page_size` (int): Number of vouchers per page (default: `list_page_size`).
+
+        Returns:
+        - dict: The `vouchers` of the page, and the `next_cursor` and `previous_cursor` (None if there is no such page).
+        """
+        page_size = page_size or self.list_page_size
+        descending = sort.startswith('-')
+        field = Voucher._meta.get_field(sort.lstrip('-') or 'id')
+        position = self.decode_list_cursor(cursor, field) if cursor else None
+        backwards = position is not None and position[0] == 'previous'
+        segments = self.get_keyset_segments(field, descending != backwards)
+        if position is not None:
+            position_in_nulls = field.null and position[1] is None
+            segments = segments[[null_values for null_values, *rest in segments].index(position_in_nulls):]
+        vouchers = []
+        for index, (null_values, segment_filter, ordering) in enumerate(segments):
+            segment = queryset.filter(segment_filter)
+            if position is not None and index == 0:
+                segment = segment.filter(self.get_keyset_filter(field, position[1], position[2], descending != backwards))
+            vouchers += segment.order_by(*ordering)[:page_size + 1 - len(vouchers)]
+            if len(vouchers) > page_size:
+                break
+        has_more = len(vouchers) > page_size
+        vouchers = vouchers[:page_size]
+        if backwards:
+            vouchers.reverse()
+        page = {'vouchers': vouchers, 'next_cursor': None, 'previous_cursor': None}
+        if vouchers:
+            if has_more or backwards:
+                page['next_cursor'] = self.encode_list_cursor('next', field, vouchers[-1])
+            if (position is not None and not backwards) or (backwards and has_more):
+                page['previous_cursor'] = self.encode_list_cursor('previous', field, vouchers[0])
+        return page
+
+    def insert_vouchers(self, codes, voucher_fields):
+        """
+        Inserts vouchers sharing the same field values except their code, skipping the codes already in use.
+
+        The field values are converted to their database representation once, and the rows are
+        inserted in code order with a single `executemany`, skipping the per-object overhead of `bulk_create`.
+        The version of the voucher catalog is incremented if any voucher is inserted.
+
+        Parameters:
+        - `codes` (iterable): The normalized codes of the vouchers to insert.
+        - `voucher_fields` (dict): Values of the other voucher fields.
+
+        Returns:
+        - int: Number of vouchers inserted.
+        """
+        template = Voucher(**voucher_fields)
+        fields = [field for field in Voucher._meta.concrete_fields if not field.primary_key]
+        values = [field.get_db_prep_save(field.pre_save(template, True), connection) for field in fields]
+        code_index = fields.index(Voucher._meta.get_field('code'))
+        quote_name = connection.ops.quote_name
+        sql = '{insert} {table} ({columns}) VALUES ({placeholders}){on_conflict}'.format(
+            insert=connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            table=quote_name(Voucher._meta.db_table),
+            columns=', '.join(quote_name(field.column) for field in fields),
+            placeholders=', '.join(['%s'] * len(fields)),
+            on_conflict=connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None) or '',
+        )
+        values_before_code, values_after_code = tuple(values[:code_index]), tuple(values[code_index + 1:])
+        rows = [values_before_code + (code,) + values_after_code for code in sorted(codes)]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+            inserted = cursor.rowcount
+        if inserted:
+            voucher_versions.bump_catalog()
+        return inserted
+
+    def update_voucher_fields(self, vouchers, field_names):
+        """
+        Updates some fields of vouchers, and increments their versions, with a single `executemany`.
+
+        Unlike `bulk_update`, whose statement grows with a `CASE` per field over all the vouchers, every voucher
+        is updated by the same short statement, and the versions are incremented in the database.
+        The version of the voucher catalog is incremented if any voucher is updated.
+
+        Parameters:
+        - `vouchers` (list): Voucher instances with the new values of the fields.
+        - `field_names` (iterable): Names of the fields to update.
+
+        Returns:
+        - int: Number of vouchers updated.
+        """
+        fields = [Voucher._meta.get_field(field_name) for field_name in field_names]
+        updated_at_field = Voucher._meta.get_field('updated_at')
+        version_column = connection.ops.quote_name(Voucher._meta.get_field('version').column)
+        quote_name = connection.ops.quote_name
+        sql = 'UPDATE {table} SET {assignments}, {version} = {version} + 1, {updated_at} = %s WHERE {pk} = %s'.format(
+            table=quote_name(Voucher._meta.db_table),
+            assignments=', '.join(f'{quote_name(field.column)} = %s' for field in fields),
+            version=version_column,
+            updated_at=quote_name(updated_at_field.column),
+            pk=quote_name(Voucher._meta.pk.column),
+        )
+        updated_at = updated_at_field.get_db_prep_save(timezone.now(), connection)
+        rows = [
+            tuple(field.get_db_prep_save(getattr(voucher, field.attname), connection) for field in fields)
+            + (updated_at, voucher.pk)
+            for voucher in vouchers
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+            updated = cursor.rowcount
+        if updated:
+            voucher_versions.bump_catalog()
+        return updated
+
+    def generate_voucher_codes(self, count, length, alphabet, prefix=''):
+        """
+        Generates distinct random voucher codes.
+
+        Random bytes from the `secrets` module are mapped onto the alphabet with `bytes.translate`,
+        discarding the bytes that would make some characters more likely than others.
+
+        Parameters:
+        - `count` (int): Number of codes to generate.
+        - `length` (int): Number of random characters of each code.
+        - `alphabet` (str): Characters the random part of the codes is made of.
+        - `prefix` (str): Prefix of every code.
+
+        Returns:
+        - set: `count` distinct voucher codes.
+        """
+        alphabet_size = len(alphabet)
+        unbiased_limit = 256 - 256 % alphabet_size
+        table = bytes(ord(alphabet[byte % alphabet_size]) for byte in range(256))
+        rejected_bytes = bytes(range(unbiased_limit, 256))
+        codes = set()
+        while len(codes) < count:
+            missing_codes = count - len(codes)
+            random_bytes = secrets.token_bytes(missing_codes * length * 256 // unbiased_limit + length)
+            characters = random_bytes.translate(table, rejected_bytes).decode('ascii')
+            for start in range(0, min(len(characters) - length + 1, missing_codes * length), length):
+                codes.add(prefix + characters[start:start + length])
+        return codes
+
+    def generate_vouchers(
+        self,
+        count,
+        length=None,
+        alphabet=None,
+        prefix='',
+        resume=False,
+        batch_size=None,
+        progress=None,
+        **voucher_fields,
+    ):
+        """
+        Generates vouchers with distinct random codes in bulk.
+
+        Codes are generated and inserted in batches, each in its own transaction (retried on lock
+        contention), so a failure only loses the batch being inserted. Codes that turn out to be in use
+        already are skipped by the insert and replaced by the next batch. The number of vouchers to generate
+        is checked against the codes still free (the possible codes minus the existing codes with the prefix
+        and length), and the generation gives up after `generation_max_idle_batches` batches in a row
+        that only drew codes in use.
+
+        Parameters:
+        - `count` (int): Number of vouchers to generate (with `resume`, the total number of vouchers with the prefix).
+        - `length` (int): Number of random characters of each code (default: `code_length`).
+        - `alphabet` (str): Characters the random part of the codes is made of (default: `code_alphabet`).
+        - `prefix` (str): Prefix of every code.
+        - `resume` (bool): Whether to only generate the vouchers missing to reach `count` vouchers with the prefix.
+        - `batch_size` (int): Number of vouchers inserted per transaction (default: `generation_batch_size`).
+        - `progress` (callable): Called with the number of vouchers created so far and the number to create after each batch.
+        - `voucher_fields`: Values of the other voucher fields (e.g. `discount_percentage`, `redemption_type`,
+          `redemption_limit`, `expiration_date`, `description`).
+
+        Returns:
+        - int: Number of vouchers created.
+
+        Raises:
+        - ValueError: If the parameters cannot produce `count` distinct valid codes, or no free code was drawn
+          for `generation_max_idle_batches` batches in a row.
+        - ValidationError: If the voucher field values are invalid.
+        """
+        length = length or self.code_length
+        alphabet = ''.join(dict.fromkeys(Voucher.normalize_code(alphabet or self.code_alphabet)))
+        prefix = Voucher.normalize_code(prefix) or ''
+        batch_size = batch_size or self.generation_batch_size
+        max_code_length = Voucher._meta.get_field('code').max_length
+        if len(prefix) + length > max_code_length:
+            raise ValueError(f'Voucher codes cannot be longer than {max_code_length} characters (prefix included)')
+        if not alphabet.isascii() or not alphabet.isprintable() or ' ' in alphabet:
+            raise ValueError('The code alphabet can only contain printable ASCII characters other than spaces')
+        if len(alphabet) < 2:
+            raise ValueError('The code alphabet needs at least 2 distinct characters')
+        if resume:
+            if not prefix:
+                raise ValueError('Resuming a voucher generation requires a prefix')
+            count -= Voucher.objects.filter(**self.get_prefix_range(prefix)).count()
+        if count <= 0:
+            return 0
+        existing_codes = Voucher.objects.filter(**self.get_prefix_range(prefix)) if prefix else Voucher.objects.all()
+        existing_codes = existing_codes.annotate(code_length=Length('code')).filter(code_length=len(prefix) + length)
+        free_codes = len(alphabet) ** length - existing_codes.count()
+        if free_codes < count * 2:
+            raise ValueError(
+                f'The code alphabet and length are too small for the number of vouchers to generate: '
+                f'{max(free_codes, 0)} codes are free for {count} vouchers (at least twice as many are needed)'
+            )
+
+        voucher_fields['redemption_limit'] = self.voucher_redemption_service.get_redemption_limit_from_data({
+            'redemption_type': voucher_fields.get('redemption_type', Voucher.SINGLE_REDEMPTION),
+            'x_times_redemption_limit': voucher_fields.get('redemption_limit'),
+        })
+        Voucher(**voucher_fields).full_clean(exclude=['code'], validate_unique=False)
+
+        created = 0
+        idle_batches = 0
+        while created < count:
+            codes = self.generate_voucher_codes(min(batch_size, count - created), length, alphabet, prefix)
+            inserted = self.write_voucher(lambda: self.insert_vouchers(codes, voucher_fields), 'generate_vouchers')
+            created += inserted
+            idle_batches = 0 if inserted else idle_batches + 1
+            if idle_batches >= self.generation_max_idle_batches:
+                raise ValueError(
+                    f'Gave up generating vouchers after {idle_batches} batches of codes all in use already '
+                    f'({created} of {count} vouchers created)'
+                )
+            for code in codes:
+                voucher_code_filter.add(code)
+            if progress:
+                progress(created, count)
+        return created
+
+    def deactivate_expired_vouchers(self, now=None, batch_size=None, pause=0, progress=None):
+        """
+        Deactivates the active vouchers that have expired, in batches.
+
+        The IDs of each batch are read from the (is_active, expiration_date) index, then the batch is
+        deactivated by a conditional UPDATE (skipping vouchers reactivated or extended in the meantime)
+        in its own short transaction (retried on lock contention), so the write lock is only held for one
+        batch at a time and redemptions can proceed between batches. The versions of the vouchers and of the voucher catalog
+        are incremented, and the cached snapshots of the vouchers are invalidated once each batch commits.
+
+        Parameters:
+        - `now` (datetime): Date the vouchers are expired at (default: the start of the sweep).
+        - `batch_size` (int): Number of vouchers deactivated per transaction (default: `expiration_batch_size`).
+        - `pause` (float): Number of seconds to sleep between batches.
+        - `progress` (callable): Called with the number of vouchers deactivated so far after each batch.
+
+        Returns:
+        - int: Number of vouchers deactivated.
+        """
+        now = now or timezone.now()
+        batch_size = batch_size or self.expiration_batch_size
+        # `is_active=True` is compiled to a bare column on SQLite, which cannot lead a seek into the index.
+        expired_vouchers = Voucher.objects.filter(is_active__in=[True], expiration_date__lte=now)
+        deactivated = 0
+        while True:
+            voucher_ids = list(expired_vouchers.order_by('expiration_date').values_list('id', flat=True)[:batch_size])
+            if not voucher_ids:
+                break
+
+            def deactivate():
+                updated = expired_vouchers.filter(id__in=voucher_ids).update(
+                    is_active=False,
+                    version=F('version') + 1,
+                    updated_at=timezone.now(),
+                )
+                if updated:
+                    voucher_versions.bump_catalog()
+                    transaction.on_commit(lambda voucher_ids=voucher_ids: voucher_cache.invalidate_many(voucher_ids))
+                return updated
+
+            deactivated += self.write_voucher(deactivate, 'expire_vouchers')
+            if progress:
+                progress(deactivated)
+            if len(voucher_ids) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return deactivated
+
+    def get_voucher_ids_by_code(self, codes):
+        """
+        Returns the IDs of the vouchers with the given codes.
+
+        Parameters:
+        - `codes` (iterable): The normalized voucher codes to look up.
+
+        Returns:
+        - dict: Voucher IDs keyed by code, for the codes in use.
+        """
+        codes = list(codes)
+        chunk_size = connection.features.max_query_params or len(codes)
+        voucher_ids = {}
+        for start in range(0, len(codes), chunk_size):
+            voucher_ids.update(
+                Voucher.objects.filter(code__in=codes[start:start + chunk_size]).values_list('code', 'id')
+            )
+        return voucher_ids
+
+    def read_voucher_rows(self, file, file_format):
+        """
+        Reads the rows of a voucher import file one at a time.
+
+        Parameters:
+        - `file` (file): Text file object of the import file.
+        - `file_format` (str): `csv` (with a header row) or `jsonl` (one JSON object per line).
+
+        Yields:
+        - tuple: The line number of the row and the row as a dict (None if the line is not a JSON object).
+        """
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        elif file_format == 'jsonl':
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else None
+        else:
+            raise ValueError(f'Unsupported voucher import format: {file_format}')
+
+    def upsert_vouchers(self, vouchers):
+        """
+        Creates the given vouchers, or updates the `import_update_fields` of the existing vouchers with the same codes,
+        in one transaction (retried on lock contention). The versions of the updated vouchers and of the voucher
+        catalog are incremented.
+
+        Parameters:
+        - `vouchers` (list): Unsaved Voucher instances with distinct normalized codes.
+
+        Returns:
+        - int: Number of vouchers that already existed and were updated.
+        """
+        def upsert():
+            existing_voucher_ids = list(self.get_voucher_ids_by_code(voucher.code for voucher in vouchers).values())
+            for voucher in vouchers:
+                # IDs set by an attempt rolled back on lock contention.
+                voucher.id = None
+            Voucher.objects.bulk_create(
+                vouchers,
+                update_conflicts=True,
+                unique_fields=['code'],
+                update_fields=self.import_update_fields + ['updated_at'],
+            )
+            chunk_size = connection.features.max_query_params or len(existing_voucher_ids) or 1
+            for start in range(0, len(existing_voucher_ids), chunk_size):
+                Voucher.objects.filter(id__in=existing_voucher_ids[start:start + chunk_size]).update(
+                    version=F('version') + 1,
+                )
+            voucher_versions.bump_catalog()
+            transaction.on_commit(lambda: voucher_cache.invalidate_many(existing_voucher_ids))
+            return len(existing_voucher_ids)
+
+        updated = self.write_voucher(upsert, 'import_vouchers')
+        for voucher in vouchers:
+            voucher_code_filter.add(voucher.code)
+        return updated
+
+    def import_vouchers(self, rows, batch_size=None, reject=None):
+        """
+        Imports vouchers from rows validated with the rules of `CreateVoucherForm`.
+
+        Valid rows are upserted by code in batches, each in its own transaction, so memory use does not
+        depend on the number of rows. When a code appears several times, its last row wins.
+
+        Parameters:
+        - `rows` (iterable): Tuples of a line number and a row dict (or None for unreadable rows), as
+          yielded by `read_voucher_rows`. `redemption_limit` is accepted as `x_times_redemption_limit`.
+        - `batch_size` (int): Number of vouchers upserted per transaction (default: `import_batch_size`).
+        - `reject` (callable): Called with the line number, row and errors of each rejected row.
+
+        Returns:
+        - dict: Number of `created`, `updated` and `rejected` rows.
+        """
+        batch_size = batch_size or self.import_batch_size
+        results = {'created': 0, 'updated': 0, 'rejected': 0}
+        vouchers = {}
+
+        def flush():
+            updated = self.upsert_vouchers(list(vouchers.values()))
+            results['updated'] += updated
+            results['created'] += len(vouchers) - updated
+            vouchers.clear()
+
+        for line_number, row in rows:
+            if row is None:
+                errors = {'__all__': ['Row is not a JSON object']}
+            else:
+                data = dict(row)
+                data.setdefault('x_times_redemption_limit', data.get('redemption_limit'))
+                form_cleaned_data, errors = CreateVoucherForm.clean_data(data)
+            if errors:
+                results['rejected'] += 1
+                if reject:
+                    reject(line_number, row, errors)
+                continue
+            code = form_cleaned_data.get('code')
+            vouchers.pop(code, None)
+            vouchers[code] = Voucher(
+                code=code,
+                discount_percentage=form_cleaned_data.get('discount_percentage'),
+                description=form_cleaned_data.get('description'),
+                redemption_type=form_cleaned_data.get('redemption_type'),
+                redemption_limit=self.voucher_redemption_service.get_redemption_limit_from_data(form_cleaned_data),
+                expiration_date=form_cleaned_data.get('expiration_date'),
+            )
+            if len(vouchers) >= batch_size:
+                flush()
+        if vouchers:
+            flush()
+        return results
@@ -0,0 +1,67 @@
+import contextlib
+import contextvars
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import voucher_cache
+from .code_filter import voucher_code_filter
+from .models import Voucher
+from .versions import voucher_versions
+
+voucher_signals_suppressed = contextvars.ContextVar('voucher_signals_suppressed', default=False)
+
+
+@contextlib.contextmanager
+def suppress_voucher_signals():
+    """
+    Disables the handlers below in the current context, for bulk writes invalidating the cache, bumping
+    the catalog version and updating the code filter once per batch of vouchers instead of once per voucher.
+    """
+    token = voucher_signals_suppressed.set(True)
+    try:
+        yield
+    finally:
+        voucher_signals_suppressed.reset(token)
+
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+def invalidate_voucher_cache(sender, instance, **kwargs):
+    """
+    Invalidates the cached snapshot of a voucher once the transaction saving or deleting it commits.
+    """
+    if voucher_signals_suppressed.get():
+        return
+    voucher_id = instance.id
+    transaction.on_commit(lambda: voucher_cache.invalidate(voucher_id))
+
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+def bump_voucher_catalog_version(sender, instance, **kwargs):
+    """
+    Increments the version of the voucher catalog in the transaction saving or deleting a voucher.
+    """
+    if voucher_signals_suppressed.get():
+        return
+    voucher_versions.bump_catalog()
+
+
+@receiver(post_save, sender=Voucher)
+def add_voucher_code(sender, instance, **kwargs):
+    """
+    Adds the code of a saved voucher to the voucher code filter.
+    """
+    if voucher_signals_suppressed.get():
+        return
+    voucher_code_filter.add(instance.code)
+
+
+@receiver(post_delete, sender=Voucher)
+def discard_voucher_code(sender, instance, **kwargs):
+    """
+    Marks the code of a deleted voucher as stale in the voucher code filter.
+    """
+    if voucher_signals_suppressed.get():
+        return
+    voucher_code_filter.discard(instance.code)
@@ -1,3 +1,397 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from voucher_redemption.services import VoucherRedemptionService
+from .cache import voucher_cache
+from .code_filter import BloomFilter, VoucherCodeFilter
+from .forms import UpdateVoucherForm
+from .models import Voucher
+from .versions import voucher_versions
+from .services import VoucherManagementService
 
-# Create your tests here.
+
+class VoucherCodeNormalizationTests(TestCase):
+    """
+    Tests that voucher codes are stored trimmed and in upper case, and looked up case-insensitively.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_codes_are_normalized(self):
+        voucher = Voucher.objects.create(code=' spring\t')
+        self.assertEqual(voucher.code, 'SPRING')
+        self.assertEqual(VoucherManagementService().get_voucher_by_code('Spring\n'), voucher)
+        form = UpdateVoucherForm({'code': ' summer ', 'is_active': True})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['code'], 'SUMMER')
+        self.assertIn('is_active', form.fields)
+
+    def test_constraint_rejects_unnormalized_codes(self):
+        for code in ('lower', ' PADDED'):
+            with self.subTest(code=code), self.assertRaises(IntegrityError), transaction.atomic():
+                Voucher.objects.bulk_create([Voucher(code=code)])
+
+
+class NormalizeVoucherCodesMigrationTests(TransactionTestCase):
+    """
+    Tests that the migration adding the voucher code constraint normalizes the existing codes
+    as `Voucher.normalize_code` does.
+    """
+
+    migrate_from = [('voucher_management', '0005_voucher_redemption_limit')]
+    migrate_to = [('voucher_management', '0006_voucher_code_normalized')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_codes_are_normalized_in_python(self):
+        HistoricalVoucher = self.apps.get_model('voucher_management', 'Voucher')
+        HistoricalVoucher.objects.bulk_create([
+            HistoricalVoucher(code='\tTAB\n'),
+            HistoricalVoucher(code='éCOLE'),
+            HistoricalVoucher(code='DONE'),
+        ])
+        MigrationExecutor(connection).migrate(self.migrate_to)
+        self.assertEqual(sorted(Voucher.objects.values_list('code', flat=True)), ['DONE', 'TAB', 'ÉCOLE'])
+
+
+class VoucherCacheTests(TestCase):
+    """
+    Tests that cached vouchers are served without queries, and invalidated when their voucher is written.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.voucher = Voucher.objects.create(code='CACHED', discount_percentage=10)
+
+    def test_cached_voucher_costs_no_query(self):
+        self.assertEqual(voucher_cache.get_by_code('CACHED'), self.voucher)
+        with self.assertNumQueries(0):
+            self.assertEqual(voucher_cache.get_by_code('CACHED').discount_percentage, 10)
+            self.assertEqual(voucher_cache.get(self.voucher.id).code, 'CACHED')
+
+    def test_save_invalidates_voucher(self):
+        voucher_cache.get(self.voucher.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.voucher.discount_percentage = 25
+            self.voucher.code = 'RENAMED'
+            self.voucher.save()
+        self.assertEqual(voucher_cache.get(self.voucher.id).discount_percentage, 25)
+        self.assertIsNone(voucher_cache.get_by_code('CACHED'))
+        self.assertEqual(voucher_cache.get_by_code('RENAMED'), self.voucher)
+
+    def test_delete_invalidates_voucher(self):
+        voucher_cache.get_by_code('CACHED')
+        with self.captureOnCommitCallbacks(execute=True):
+            Voucher.objects.get(pk=self.voucher.pk).delete()
+        self.assertIsNone(voucher_cache.get(self.voucher.id))
+        self.assertIsNone(voucher_cache.get_by_code('CACHED'))
+
+    def test_redemption_invalidates_voucher(self):
+        user = User.objects.create_user('cached')
+        voucher_cache.get(self.voucher.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(VoucherRedemptionService().redeem(user, self.voucher), VoucherRedemptionService.REDEEMED)
+        self.assertEqual(voucher_cache.get(self.voucher.id).redemption_count, 1)
+
+
+class VoucherCodeFilterTests(TestCase):
+    """
+    Tests that the voucher code filter of a process picks up the vouchers written and the rebuilds
+    requested by other processes (simulated by a filter not notified of the writes).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.voucher = Voucher.objects.create(code='FILTERED')
+        self.code_filter = VoucherCodeFilter()
+        self.code_filter.build()
+
+    def test_refresh_adds_codes_written_elsewhere(self):
+        self.assertTrue(self.code_filter.contains('FILTERED'))
+        self.assertFalse(self.code_filter.contains('RENAMED'))
+        self.voucher.code = 'RENAMED'
+        self.voucher.save()
+        Voucher.objects.create(code='CREATED')
+        self.code_filter.refresh()
+        self.assertTrue(self.code_filter.contains('RENAMED'))
+        self.assertTrue(self.code_filter.contains('CREATED'))
+
+    def test_refresh_of_unchanged_catalog_only_reads_its_version(self):
+        with self.assertNumQueries(1):
+            self.code_filter.refresh()
+
+    def test_rebuild_requested_elsewhere(self):
+        generation = self.code_filter.generation
+        VoucherCodeFilter().request_rebuild()
+        self.code_filter.refresh()
+        self.assertEqual(self.code_filter.generation, generation + 1)
+
+    def test_codes_added_again_are_counted_once(self):
+        bloom_filter = BloomFilter(100, 0.01)
+        bloom_filter.add('TWICE')
+        bloom_filter.add('TWICE')
+        self.assertIn('TWICE', bloom_filter)
+        self.assertEqual(bloom_filter.count, 1)
+
+
+class GenerateVouchersTests(TestCase):
+    """
+    Tests the bulk generation of vouchers with random codes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherManagementService()
+
+    def test_generates_distinct_codes_in_batches(self):
+        batches = []
+        created = self.service.generate_vouchers(
+            25, length=6, prefix='gen-', batch_size=10, progress=lambda created, total: batches.append(created),
+            discount_percentage=15,
+        )
+        self.assertEqual(created, 25)
+        self.assertEqual(batches, [10, 20, 25])
+        vouchers = Voucher.objects.filter(code__startswith='GEN-')
+        self.assertEqual(vouchers.count(), 25)
+        self.assertTrue(all(len(voucher.code) == 10 and voucher.discount_percentage == 15 for voucher in vouchers))
+
+    def test_resume_generates_missing_vouchers(self):
+        self.service.generate_vouchers(5, length=6, prefix='RES-')
+        self.assertEqual(self.service.generate_vouchers(8, length=6, prefix='RES-', resume=True), 3)
+        self.assertEqual(self.service.generate_vouchers(8, length=6, prefix='RES-', resume=True), 0)
+
+    def test_existing_codes_reduce_free_codes(self):
+        # 2 characters of a 2 letter alphabet give 4 codes, 2 of which exist.
+        Voucher.objects.bulk_create([Voucher(code='FULL-AB'), Voucher(code='FULL-BA')])
+        self.assertEqual(self.service.generate_vouchers(1, length=2, alphabet='AB', prefix='FULL-'), 1)
+        with self.assertRaisesMessage(ValueError, '1 codes are free for 1 vouchers'):
+            self.service.generate_vouchers(1, length=2, alphabet='AB', prefix='FULL-')
+
+    def test_gives_up_when_only_codes_in_use_are_drawn(self):
+        Voucher.objects.create(code='TAKEN-AAAA')
+        with mock.patch.object(self.service, 'generate_voucher_codes', return_value={'TAKEN-AAAA'}):
+            with self.assertRaisesMessage(ValueError, '0 of 1 vouchers created'):
+                self.service.generate_vouchers(1, length=4, alphabet='AB', prefix='TAKEN-')
+        self.assertEqual(Voucher.objects.filter(code__startswith='TAKEN-').count(), 1)
+
+
+class ImportVouchersTests(TestCase):
+    """
+    Tests the streamed import of vouchers from CSV and JSONL files.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherManagementService()
+        self.existing = Voucher.objects.create(code='EXISTING', discount_percentage=5, redemption_count=3)
+
+    def import_file(self, content, file_format, **kwargs):
+        rejected = []
+        results = self.service.import_vouchers(
+            self.service.read_voucher_rows(io.StringIO(content), file_format),
+            reject=lambda line_number, row, errors: rejected.append((line_number, sorted(errors))),
+            **kwargs,
+        )
+        return results, rejected
+
+    def test_csv_rows_are_upserted_in_batches(self):
+        content = (
+            'code,description,discount_percentage,redemption_type,redemption_limit\n'
+            'new1,First,10,single,\n'
+            'existing,Updated,20,x_times,4\n'
+            'new2,Second,-1,single,\n'
+            'new1,First again,15,multiple,\n'
+            'new3,Third,30,single,\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            results, rejected = self.import_file(content, 'csv', batch_size=2)
+        # NEW1 is created by the first batch and updated by the second one.
+        self.assertEqual(results, {'created': 2, 'updated': 2, 'rejected': 1})
+        self.assertEqual(rejected, [(4, ['discount_percentage'])])
+        self.existing.refresh_from_db()
+        self.assertEqual(
+            (self.existing.description, self.existing.discount_percentage, self.existing.redemption_limit),
+            ('Updated', 20, 4),
+        )
+        self.assertEqual((self.existing.redemption_count, self.existing.version), (3, 2))
+        self.assertEqual(Voucher.objects.get(code='NEW1').discount_percentage, 15)
+        self.assertEqual(Voucher.objects.get(code='NEW3').discount_percentage, 30)
+
+    def test_jsonl_rejects_lines_that_are_not_objects(self):
+        content = '{"code": "json1", "discount_percentage": 5, "redemption_type": "single"}\n\n[1, 2]\nnot json\n'
+        results, rejected = self.import_file(content, 'jsonl')
+        self.assertEqual(results, {'created': 1, 'updated': 0, 'rejected': 2})
+        self.assertEqual([line_number for line_number, errors in rejected], [3, 4])
+        self.assertTrue(Voucher.objects.filter(code='JSON1').exists())
+
+    def test_command_writes_rejected_rows_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'vouchers.csv')
+            with open(path, 'w', newline='') as file:
+                file.write('code,discount_percentage,redemption_type\nFILE1,10,single\nFILE2,10,unknown\n')
+            call_command('import_vouchers', path, stdout=io.StringIO())
+            with open(f'{path}.rejected.csv') as report:
+                report_rows = list(csv.reader(report))
+        self.assertEqual(len(report_rows), 2)
+        self.assertEqual(report_rows[1][0], '3')
+        self.assertEqual(list(json.loads(report_rows[1][1])), ['redemption_type'])
+        self.assertEqual(json.loads(report_rows[1][2])['code'], 'FILE2')
+        self.assertTrue(Voucher.objects.filter(code='FILE1').exists())
+        self.assertFalse(Voucher.objects.filter(code='FILE2').exists())
+
+
+class VoucherListTests(TestCase):
+    """
+    Tests the search, filters, sorting and keyset pagination of the voucher management list.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.vouchers = Voucher.objects.bulk_create(
+            Voucher(
+                code=code,
+                discount_percentage=discount_percentage,
+                expiration_date=now + datetime.timedelta(days=days) if days is not None else None,
+                is_active=is_active,
+            )
+            for code, discount_percentage, days, is_active in [
+                ('LIST-A', 10, 5, True),
+                ('LIST-B', 20, None, True),
+                ('LIST-C', 10, -1, False),
+                ('LIST-D', 30, None, True),
+                ('LIST-E', 20, 5, True),
+                ('OTHER', 10, 1, True),
+            ]
+        )
+        cls.user = User.objects.create_user('lister', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherManagementService()
+
+    def walk(self, sort, page_size=2):
+        """
+        Returns the codes of every page read forwards, then of every page read backwards from the last one.
+        """
+        vouchers = self.service.filter_vouchers(Voucher.objects.all(), search='LIST-')
+        page = self.service.get_voucher_page(vouchers, sort=sort, page_size=page_size)
+        self.assertIsNone(page['previous_cursor'])
+        forward_pages = [[voucher.code for voucher in page['vouchers']]]
+        while page['next_cursor']:
+            page = self.service.get_voucher_page(vouchers, sort=sort, cursor=page['next_cursor'], page_size=page_size)
+            forward_pages.append([voucher.code for voucher in page['vouchers']])
+        backward_pages = [forward_pages[-1]]
+        while page['previous_cursor']:
+            page = self.service.get_voucher_page(vouchers, sort=sort, cursor=page['previous_cursor'], page_size=page_size)
+            backward_pages.insert(0, [voucher.code for voucher in page['vouchers']])
+        return forward_pages, backward_pages
+
+    def test_pages_follow_the_sort_order(self):
+        expected_orders = {
+            '': ['LIST-A', 'LIST-B', 'LIST-C', 'LIST-D', 'LIST-E'],
+            '-discount_percentage': ['LIST-D', 'LIST-E', 'LIST-B', 'LIST-C', 'LIST-A'],
+            'expiration_date': ['LIST-B', 'LIST-D', 'LIST-C', 'LIST-A', 'LIST-E'],
+            '-expiration_date': ['LIST-E', 'LIST-A', 'LIST-C', 'LIST-D', 'LIST-B'],
+        }
+        for sort, expected_order in expected_orders.items():
+            for page_size in (1, 2, 5):
+                with self.subTest(sort=sort, page_size=page_size):
+                    forward_pages, backward_pages = self.walk(sort, page_size)
+                    expected_pages = [expected_order[i:i + page_size] for i in range(0, len(expected_order), page_size)]
+                    self.assertEqual(forward_pages, expected_pages)
+                    self.assertEqual(backward_pages, expected_pages)
+
+    def test_filters(self):
+        vouchers = Voucher.objects.all()
+        filter_vouchers = self.service.filter_vouchers
+        self.assertEqual(filter_vouchers(vouchers, search='LIST-').count(), 5)
+        self.assertEqual(filter_vouchers(vouchers, is_active=False).get().code, 'LIST-C')
+        self.assertEqual(filter_vouchers(vouchers, expired=True).get().code, 'LIST-C')
+        self.assertEqual(filter_vouchers(vouchers, search='LIST-', expired=False, is_active=True).count(), 4)
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = self.service.get_voucher_page(Voucher.objects.all(), sort='code', cursor='invalid', page_size=2)
+        self.assertEqual([voucher.code for voucher in page['vouchers']], ['LIST-A', 'LIST-B'])
+
+    def test_view_renders_filtered_page_and_answers_unchanged_list_with_304(self):
+        self.client.force_login(self.user)
+        url = reverse('voucher_list')
+        response = self.client.get(url, {'search': 'list-', 'sort': '-discount_percentage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([voucher.code for voucher in response.context['vouchers']][:2], ['LIST-D', 'LIST-E'])
+        etag = response['ETag']
+        response = self.client.get(url, {'search': 'list-', 'sort': '-discount_percentage'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Voucher.objects.create(code='LIST-F')
+        response = self.client.get(url, {'search': 'list-', 'sort': '-discount_percentage'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ExpireVouchersTests(TestCase):
+    """
+    Tests that the expiration sweep deactivates the expired vouchers, and only them, in batches.
+    """
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.expired = Voucher.objects.bulk_create(
+            Voucher(code=f'EXPIRED{index}', expiration_date=now - datetime.timedelta(minutes=index + 1))
+            for index in range(5)
+        )
+        Voucher.objects.bulk_create([
+            Voucher(code='FUTURE', expiration_date=now + datetime.timedelta(days=1)),
+            Voucher(code='FOREVER'),
+            Voucher(code='DISABLED', expiration_date=now - datetime.timedelta(days=1), is_active=False),
+        ])
+        self.service = VoucherManagementService()
+
+    def test_sweep_deactivates_expired_vouchers_in_batches(self):
+        voucher_cache.get(self.expired[0].id)
+        catalog_version = voucher_versions.get_catalog_version()[0]
+        batches = []
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.service.deactivate_expired_vouchers(batch_size=2, progress=batches.append), 5)
+        self.assertEqual(batches, [2, 4, 5])
+        self.assertEqual(
+            sorted(Voucher.objects.filter(is_active=True).values_list('code', flat=True)), ['FOREVER', 'FUTURE'],
+        )
+        self.assertEqual(set(Voucher.objects.filter(code__startswith='EXPIRED').values_list('version', flat=True)), {2})
+        self.assertEqual(Voucher.objects.get(code='DISABLED').version, 1)
+        self.assertEqual(voucher_versions.get_catalog_version()[0], catalog_version + 3)
+        self.assertFalse(voucher_cache.get(self.expired[0].id).is_active)
+        self.assertEqual(self.service.deactivate_expired_vouchers(), 0)
+
+    def test_sweep_at_a_given_date(self):
+        now = timezone.now()
+        self.assertEqual(self.service.deactivate_expired_vouchers(now=now - datetime.timedelta(minutes=3)), 3)
+        self.assertEqual(self.service.deactivate_expired_vouchers(now=now + datetime.timedelta(days=2)), 3)
+        self.assertEqual(list(Voucher.objects.filter(is_active=True).values_list('code', flat=True)), ['FOREVER'])
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command('expire_vouchers', batch_size=2, pause=0, stdout=stdout)
+        self.assertIn('Successfully deactivated 5 expired vouchers', stdout.getvalue())
+        with self.assertRaisesMessage(CommandError, '--batch-size must be at least 1'):
+            call_command('expire_vouchers', batch_size=0)
@@ -0,0 +1,85 @@
+import hashlib
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from .models import Voucher, VoucherCatalog
+
+
+class VoucherVersions:
+    """
+    Version stamps of the voucher catalog and of single vouchers, used to answer conditional requests.
+
+    Every voucher has a `version` incremented (and an `updated_at` date set) on each write (see `Voucher.save`),
+    and the catalog has a version, stored in the single `VoucherCatalog` row, incremented in the same transaction
+    as every voucher creation, update and deletion. Redemptions only write their voucher, so concurrent redemptions
+    of different vouchers do not all update the catalog row; listings are versioned by the catalog version and the
+    date of the last voucher write (see `get_listing_version`). An unchanged version guarantees an unchanged
+    voucher (or listing), so responses built from it can be identified by a strong ETag computed from the
+    version alone, without running the main query.
+
+    Attributes:
+    - `catalog_id` (int): Primary key of the `VoucherCatalog` row.
+    """
+
+    catalog_id = 1
+
+    def get_catalog_version(self):
+        """
+        Returns the version of the voucher catalog, creating the catalog row if it does not exist yet.
+
+        Returns:
+        - tuple: The version (int) and the date of the last voucher write (datetime).
+        """
+        catalog = VoucherCatalog.objects.filter(id=self.catalog_id).values_list('version', 'updated_at').first()
+        if catalog is None:
+            catalog, created = VoucherCatalog.objects.get_or_create(id=self.catalog_id)
+            catalog = (catalog.version, catalog.updated_at)
+        return catalog
+
+    def get_listing_version(self):
+        """
+        Returns the version of the voucher listings: the version of the catalog (changed by creations,
+        updates and deletions) and the date of the last voucher write (changed by redemptions too), read
+        from the index on `updated_at`.
+
+        Returns:
+        - tuple: The version (tuple) and the date of the last change (datetime).
+        """
+        catalog_version, catalog_updated_at = self.get_catalog_version()
+        voucher_updated_at = Voucher.objects.aggregate(updated_at=Max('updated_at'))['updated_at']
+        last_modified = max(filter(None, (catalog_updated_at, voucher_updated_at)))
+        return (catalog_version, voucher_updated_at), last_modified
+
+    def bump_catalog(self):
+        """
+        Increments the version of the voucher catalog. Called in the transaction of every voucher creation,
+        update and deletion (for each voucher of a queryset delete), so the statement is written in SQL rather than built by the ORM.
+        """
+        quote_name = connection.ops.quote_name
+        updated_at_field = VoucherCatalog._meta.get_field('updated_at')
+        sql = 'UPDATE {table} SET {version} = {version} + 1, {updated_at} = %s WHERE {pk} = %s'.format(
+            table=quote_name(VoucherCatalog._meta.db_table),
+            version=quote_name(VoucherCatalog._meta.get_field('version').column),
+            updated_at=quote_name(updated_at_field.column),
+            pk=quote_name(VoucherCatalog._meta.pk.column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [updated_at_field.get_db_prep_save(timezone.now(), connection), self.catalog_id])
+            updated = cursor.rowcount
+        if not updated:
+            VoucherCatalog.objects.get_or_create(id=self.catalog_id, defaults={'version': 2})
+
+    def get_etag(self, *parts):
+        """
+        Returns a strong ETag identifying a representation by the versions and request details it depends on.
+
+        Parameters:
+        - `parts`: Values the representation depends on (e.g. a version, the URL and the media type).
+
+        Returns:
+        - str: The quoted ETag.
+        """
+        return '"{}"'.format(hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest())
+
+
+voucher_versions = VoucherVersions()
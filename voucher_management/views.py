@@ -1,8 +1,12 @@
+from django.contrib import messages
 from django.shortcuts import render, redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from dashboard.views import DashboardView
 from .models import Voucher
-from .forms import CreateVoucherForm, UpdateVoucherForm
+from .forms import CreateVoucherForm, UpdateVoucherForm, VoucherListFilterForm
 from .services import VoucherManagementService
+from .versions import voucher_versions
 
 
 class VoucherManagementView(DashboardView):
@@ -31,20 +35,92 @@ class VoucherManagementListView(VoucherManagementView):
     """
     View for listing vouchers and handling voucher creation.
 
+    The list is searched by code prefix, filtered, sorted by column (see `VoucherListFilterForm`) and
+    paginated with cursors (see `VoucherManagementService.get_voucher_page`), so a page costs the same
+    whatever the number of vouchers.
+
+    The page is identified by an ETag derived from the version of the voucher catalog, the URL and the user,
+    so unchanged listings are answered with a 304 without querying the vouchers. The ETag is weak, as the
+    page embeds a CSRF token that differs between renderings. Pages with pending messages, and lists filtered
+    on expiry (which depend on the current time), are always rendered.
+
     Attributes:
     - `create_voucher_form`: Form for creating a new voucher.
+    - `voucher_sort_fields`: Voucher fields the columns of the list can be sorted by, keyed by column name.
     """
 
     create_voucher_form = CreateVoucherForm()
+    voucher_sort_fields = {
+        'Code': 'code',
+        'Discount %': 'discount_percentage',
+        'Redemption Count': 'redemption_count',
+        'Expiry Date': 'expiration_date',
+    }
 
     def get(self, request, *args, **kwargs):
-        vouchers = Voucher.objects.all()
+        version, last_modified = voucher_versions.get_listing_version()
+        etag = 'W/' + voucher_versions.get_etag(
+            version, request.get_full_path(), request.user.pk, request.user.is_staff, request.user.is_superuser,
+        )
+        last_modified = int(last_modified.timestamp())
+        if not len(messages.get_messages(request)) and not request.GET.get('expired'):
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+        response = self.render_list(request)
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_list_url(self, request, **params):
+        """
+        Returns the URL of the list with some query parameters replaced (or removed, when None).
+        """
+        query = request.GET.copy()
+        for name, value in params.items():
+            query.pop(name, None)
+            if value is not None:
+                query[name] = value
+        return f'?{query.urlencode()}'
+
+    def get_voucher_columns(self, request, sort):
+        """
+        Returns the columns of the list, with the URL sorting the list by the column and the current sort direction.
+        """
+        voucher_columns = []
+        for field_name in self.voucher_field_names:
+            sort_field = self.voucher_sort_fields.get(field_name)
+            column = {'name': field_name, 'sort_url': None, 'sort_direction': None}
+            if sort_field:
+                column['sort_url'] = self.get_list_url(request, sort=sort_field if sort != sort_field else f'-{sort_field}', cursor=None)
+                if sort.lstrip('-') == sort_field:
+                    column['sort_direction'] = 'desc' if sort.startswith('-') else 'asc'
+            voucher_columns.append(column)
+        return voucher_columns
+
+    def render_list(self, request):
+        filter_form = VoucherListFilterForm(request.GET)
+        filter_form.is_valid()
+        filters = filter_form.cleaned_data
+        vouchers = self.voucher_management_service.filter_vouchers(
+            Voucher.objects.all(),
+            search=filters.get('search'),
+            is_active=filters.get('is_active'),
+            redemption_type=filters.get('redemption_type'),
+            expired=filters.get('expired'),
+        )
+        sort = filters.get('sort') or ''
+        page = self.voucher_management_service.get_voucher_page(vouchers, sort=sort, cursor=request.GET.get('cursor'))
         user = request.user
         voucher_management_access = user.is_staff or user.is_superuser
         context = {
             'voucher_management_access': voucher_management_access,
             'form': self.create_voucher_form,
-            'vouchers': vouchers,
+            'filter_form': filter_form,
+            'vouchers': page['vouchers'],
+            'voucher_columns': self.get_voucher_columns(request, sort),
+            'next_page_url': self.get_list_url(request, cursor=page['next_cursor']) if page['next_cursor'] else None,
+            'previous_page_url': self.get_list_url(request, cursor=page['previous_cursor']) if page['previous_cursor'] else None,
         }
         context.update(self.base_context)
         context.update(self.dashboard_context)
@@ -4,4 +4,21 @@ from . import models
 class VoucherRedemptionAdmin(admin.ModelAdmin):
     pass
 
+
+class ArchivedVoucherRedemptionAdmin(admin.ModelAdmin):
+    """
+    Read-only admin of the archived redemptions, which are only written by the archival.
+    """
+    list_display = ['id', 'user', 'voucher', 'redeemed_at', 'archived_at']
+    list_select_related = ['user', 'voucher']
+    raw_id_fields = ['user', 'voucher']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(models.VoucherRedemption)
+admin.site.register(models.ArchivedVoucherRedemption, ArchivedVoucherRedemptionAdmin)
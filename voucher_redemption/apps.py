@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class VoucherRedemptionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'voucher_redemption'
+
+    def ready(self):
+        from . import signals
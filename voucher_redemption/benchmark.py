@@ -0,0 +1,271 @@
+import logging
+import math
+import multiprocessing
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import constants as message_constants
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from api.services import ApiTokenService
+from voucher_management.code_filter import voucher_code_filter
+from voucher_management.models import Voucher
+from voucher_management.services import VoucherManagementService
+from voucher_system.db_retry import database_lock_retry
+from .models import VoucherRedemption
+from .services import VoucherRedemptionService
+
+
+def get_percentile(latencies, percentile):
+    """
+    Returns a percentile (nearest rank) of sorted latencies.
+    """
+    return latencies[max(math.ceil(percentile / 100 * len(latencies)) - 1, 0)]
+
+
+class RedemptionBenchmark:
+    """
+    Redemption throughput benchmark: seeds vouchers of every redemption type (`REDEMPTION_LIMIT_CHOICES`) and
+    users, drives redemptions of random (user, voucher) pairs from concurrent threads, optionally in several
+    processes, and checks that no voucher exceeded its redemption limit.
+
+    Redemptions are driven in one of the modes:
+    - `SERVICE`: `VoucherRedemptionService.redeem_voucher`, after `VoucherManagementService.get_voucher_by_code`,
+      with a request storing its messages in a cookie.
+    - `VIEW`: the redemption form of `VoucherRedemptionView` through the test client, authenticated by session.
+    - `API`: `POST api/redemptions/` through the test client, authenticated by API token.
+
+    Processes are forked, so they only share file databases; the connections are closed before forking.
+
+    Attributes:
+    - `SERVICE`, `VIEW`, `API`: Modes of the benchmark.
+    - `MODES` (list): Every mode.
+    - `code_prefix` (str): Prefix of the codes of the seeded vouchers.
+    """
+
+    SERVICE = 'service'
+    VIEW = 'view'
+    API = 'api'
+    MODES = [SERVICE, VIEW, API]
+
+    code_prefix = 'BENCH'
+
+    def __init__(self, vouchers_per_type=10, users=200, operations=2000, x_times_limit=50, seed=0):
+        self.vouchers_per_type = vouchers_per_type
+        self.user_count = users
+        self.operations = operations
+        self.x_times_limit = x_times_limit
+        self.seed = seed
+        self.tag = secrets.token_hex(4).upper()
+        self.vouchers = []
+        self.users = []
+        self.session_keys = []
+        self.token_keys = []
+        self.voucher_redemption_service = VoucherRedemptionService()
+        self.voucher_management_service = VoucherManagementService()
+
+    def get_redemption_limit(self, redemption_type):
+        return {
+            Voucher.SINGLE_REDEMPTION: 1,
+            Voucher.MULTIPLE_REDEMPTION: None,
+            Voucher.X_TIMES_REDEMPTION: self.x_times_limit,
+        }[redemption_type]
+
+    def setup(self):
+        """
+        Seeds the vouchers and the users, with a session and an API token per user.
+        """
+        self.vouchers = Voucher.objects.bulk_create(
+            Voucher(
+                code=f'{self.code_prefix}{self.tag}{index:04}',
+                description='Benchmark voucher',
+                redemption_type=redemption_type,
+                redemption_limit=self.get_redemption_limit(redemption_type),
+            )
+            for index, (redemption_type, label) in enumerate(
+                choice for choice in Voucher.REDEMPTION_LIMIT_CHOICES for _ in range(self.vouchers_per_type)
+            )
+        )
+        for voucher in self.vouchers:
+            voucher_code_filter.add(voucher.code)
+        self.users = User.objects.bulk_create(
+            User(username=f'bench-{self.tag}-{index}') for index in range(self.user_count)
+        )
+        api_token_service = ApiTokenService()
+        self.session_keys, self.token_keys = [], []
+        for user in self.users:
+            client = Client()
+            client.force_login(user)
+            self.session_keys.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+            self.token_keys.append(api_token_service.create_token(user, 'Benchmark')[1])
+
+    def teardown(self):
+        """
+        Deletes the seeded vouchers (with their redemptions) and users (with their API tokens).
+        """
+        Voucher.objects.filter(pk__in=[voucher.pk for voucher in self.vouchers]).delete()
+        User.objects.filter(pk__in=[user.pk for user in self.users]).delete()
+
+    def get_plan(self):
+        """
+        Returns the (user index, voucher index) pairs of the redemptions, drawn from the seed.
+        """
+        rng = random.Random(self.seed)
+        return [(rng.randrange(len(self.users)), rng.randrange(len(self.vouchers))) for _ in range(self.operations)]
+
+    def get_view_outcome(self, response):
+        for message in list(get_messages(response.wsgi_request))[-1:]:
+            if message.level == message_constants.SUCCESS:
+                return VoucherRedemptionService.REDEEMED
+            if message.level == message_constants.WARNING:
+                return VoucherRedemptionService.BUSY
+            if message.level == message_constants.ERROR:
+                return VoucherRedemptionService.MISSING
+            if str(message).endswith('has already been redeemed'):
+                return VoucherRedemptionService.ALREADY_REDEEMED
+            return VoucherRedemptionService.EXHAUSTED
+        return f'status_{response.status_code}'
+
+    def redeem(self, mode, client, user_index, voucher_index):
+        """
+        Runs one redemption, and returns its outcome.
+        """
+        user, code = self.users[user_index], self.vouchers[voucher_index].code
+        if mode == self.SERVICE:
+            request = RequestFactory().post(reverse('redeem_voucher'), {'code': code})
+            request.user = user
+            request._messages = CookieStorage(request)
+            voucher = self.voucher_management_service.get_voucher_by_code(code)
+            return self.voucher_redemption_service.redeem_voucher(request, user, voucher)
+        if mode == self.VIEW:
+            client.cookies.clear()
+            client.cookies[settings.SESSION_COOKIE_NAME] = self.session_keys[user_index]
+            return self.get_view_outcome(client.post(reverse('redeem_voucher'), {'code': code}))
+        response = client.post(
+            reverse('api_redemptions'),
+            {'code': code},
+            content_type='application/json',
+            headers={'Authorization': f'Token {self.token_keys[user_index]}'},
+        )
+        return response.json().get('outcome', f'status_{response.status_code}')
+
+    def run_threads(self, mode, plan, threads):
+        """
+        Runs redemptions from concurrent threads, each with a test client and a database connection of its own.
+        A redemption raising an exception counts as an `error_<exception class>` outcome.
+
+        Returns:
+        - tuple: The latencies (in seconds), the counts of the outcomes, and the lock retry statistics.
+        """
+        database_lock_retry.reset_stats()
+        latencies, outcomes = [], Counter()
+        results_lock = threading.Lock()
+
+        def work(chunk):
+            client = Client()
+            chunk_latencies, chunk_outcomes = [], Counter()
+            try:
+                for user_index, voucher_index in chunk:
+                    started_at = time.perf_counter()
+                    try:
+                        outcome = self.redeem(mode, client, user_index, voucher_index)
+                    except Exception as e:
+                        outcome = f'error_{type(e).__name__}'
+                    chunk_latencies.append(time.perf_counter() - started_at)
+                    chunk_outcomes[outcome] += 1
+            finally:
+                connections.close_all()
+                with results_lock:
+                    latencies.extend(chunk_latencies)
+                    outcomes.update(chunk_outcomes)
+
+        workers = [threading.Thread(target=work, args=(plan[index::threads],)) for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return latencies, outcomes, database_lock_retry.get_stats()
+
+    def run(self, mode, threads=8, processes=1):
+        """
+        Runs the planned redemptions in a mode, split between processes and, in each process, between threads.
+
+        Returns:
+        - dict: The `mode`, number of `operations`, `elapsed` seconds, `ops_per_second`, `p50`, `p95` and `p99`
+          latencies (in seconds), counts of the `outcomes`, and `lock_stats` of the redemption writes.
+        """
+        plan = self.get_plan()
+        # Rejected redemptions answer 409, which Django logs as warnings.
+        request_logger = logging.getLogger('django.request')
+        request_log_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        started_at = time.perf_counter()
+        try:
+            if processes == 1:
+                results = [self.run_threads(mode, plan, threads)]
+            else:
+                connections.close_all()
+                with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork')) as executor:
+                    results = list(executor.map(
+                        self.run_threads,
+                        [mode] * processes,
+                        [plan[index::processes] for index in range(processes)],
+                        [threads] * processes,
+                    ))
+        finally:
+            request_logger.setLevel(request_log_level)
+        elapsed = time.perf_counter() - started_at
+        latencies, outcomes, lock_stats = [], Counter(), Counter()
+        for process_latencies, process_outcomes, process_lock_stats in results:
+            latencies.extend(process_latencies)
+            outcomes.update(process_outcomes)
+            lock_stats.update(process_lock_stats.get('redeem', {}))
+        latencies.sort()
+        return {
+            'mode': mode,
+            'operations': len(latencies),
+            'elapsed': elapsed,
+            'ops_per_second': len(latencies) / elapsed,
+            'p50': get_percentile(latencies, 50),
+            'p95': get_percentile(latencies, 95),
+            'p99': get_percentile(latencies, 99),
+            'outcomes': dict(outcomes),
+            'lock_stats': dict(lock_stats),
+        }
+
+    def verify(self):
+        """
+        Checks the seeded vouchers: no voucher exceeded its redemption limit, and every redemption count
+        matches the number of recorded redemptions.
+
+        Returns:
+        - list: Descriptions of the violations (empty if none).
+        """
+        redemption_counts = Counter(dict(
+            VoucherRedemption.objects
+            .filter(voucher__in=self.vouchers)
+            .values_list('voucher')
+            .annotate(redemptions=Count('id'))
+            .order_by()
+        ))
+        violations = []
+        for voucher in Voucher.objects.filter(pk__in=[voucher.pk for voucher in self.vouchers]).order_by('pk'):
+            if voucher.redemption_limit is not None and voucher.redemption_count > voucher.redemption_limit:
+                violations.append(
+                    f'{voucher.code} was redeemed {voucher.redemption_count} times (limit {voucher.redemption_limit})'
+                )
+            if voucher.redemption_count != redemption_counts[voucher.pk]:
+                violations.append(
+                    f'{voucher.code} counts {voucher.redemption_count} redemptions, '
+                    f'{redemption_counts[voucher.pk]} are recorded'
+                )
+        return violations
@@ -0,0 +1,51 @@
+import datetime
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from voucher_redemption.services import VoucherRedemptionService
+from voucher_system.db_retry import database_lock_retry
+
+
+class Command(BaseCommand):
+    """
+    Management command moving the redemptions older than the archival horizon to the archive table,
+    in bounded batches (see `VoucherRedemptionService.archive_redemptions`).
+
+    Example:
+    - `python manage.py archive_redemptions --days 180 --batch-size 500 --pause 0.05`
+    """
+
+    help = 'Moves the redemptions older than --days days to the archive table, in batches.'
+    voucher_redemption_service = VoucherRedemptionService()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Age (in days) of the redemptions to archive (default: REDEMPTION_ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=VoucherRedemptionService.archive_batch_size,
+                            help='Number of redemptions archived per transaction.')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Number of seconds to sleep between batches, letting redemptions write.')
+
+    def handle(self, *args, **options):
+        days = settings.REDEMPTION_ARCHIVE_AFTER_DAYS if options['days'] is None else options['days']
+        if days < 0:
+            raise CommandError('--days cannot be negative')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        started_at = time.monotonic()
+
+        def report_progress(archived):
+            self.stdout.write(f'{archived} redemptions archived')
+
+        archived = self.voucher_redemption_service.archive_redemptions(
+            older_than=datetime.timedelta(days=days),
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=report_progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully archived {archived} redemptions older than {days} days in {time.monotonic() - started_at:.1f}s'
+        ))
+        if options['verbosity'] > 1:
+            for operation, counts in database_lock_retry.get_stats().items():
+                self.stdout.write(f'{operation}: {counts}')
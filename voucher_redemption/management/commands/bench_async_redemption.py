@@ -0,0 +1,102 @@
+import asyncio
+import secrets
+import time
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from voucher_management.models import Voucher
+from voucher_system.db_retry import database_lock_retry
+from voucher_redemption.benchmark import get_percentile
+from voucher_redemption.models import VoucherRedemption
+
+
+class Command(BaseCommand):
+    """
+    Management command comparing the sync redemption view (`VoucherRedemptionView.post`) with the async JSON
+    endpoint (`AsyncVoucherRedemptionView`) under the ASGI handler.
+
+    For each path, `--requests` users redeem the same unlimited voucher, with up to `--concurrency` requests in
+    flight, through Django's `AsyncClient` (the ASGI request handler, in process, each request in a thread-sensitive
+    context of its own as under an ASGI server). The throughput, latency percentiles, number of redemptions recorded
+    (short of the requests when the database stayed locked) and lock retries are reported per path.
+
+    The benchmark users and vouchers are deleted at the end (their sessions expire on their own), so run it
+    against a development database.
+
+    Example:
+    - `python manage.py bench_async_redemption --requests 2000 --concurrency 500`
+    """
+
+    help = 'Benchmarks the async JSON redemption endpoint against the sync redemption view under ASGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Number of redemptions per path.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Number of requests in flight.')
+
+    async def bench(self, path, voucher, users, concurrency, data, content_type):
+        clients = []
+        for user in users:
+            client = AsyncClient()
+            await client.aforce_login(user)
+            clients.append(client)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses = [], {}
+
+        async def redeem(client):
+            async with semaphore, ThreadSensitiveContext():
+                started_at = time.perf_counter()
+                response = await client.post(path, data, content_type=content_type)
+                latencies.append(time.perf_counter() - started_at)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(redeem(client) for client in clients))
+        elapsed = time.perf_counter() - started_at
+        redeemed = await VoucherRedemption.objects.filter(voucher=voucher).acount()
+        return elapsed, sorted(latencies), statuses, redeemed
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+        tag = secrets.token_hex(4).upper()
+        paths = [
+            ('sync view', reverse('redeem_voucher'), 'application/x-www-form-urlencoded'),
+            ('async endpoint', reverse('redeem_voucher_async'), 'application/json'),
+        ]
+        vouchers = Voucher.objects.bulk_create(
+            Voucher(code=f'BENCH{tag}{index}', redemption_type=Voucher.MULTIPLE_REDEMPTION)
+            for index in range(len(paths))
+        )
+        users = User.objects.bulk_create(
+            User(username=f'bench-{tag}-{index}')
+            for index in range(options['requests'] * len(paths))
+        )
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for index, ((name, path, content_type), voucher) in enumerate(zip(paths, vouchers)):
+                    database_lock_retry.reset_stats()
+                    data = {'code': voucher.code}
+                    if content_type != 'application/json':
+                        data = f'code={voucher.code}'
+                    elapsed, latencies, statuses, redeemed = asyncio.run(self.bench(
+                        path,
+                        voucher,
+                        users[index * options['requests']:(index + 1) * options['requests']],
+                        options['concurrency'],
+                        data,
+                        content_type,
+                    ))
+                    self.stdout.write(
+                        f'{name}: {len(latencies) / elapsed:.0f} requests/s, '
+                        f'p50 {get_percentile(latencies, 50) * 1000:.1f}ms, '
+                        f'p95 {get_percentile(latencies, 95) * 1000:.1f}ms, '
+                        f'p99 {get_percentile(latencies, 99) * 1000:.1f}ms, '
+                        f'{redeemed} redemptions recorded, statuses {statuses}, '
+                        f'lock retries {database_lock_retry.get_stats().get("redeem", {})}'
+                    )
+        finally:
+            Voucher.objects.filter(pk__in=[voucher.pk for voucher in vouchers]).delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
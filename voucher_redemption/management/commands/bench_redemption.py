@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from voucher_redemption.benchmark import RedemptionBenchmark
+
+
+class Command(BaseCommand):
+    """
+    Management command benchmarking the redemption throughput (see `RedemptionBenchmark`).
+
+    `--vouchers-per-type` vouchers of each redemption type (single, multiple, and X times with a limit of
+    `--x-times-limit`) and `--users` users are seeded, then for each mode `--operations` redemptions of random
+    (user, voucher) pairs run from `--threads` threads in each of `--processes` processes. The same pairs are
+    redeemed in every mode, on vouchers seeded for the mode. The throughput, latency percentiles, outcomes and
+    lock retries are reported per mode, and the command fails if a voucher exceeded its redemption limit or
+    counts more (or fewer) redemptions than recorded.
+
+    The benchmark users and vouchers are deleted at the end (their sessions expire on their own), so run it
+    against a development database; several processes need a file database.
+
+    Example:
+    - `python manage.py bench_redemption --mode service --mode api --threads 16 --processes 2`
+    """
+
+    help = 'Benchmarks the redemption throughput of the service, the redemption view and the redemption API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', action='append', choices=RedemptionBenchmark.MODES, dest='modes',
+            help='Mode to benchmark (repeatable, all modes by default).',
+        )
+        parser.add_argument('--operations', type=int, default=2000, help='Number of redemptions per mode.')
+        parser.add_argument('--threads', type=int, default=8, help='Number of threads per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Number of processes.')
+        parser.add_argument('--users', type=int, default=200, help='Number of users.')
+        parser.add_argument('--vouchers-per-type', type=int, default=10, help='Number of vouchers per redemption type.')
+        parser.add_argument('--x-times-limit', type=int, default=50, help='Redemption limit of the X times vouchers.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the (user, voucher) pairs.')
+
+    def handle(self, *args, **options):
+        for option in ['operations', 'threads', 'processes', 'users', 'vouchers_per_type', 'x_times_limit']:
+            if options[option] < 1:
+                raise CommandError(f'--{option.replace("_", "-")} must be at least 1')
+        violations = []
+        for mode in options['modes'] or RedemptionBenchmark.MODES:
+            benchmark = RedemptionBenchmark(
+                vouchers_per_type=options['vouchers_per_type'],
+                users=options['users'],
+                operations=options['operations'],
+                x_times_limit=options['x_times_limit'],
+                seed=options['seed'],
+            )
+            benchmark.setup()
+            try:
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    result = benchmark.run(mode, threads=options['threads'], processes=options['processes'])
+                mode_violations = benchmark.verify()
+            finally:
+                benchmark.teardown()
+            self.stdout.write(
+                f'{mode}: {result["ops_per_second"]:.0f} redemptions/s, '
+                f'p50 {result["p50"] * 1000:.1f}ms, '
+                f'p95 {result["p95"] * 1000:.1f}ms, '
+                f'p99 {result["p99"] * 1000:.1f}ms, '
+                f'outcomes {result["outcomes"]}, '
+                f'lock retries {result["lock_stats"]}'
+            )
+            violations.extend(f'{mode}: {violation}' for violation in mode_violations)
+        if violations:
+            raise CommandError('Redemption counters are inconsistent:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('No voucher exceeded its redemption limit.'))
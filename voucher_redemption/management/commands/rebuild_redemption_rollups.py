@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from voucher_redemption.rollups import redemption_rollups
+
+
+class Command(BaseCommand):
+    """
+    Management command recomputing the redemption rollups from the redemptions, e.g. to backfill them.
+
+    The rollups are replaced in one transaction. Redemptions committed while the command runs are counted
+    once: on SQLite they wait for the rebuild to commit, since it holds the write lock from its first delete.
+    """
+
+    help = 'Rebuilds the hourly, daily and total redemption rollups from the redemptions.'
+
+    def handle(self, *args, **options):
+        total = redemption_rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the redemption rollups ({total} redemptions)'))
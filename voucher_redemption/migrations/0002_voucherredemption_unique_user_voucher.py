@@ -0,0 +1,47 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_redemptions(apps, schema_editor):
+    """
+    Keeps only the earliest redemption of each (user, voucher) pair so the unique constraint can be added,
+    and recounts the redemptions of the vouchers whose duplicates were removed.
+    """
+    Voucher = apps.get_model('voucher_management', 'Voucher')
+    VoucherRedemption = apps.get_model('voucher_redemption', 'VoucherRedemption')
+    duplicates = (
+        VoucherRedemption.objects.values('user_id', 'voucher_id')
+        .annotate(first_id=Min('id'), redemptions=Count('id'))
+        .filter(redemptions__gt=1)
+    )
+    voucher_ids = set()
+    for duplicate in list(duplicates):
+        VoucherRedemption.objects.filter(
+            user_id=duplicate['user_id'],
+            voucher_id=duplicate['voucher_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+        voucher_ids.add(duplicate['voucher_id'])
+    for voucher_id in voucher_ids:
+        Voucher.objects.filter(pk=voucher_id).update(
+            redemption_count=VoucherRedemption.objects.filter(voucher_id=voucher_id).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0005_voucher_redemption_limit'),
+        ('voucher_redemption', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_redemptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='voucherredemption',
+            constraint=models.UniqueConstraint(fields=('user', 'voucher'), name='unique_voucher_redemption_per_user'),
+        ),
+    ]
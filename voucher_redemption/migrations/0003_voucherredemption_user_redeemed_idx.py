@@ -0,0 +1,20 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0008_voucher_list_indexes'),
+        ('voucher_redemption', '0002_voucherredemption_unique_user_voucher'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucherredemption',
+            index=models.Index(fields=['user', 'redeemed_at'], name='redemption_user_redeemed_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0008_voucher_list_indexes'),
+        ('voucher_redemption', '0003_voucherredemption_user_redeemed_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RedemptionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('total', 'Total')], max_length=5)),
+                ('period_start', models.DateTimeField()),
+                ('redemption_count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoucherRedemptionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=5)),
+                ('period_start', models.DateTimeField()),
+                ('redemption_count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='redemptionrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start'), name='unique_redemption_rollup'),
+        ),
+        migrations.AddField(
+            model_name='voucherredemptionrollup',
+            name='voucher',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='voucher_management.voucher'),
+        ),
+        migrations.AddIndex(
+            model_name='voucherredemptionrollup',
+            index=models.Index(fields=['period', 'period_start'], name='voucher_rollup_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='voucherredemptionrollup',
+            constraint=models.UniqueConstraint(fields=('voucher', 'period', 'period_start'), name='unique_voucher_redemption_rollup'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.11 on 2026-10-18 13:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voucher_management', '0009_voucher_active_expiration_idx'),
+        ('voucher_redemption', '0004_redemption_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedVoucherRedemption',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('redeemed_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='voucherredemption',
+            name='voucher',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='voucher_management.voucher'),
+        ),
+        migrations.AddIndex(
+            model_name='voucherredemption',
+            index=models.Index(fields=['voucher', 'redeemed_at'], name='redemption_voucher_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedvoucherredemption',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedvoucherredemption',
+            name='voucher',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='voucher_management.voucher'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedvoucherredemption',
+            index=models.Index(fields=['user', 'redeemed_at', 'id'], name='archived_user_redeemed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedvoucherredemption',
+            index=models.Index(fields=['voucher', 'redeemed_at', 'id'], name='archived_voucher_redeemed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivedvoucherredemption',
+            constraint=models.UniqueConstraint(fields=('user', 'voucher'), name='unique_archived_redemption_per_user'),
+        ),
+    ]
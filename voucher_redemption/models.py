@@ -11,8 +11,136 @@ class VoucherRedemption(models.Model):
     - `user`: ForeignKey - Reference to the User who redeemed the voucher.
     - `voucher`: ForeignKey - Reference to the Voucher being redeemed.
     - `redeemed_at`: DateTimeField - Timestamp indicating when the redemption occurred.
+
+    Meta:
+    - `constraints`: A user can redeem a given voucher only once. The constraint's composite
+      (user, voucher) index also serves the "already redeemed" lookup.
+    - `indexes`: The (user, redeemed_at) and (voucher, redeemed_at) indexes serve the redemption histories
+      of a user and of a voucher, newest first, as range scans (the ID breaking ties is part of every SQLite
+      index). The latter also serves the foreign key on the voucher, which has no index of its own.
     """
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE)
+    voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE, db_index=False)
     redeemed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'voucher'],
+                name='unique_voucher_redemption_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'redeemed_at'], name='redemption_user_redeemed_idx'),
+            models.Index(fields=['voucher', 'redeemed_at'], name='redemption_voucher_at_idx'),
+        ]
+
+
+class ArchivedVoucherRedemption(models.Model):
+    """
+    Model representing a redemption moved out of the `VoucherRedemption` table by the archival
+    (see `VoucherRedemptionService.archive_redemptions`), keeping the ID of the original redemption.
+
+    Fields:
+    - `id`: BigIntegerField - ID of the original redemption.
+    - `user`: ForeignKey - Reference to the User who redeemed the voucher.
+    - `voucher`: ForeignKey - Reference to the Voucher being redeemed.
+    - `redeemed_at`: DateTimeField - Timestamp indicating when the redemption occurred.
+    - `archived_at`: DateTimeField - Timestamp indicating when the redemption was archived.
+
+    Meta:
+    - `constraints`: A user can redeem a given voucher only once, archived or not (see `has_been_redeemed`).
+    - `indexes`: The (user, redeemed_at, id) and (voucher, redeemed_at, id) indexes serve the redemption histories
+      in order (the ID is not the rowid of the table, so it is not implicitly part of the indexes).
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE, db_index=False)
+    redeemed_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'voucher'],
+                name='unique_archived_redemption_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'redeemed_at', 'id'], name='archived_user_redeemed_idx'),
+            models.Index(fields=['voucher', 'redeemed_at', 'id'], name='archived_voucher_redeemed_idx'),
+        ]
+
+
+class VoucherRedemptionRollup(models.Model):
+    """
+    Model counting the redemptions of a voucher per hour and per day.
+
+    Fields:
+    - `voucher`: ForeignKey - Reference to the redeemed Voucher.
+    - `period`: CharField - Length of the period (`hour` or `day`).
+    - `period_start`: DateTimeField - Start of the period, in the default time zone.
+    - `redemption_count`: PositiveBigIntegerField - Number of redemptions of the voucher during the period.
+
+    Meta:
+    - `constraints`: A voucher has one row per period; the constraint's index serves the series of a voucher.
+    - `indexes`: The (period, period_start) index serves the rankings of the vouchers over a range of periods.
+    """
+
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    redemption_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['voucher', 'period', 'period_start'],
+                name='unique_voucher_redemption_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='voucher_rollup_period_idx'),
+        ]
+
+
+class RedemptionRollup(models.Model):
+    """
+    Model counting the redemptions of all vouchers per hour, per day and in total.
+
+    Fields:
+    - `period`: CharField - Length of the period (`hour`, `day` or `total`).
+    - `period_start`: DateTimeField - Start of the period, in the default time zone (the epoch for the total).
+    - `redemption_count`: PositiveBigIntegerField - Number of redemptions during the period.
+
+    Meta:
+    - `constraints`: There is one row per period; the constraint's index serves the series of a period length.
+    """
+
+    HOUR = VoucherRedemptionRollup.HOUR
+    DAY = VoucherRedemptionRollup.DAY
+    TOTAL = 'total'
+    PERIOD_CHOICES = VoucherRedemptionRollup.PERIOD_CHOICES + [
+        (TOTAL, 'Total'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    redemption_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start'],
+                name='unique_redemption_rollup',
+            ),
+        ]
@@ -0,0 +1,232 @@
+import datetime
+import itertools
+from collections import Counter
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from .models import ArchivedVoucherRedemption, RedemptionRollup, Voucher, VoucherRedemption, VoucherRedemptionRollup
+
+
+class RedemptionRollups:
+    """
+    Pre-aggregated redemption counts, per voucher per hour and per day, and for all vouchers per hour,
+    per day and in total.
+
+    The rollups are incremented in the transaction recording each redemption (see `signals.py`), with one
+    upsert per rollup row, so they commit (or roll back) along with it and reading the analytics never
+    scans the redemptions. `rebuild` recomputes them from the redemptions, e.g. to backfill existing data.
+    Archiving redemptions does not change the rollups.
+
+    Periods start on the hour (or day) in the default time zone. The rollups of a voucher are deleted along
+    with it, while the rollups of all vouchers keep counting its redemptions until they are rebuilt.
+
+    Attributes:
+    - `total_period_start` (datetime): Period start of the row counting all the redemptions.
+    - `batch_size` (int): Number of rollup rows inserted per query by `rebuild`.
+    """
+
+    total_period_start = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    batch_size = 2000
+
+    def get_period_starts(self, redeemed_at):
+        """
+        Returns the start of the hour and of the day of a redemption date, keyed by period.
+        """
+        hour_start = timezone.localtime(redeemed_at, timezone.get_default_timezone()).replace(
+            minute=0, second=0, microsecond=0,
+        )
+        return {
+            VoucherRedemptionRollup.HOUR: hour_start,
+            VoucherRedemptionRollup.DAY: hour_start.replace(hour=0),
+        }
+
+    def get_upsert_sql(self, model, key_field_names):
+        """
+        Returns the SQL statement inserting a rollup row, or adding its count to the existing row with the same key.
+        """
+        quote_name = connection.ops.quote_name
+        table = quote_name(model._meta.db_table)
+        key_columns = [quote_name(model._meta.get_field(field_name).column) for field_name in key_field_names]
+        count_column = quote_name(model._meta.get_field('redemption_count').column)
+        return (
+            'INSERT INTO {table} ({keys}, {count}) VALUES ({placeholders}, %s) '
+            'ON CONFLICT ({keys}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}'
+        ).format(
+            table=table,
+            keys=', '.join(key_columns),
+            count=count_column,
+            placeholders=', '.join(['%s'] * len(key_columns)),
+        )
+
+    def record(self, redemptions):
+        """
+        Adds redemptions to the rollups. Called in the transaction recording the redemptions.
+
+        Parameters:
+        - `redemptions` (iterable): Tuples of the voucher ID and the date of each redemption.
+        """
+        voucher_counts, counts = Counter(), Counter()
+        for voucher_id, redeemed_at in redemptions:
+            for period, period_start in self.get_period_starts(redeemed_at).items():
+                voucher_counts[voucher_id, period, period_start] += 1
+                counts[period, period_start] += 1
+            counts[RedemptionRollup.TOTAL, self.total_period_start] += 1
+        if not counts:
+            return
+        period_start_field = RedemptionRollup._meta.get_field('period_start')
+
+        def prep(period_start):
+            return period_start_field.get_db_prep_save(period_start, connection)
+
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                self.get_upsert_sql(VoucherRedemptionRollup, ['voucher', 'period', 'period_start']),
+                [
+                    (voucher_id, period, prep(period_start), count)
+                    for (voucher_id, period, period_start), count in voucher_counts.items()
+                ],
+            )
+            cursor.executemany(
+                self.get_upsert_sql(RedemptionRollup, ['period', 'period_start']),
+                [(period, prep(period_start), count) for (period, period_start), count in counts.items()],
+            )
+
+    def rebuild(self):
+        """
+        Recomputes all the rollups from the live and archived redemptions, in one transaction.
+
+        Returns:
+        - int: The number of redemptions counted.
+        """
+        default_timezone = timezone.get_default_timezone()
+        with transaction.atomic():
+            VoucherRedemptionRollup.objects.all().delete()
+            RedemptionRollup.objects.all().delete()
+            upsert_sql = self.get_upsert_sql(VoucherRedemptionRollup, ['voucher', 'period', 'period_start'])
+            period_start_field = VoucherRedemptionRollup._meta.get_field('period_start')
+            for period, trunc in ((VoucherRedemptionRollup.HOUR, TruncHour), (VoucherRedemptionRollup.DAY, TruncDay)):
+                for model in (VoucherRedemption, ArchivedVoucherRedemption):
+                    rows = (
+                        model.objects
+                        .annotate(period_start=trunc('redeemed_at', tzinfo=default_timezone))
+                        .values_list('voucher_id', 'period_start')
+                        .annotate(redemptions=Count('id'))
+                        .order_by()
+                        .iterator(chunk_size=self.batch_size)
+                    )
+                    while batch := list(itertools.islice(rows, self.batch_size)):
+                        with connection.cursor() as cursor:
+                            cursor.executemany(upsert_sql, [
+                                (voucher_id, period, period_start_field.get_db_prep_save(period_start, connection), redemptions)
+                                for voucher_id, period_start, redemptions in batch
+                            ])
+            rows = (
+                VoucherRedemptionRollup.objects
+                .values('period', 'period_start')
+                .annotate(redemptions=Sum('redemption_count'))
+                .order_by()
+            )
+            RedemptionRollup.objects.bulk_create(
+                (
+                    RedemptionRollup(period=row['period'], period_start=row['period_start'], redemption_count=row['redemptions'])
+                    for row in rows.iterator(chunk_size=self.batch_size)
+                ),
+                batch_size=self.batch_size,
+            )
+            total = RedemptionRollup.objects.filter(period=RedemptionRollup.DAY).aggregate(
+                total=Sum('redemption_count'),
+            )['total'] or 0
+            RedemptionRollup.objects.create(
+                period=RedemptionRollup.TOTAL,
+                period_start=self.total_period_start,
+                redemption_count=total,
+            )
+        return total
+
+    def get_total(self, voucher_id=None):
+        """
+        Returns the number of redemptions of a voucher (summing its daily rollups), or of all vouchers if None.
+        """
+        if voucher_id is not None:
+            return VoucherRedemptionRollup.objects.filter(
+                voucher_id=voucher_id,
+                period=VoucherRedemptionRollup.DAY,
+            ).aggregate(total=Sum('redemption_count'))['total'] or 0
+        return RedemptionRollup.objects.filter(
+            period=RedemptionRollup.TOTAL,
+            period_start=self.total_period_start,
+        ).values_list('redemption_count', flat=True).first() or 0
+
+    def get_series(self, period, since, voucher_id=None):
+        """
+        Returns the redemption counts per period since a date, oldest first. Periods without redemptions are omitted.
+
+        Parameters:
+        - `period` (str): `hour` or `day`.
+        - `since` (datetime): Date from which the periods are counted (the period containing it included).
+        - `voucher_id` (int): ID of the voucher to count the redemptions of (None for all vouchers).
+
+        Returns:
+        - list: Dicts with the `period_start` and the number of `redemptions` of each period.
+        """
+        if voucher_id is None:
+            rollups = RedemptionRollup.objects.all()
+        else:
+            rollups = VoucherRedemptionRollup.objects.filter(voucher_id=voucher_id)
+        rollups = rollups.filter(period=period, period_start__gte=self.get_period_starts(since)[period])
+        return [
+            {'period_start': period_start, 'redemptions': redemption_count}
+            for period_start, redemption_count in rollups.order_by('period_start').values_list('period_start', 'redemption_count')
+        ]
+
+    def get_top_vouchers(self, since, limit=10):
+        """
+        Returns the most redeemed vouchers since a date (the day containing it included), from the daily rollups.
+
+        Returns:
+        - list: Dicts with the `voucher_id`, `code` and number of `redemptions` of each voucher, most redeemed first.
+        """
+        rows = (
+            VoucherRedemptionRollup.objects
+            .filter(period=VoucherRedemptionRollup.DAY, period_start__gte=self.get_period_starts(since)[VoucherRedemptionRollup.DAY])
+            .values('voucher_id')
+            .annotate(redemptions=Sum('redemption_count'))
+            .order_by('-redemptions', 'voucher_id')[:limit]
+        )
+        rows = list(rows)
+        codes = dict(
+            Voucher.objects
+            .filter(id__in=[row['voucher_id'] for row in rows])
+            .values_list('id', 'code')
+        )
+        return [
+            {'voucher_id': row['voucher_id'], 'code': codes.get(row['voucher_id']), 'redemptions': row['redemptions']}
+            for row in rows
+        ]
+
+    def get_summary(self, hours=24, days=30, top=10, voucher_id=None):
+        """
+        Returns the redemption analytics shown on the dashboard, read from the rollups only.
+
+        Parameters:
+        - `hours` (int): Number of hours of the hourly series (the current hour included).
+        - `days` (int): Number of days of the daily series and of the ranking of the vouchers (the current day included).
+        - `top` (int): Number of vouchers in the ranking.
+        - `voucher_id` (int): ID of a voucher to restrict the series to (None for all vouchers, with the ranking).
+
+        Returns:
+        - dict: The `total` number of redemptions, the `hourly` and `daily` series, and the `top_vouchers`.
+        """
+        now = timezone.now()
+        summary = {
+            'total': self.get_total(voucher_id),
+            'hourly': self.get_series(VoucherRedemptionRollup.HOUR, now - datetime.timedelta(hours=hours - 1), voucher_id),
+            'daily': self.get_series(VoucherRedemptionRollup.DAY, now - datetime.timedelta(days=days - 1), voucher_id),
+        }
+        if voucher_id is None:
+            summary['top_vouchers'] = self.get_top_vouchers(now - datetime.timedelta(days=days - 1), top)
+        return summary
+
+
+redemption_rollups = RedemptionRollups()
@@ -1,24 +1,90 @@
+import base64
+import datetime
+import json
+import time
+from django.conf import settings
 from django.contrib import messages
-from .models import Voucher, VoucherRedemption
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from voucher_management.cache import voucher_cache
+from voucher_system.db_retry import database_lock_retry
+from .models import ArchivedVoucherRedemption, Voucher, VoucherRedemption
 
 
 class VoucherRedemptionService():
     """
     Service class for handling voucher redemption operations.
 
+    Attributes:
+    - `REDEEMED`: Outcome for a voucher that was successfully redeemed.
+    - `EXHAUSTED`: Outcome for a voucher that is inactive, expired or has reached its redemption limit.
+    - `ALREADY_REDEEMED`: Outcome for a voucher that the user has already redeemed.
+    - `MISSING`: Outcome for a voucher that does not exist.
+    - `BUSY`: Outcome for a redemption that could not be written because the database stayed locked.
+    - `history_page_size`: Number of redemptions per page of the redemption history.
+    - `archive_batch_size`: Default number of redemptions archived per transaction.
+    - `duplicate_redemption_constraint`: Name of the (user, voucher) unique constraint of the redemptions.
+
     Methods:
+    - `get_redeemable_filter`: Builds the query filter matching vouchers that can still be redeemed.
     - `is_redeemable`: Checks if a voucher is redeemable based on its redemption limit and status.
     - `has_been_redeemed`: Checks if a user has already redeemed a specific voucher.
+    - `ahas_been_redeemed`: Async version of `has_been_redeemed`.
     - `get_redeemed_vouchers`: Retrieves a list of vouchers redeemed by a specific user.
+    - `encode_history_cursor`: Encodes the position of a redemption in the redemption history.
+    - `decode_history_cursor`: Decodes a redemption history cursor.
+    - `get_redemption_history_querysets`: Returns the live and archived redemptions of a user or of a voucher.
+    - `get_redemption_history_page`: Returns a keyset-paginated page of the redemption history of a user or of a voucher.
+    - `archive_redemption_batch`: Moves a batch of old redemptions to the archive table, in one transaction.
+    - `archive_redemptions`: Moves the redemptions older than the archival horizon to the archive table, in batches.
     - `get_redemption_limit`: Determines the redemption limit based on the voucher redemption type.
+    - `get_redemption_limit_from_data`: Determines the redemption limit from cleaned voucher form data.
+    - `is_duplicate_redemption`: Checks if an integrity error was raised by the (user, voucher) unique constraint.
+    - `write_voucher_redemption`: Writes a voucher redemption in one transaction.
     - `create_voucher_redemption`: Creates a new voucher redemption record for a user.
+    - `acreate_voucher_redemption`: Async version of `create_voucher_redemption`.
+    - `redeem`: Redeems a voucher for a user and returns the redemption outcome.
+    - `aredeem`: Async version of `redeem`.
     - `redeem_voucher`: Redeems a voucher for a user, updating the redemption count and creating a redemption record.
+    - `add_redemption_message`: Adds the message describing a redemption outcome to the request.
     """
 
+    REDEEMED = 'redeemed'
+    EXHAUSTED = 'exhausted'
+    ALREADY_REDEEMED = 'already_redeemed'
+    MISSING = 'missing'
+    BUSY = 'busy'
+
+    history_page_size = 20
+    archive_batch_size = 500
+    duplicate_redemption_constraint = 'unique_voucher_redemption_per_user'
+
+    def get_redeemable_filter(self):
+        """
+        Builds the query filter matching vouchers that can still be redeemed.
+
+        A voucher is redeemable while it is active, not expired and its redemption count is below
+        its redemption limit (a voucher without a redemption limit can be redeemed any number of times).
+
+        Returns:
+        - Q: Filter to apply to a Voucher queryset.
+        """
+        return (
+            Q(is_active=True)
+            & (Q(expiration_date__isnull=True) | Q(expiration_date__gt=timezone.now()))
+            & (Q(redemption_limit__isnull=True) | Q(redemption_count__lt=F('redemption_limit')))
+        )
+
     def is_redeemable(self, voucher):
         """
         Checks if a voucher is redeemable based on its redemption limit and status.
 
+        Note:
+        - This only inspects the given (possibly stale) instance. The redemption itself is guarded
+          by `create_voucher_redemption`, which re-checks the same rules in the database.
+
         Parameters:
         - `voucher`: Voucher - The voucher object to check.
 
@@ -27,14 +93,18 @@ class VoucherRedemptionService():
         """
         redemption_count = voucher.redemption_count
         redemption_limit = voucher.redemption_limit
-        is_active = voucher.is_active
-        if is_active and redemption_count < redemption_limit:
-            return True
-        return False
+        expiration_date = voucher.expiration_date
+        if not voucher.is_active:
+            return False
+        if expiration_date and expiration_date <= timezone.now():
+            return False
+        if redemption_limit is not None and redemption_count >= redemption_limit:
+            return False
+        return True
     
     def has_been_redeemed(self, user, voucher):
         """
-        Checks if a user has already redeemed a specific voucher.
+        Checks if a user has already redeemed a specific voucher, including in the archived redemptions.
 
         Parameters:
         - `user`: User - The user object to check.
@@ -43,27 +113,196 @@ class VoucherRedemptionService():
         Returns:
         - bool: True if the voucher has been redeemed by the user, False otherwise.
         """
-        user_redeemed_vouchers = self.get_redeemed_vouchers(user)
-        if voucher in user_redeemed_vouchers:
-            return True
-        return False
+        return (
+            VoucherRedemption.objects.filter(user=user, voucher=voucher).exists()
+            or ArchivedVoucherRedemption.objects.filter(user=user, voucher=voucher).exists()
+        )
+
+    async def ahas_been_redeemed(self, user, voucher):
+        """
+        Async version of `has_been_redeemed`.
+        """
+        return (
+            await VoucherRedemption.objects.filter(user=user, voucher=voucher).aexists()
+            or await ArchivedVoucherRedemption.objects.filter(user=user, voucher=voucher).aexists()
+        )
 
     def get_redeemed_vouchers(self, user):
         """
-        Retrieves a list of vouchers redeemed by a specific user.
+        Retrieves a list of vouchers redeemed by a specific user, newest first (archived redemptions excluded).
 
         Parameters:
         - `user`: User - The user object for which to retrieve redeemed vouchers.
 
         Returns:
-        - QuerySet: List of vouchers redeemed by the user.
+        - QuerySet: Redemptions of the user, with their voucher loaded in the same query.
+        """
+        return self.get_redemption_history_querysets(user=user)[0]
+
+    def get_redemption_history_querysets(self, user=None, voucher=None):
+        """
+        Returns the live and archived redemptions of a user or of a voucher, newest first.
+
+        Parameters:
+        - `user`: User - The user whose redemptions are returned.
+        - `voucher`: Voucher - The voucher whose redemptions are returned (if no user is given).
+
+        Returns:
+        - list: The VoucherRedemption and ArchivedVoucherRedemption querysets, with their voucher loaded in the same query.
+        """
+        filters = {'user': user} if user is not None else {'voucher': voucher}
+        return [
+            model.objects.filter(**filters).select_related('voucher').order_by('-redeemed_at', '-id')
+            for model in (VoucherRedemption, ArchivedVoucherRedemption)
+        ]
+
+    def encode_history_cursor(self, direction, redemption):
+        """
+        Encodes the position of a redemption in the redemption history.
+
+        Parameters:
+        - `direction`: str - `next` for the older redemptions, `previous` for the newer ones.
+        - `redemption`: VoucherRedemption or ArchivedVoucherRedemption - The redemption the page is positioned after (or before).
+
+        Returns:
+        - str: The URL-safe cursor.
+        """
+        cursor = json.dumps([direction, redemption.redeemed_at.isoformat(), redemption.pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_history_cursor(self, cursor):
+        """
+        Decodes a redemption history cursor.
+
+        Returns:
+        - tuple or None: The direction, redemption date and ID of the cursor, or None if the cursor is invalid.
         """
         try:
-            redeemed_vouchers = VoucherRedemption.objects.filter(user=user)
-        except Exception as e:
-            pass
-        return redeemed_vouchers
-    
+            direction, redeemed_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            redeemed_at = VoucherRedemption._meta.get_field('redeemed_at').to_python(redeemed_at)
+            if direction not in ('next', 'previous') or redeemed_at is None or not isinstance(pk, int):
+                return None
+            return direction, redeemed_at, pk
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    def get_redemption_history_page(self, user=None, cursor=None, page_size=None, voucher=None):
+        """
+        Returns a page of the redemption history of a user (or of a voucher), newest first, using keyset pagination.
+
+        Pages are positioned before (or after) the redemption date and ID of the last (or first) redemption
+        of the page the cursor was taken from. The live and the archived redemptions (which keep their IDs)
+        are each read as a range of their (user, redeemed_at) or (voucher, redeemed_at) index with their voucher
+        joined, and merged, so a page costs two queries whatever the number of redemptions.
+
+        Parameters:
+        - `user`: User - The user whose redemptions are listed.
+        - `cursor`: str - Cursor of the page, as returned in `next_cursor` or `previous_cursor` (first page if None).
+        - `page_size`: int - Number of redemptions per page (default: `history_page_size`).
+        - `voucher`: Voucher - The voucher whose redemptions are listed (if no user is given).
+
+        Returns:
+        - dict: The `redemptions` of the page, and the `next_cursor` (older redemptions) and `previous_cursor`
+          (newer redemptions), None if there is no such page.
+        """
+        page_size = page_size or self.history_page_size
+        position = self.decode_history_cursor(cursor) if cursor else None
+        backwards = position is not None and position[0] == 'previous'
+        redemptions = []
+        for queryset in self.get_redemption_history_querysets(user=user, voucher=voucher):
+            if position is not None:
+                direction, redeemed_at, pk = position
+                if backwards:
+                    queryset = queryset.filter(
+                        Q(redeemed_at__gte=redeemed_at) & (Q(redeemed_at__gt=redeemed_at) | Q(id__gt=pk))
+                    ).order_by('redeemed_at', 'id')
+                else:
+                    queryset = queryset.filter(
+                        Q(redeemed_at__lte=redeemed_at) & (Q(redeemed_at__lt=redeemed_at) | Q(id__lt=pk))
+                    )
+            redemptions += queryset[:page_size + 1]
+        redemptions.sort(key=lambda redemption: (redemption.redeemed_at, redemption.pk), reverse=not backwards)
+        redemptions = redemptions[:page_size + 1]
+        has_more = len(redemptions) > page_size
+        redemptions = redemptions[:page_size]
+        if backwards:
+            redemptions.reverse()
+        page = {'redemptions': redemptions, 'next_cursor': None, 'previous_cursor': None}
+        if redemptions:
+            if has_more or backwards:
+                page['next_cursor'] = self.encode_history_cursor('next', redemptions[-1])
+            if (position is not None and not backwards) or (backwards and has_more):
+                page['previous_cursor'] = self.encode_history_cursor('previous', redemptions[0])
+        return page
+
+    def archive_redemption_batch(self, cutoff, batch_size):
+        """
+        Moves the oldest redemptions (by ID) made before a date to the archive table, in one transaction.
+
+        Returns:
+        - int: Number of redemptions archived.
+        """
+        with transaction.atomic():
+            redemptions = list(
+                VoucherRedemption.objects.filter(redeemed_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', 'user_id', 'voucher_id', 'redeemed_at')[:batch_size]
+            )
+            if not redemptions:
+                return 0
+            archived_at = timezone.now()
+            ArchivedVoucherRedemption.objects.bulk_create([
+                ArchivedVoucherRedemption(
+                    id=redemption_id,
+                    user_id=user_id,
+                    voucher_id=voucher_id,
+                    redeemed_at=redeemed_at,
+                    archived_at=archived_at,
+                )
+                for redemption_id, user_id, voucher_id, redeemed_at in redemptions
+            ])
+            VoucherRedemption.objects.filter(id__in=[redemption[0] for redemption in redemptions]).delete()
+        return len(redemptions)
+
+    def archive_redemptions(self, older_than=None, batch_size=None, pause=0, progress=None):
+        """
+        Moves the redemptions older than the archival horizon to the archive table, in batches.
+
+        Each batch is copied to `ArchivedVoucherRedemption` (keeping the IDs) and deleted from `VoucherRedemption`
+        in its own short transaction (see `archive_redemption_batch`, retried on lock contention), so live
+        redemptions only wait for one batch at a time. Batches are read in
+        ID order, which follows the redemption dates, so the oldest redemptions are found at the start of the
+        primary key without an index on the date. The redemption rollups are left unchanged.
+
+        Parameters:
+        - `older_than`: datetime.timedelta - Age of the redemptions to archive (default: `REDEMPTION_ARCHIVE_AFTER_DAYS`).
+        - `batch_size`: int - Number of redemptions archived per transaction (default: `archive_batch_size`).
+        - `pause`: float - Number of seconds to sleep between batches.
+        - `progress`: callable - Called with the number of redemptions archived so far after each batch.
+
+        Returns:
+        - int: Number of redemptions archived.
+        """
+        if older_than is None:
+            older_than = datetime.timedelta(days=settings.REDEMPTION_ARCHIVE_AFTER_DAYS)
+        batch_size = batch_size or self.archive_batch_size
+        cutoff = timezone.now() - older_than
+        archived = 0
+        while True:
+            batch_archived = database_lock_retry.run(
+                self.archive_redemption_batch, cutoff, batch_size, operation='archive_redemptions',
+            )
+            if not batch_archived:
+                break
+            archived += batch_archived
+            if progress:
+                progress(archived)
+            if batch_archived < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return archived
+
     def get_redemption_limit(self, form):
         """
         Determines the redemption limit based on the voucher redemption type.
@@ -74,7 +313,18 @@ class VoucherRedemptionService():
         Returns:
         - int or None: Redemption limit value or None if not applicable.
         """
-        form_data = form.cleaned_data
+        return self.get_redemption_limit_from_data(form.cleaned_data)
+
+    def get_redemption_limit_from_data(self, form_data):
+        """
+        Determines the redemption limit from cleaned voucher form data.
+
+        Parameters:
+        - `form_data`: dict - Cleaned data with the `redemption_type` and `x_times_redemption_limit` of a voucher.
+
+        Returns:
+        - int or None: Redemption limit value or None if not applicable.
+        """
         redemption_type = form_data.get('redemption_type')
         x_times_redemption_limit = form_data.get('x_times_redemption_limit')
         if redemption_type == "x_times" and x_times_redemption_limit:
@@ -83,20 +333,155 @@ class VoucherRedemptionService():
                 return 1
         return None
     
+    def is_duplicate_redemption(self, error):
+        """
+        Checks if an integrity error was raised by the (user, voucher) unique constraint of the redemptions,
+        rather than by another constraint (e.g. a foreign key or a check).
+
+        Parameters:
+        - `error`: IntegrityError - The error raised while writing a redemption.
+
+        Returns:
+        - bool: True if the user had already redeemed the voucher, False otherwise.
+        """
+        constraint_name = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+        if constraint_name is not None:
+            return constraint_name == self.duplicate_redemption_constraint
+        table = VoucherRedemption._meta.db_table
+        message = str(error)
+        return (
+            self.duplicate_redemption_constraint in message
+            or message == f'UNIQUE constraint failed: {table}.user_id, {table}.voucher_id'
+        )
+
+    def write_voucher_redemption(self, user, voucher):
+        """
+        Writes a voucher redemption in one transaction: increments the redemption count of the voucher
+        while it is still redeemable, and records the redemption.
+
+        Parameters:
+        - `user`: User - The user redeeming the voucher.
+        - `voucher`: Voucher - The voucher being redeemed.
+
+        Returns:
+        - str or None: `REDEEMED` if the redemption was recorded, `ALREADY_REDEEMED` if the user's redemption
+          of the voucher was archived, or None if the voucher is not redeemable (or no longer exists).
+
+        Raises:
+        - IntegrityError: If the user has already redeemed the voucher (or another constraint is violated).
+        - OperationalError: If the database is locked.
+        """
+        with transaction.atomic():
+            updated_rows = Voucher.objects.filter(
+                self.get_redeemable_filter(),
+                pk=voucher.pk,
+            ).update(
+                redemption_count=F('redemption_count') + 1,
+                version=F('version') + 1,
+                updated_at=timezone.now(),
+            )
+            if not updated_rows:
+                return None
+            if ArchivedVoucherRedemption.objects.filter(user=user, voucher=voucher).exists():
+                transaction.set_rollback(True)
+                return self.ALREADY_REDEEMED
+            VoucherRedemption.objects.create(
+                user=user,
+                voucher=voucher,
+            )
+            transaction.on_commit(lambda: voucher_cache.invalidate(voucher.pk))
+            return self.REDEEMED
+
     def create_voucher_redemption(self, user, voucher):
         """
         Creates a new voucher redemption record for a user.
 
+        The redemption count is incremented by a single conditional UPDATE that only matches the
+        voucher while it is still redeemable, so concurrent redemptions can never exceed the
+        redemption limit. The counter update and the redemption record are written in one transaction
+        (see `write_voucher_redemption`), which is rolled back if the (user, voucher) unique constraint
+        rejects a concurrent duplicate (or if the user's redemption of the voucher was archived, which is
+        checked after the counter update has taken the write lock), along with the version of the voucher
+        (the voucher catalog row is not written, see `VoucherVersions`). The cached snapshot of the voucher
+        is invalidated once the redemption commits. Other integrity errors (e.g. a foreign key or a check constraint) are raised.
+
+        The transaction is retried with a bounded exponential backoff while the database is locked
+        (see `DatabaseLockRetry`).
+
         Parameters:
         - `user`: User - The user redeeming the voucher.
         - `voucher`: Voucher - The voucher being redeemed.
+
+        Returns:
+        - str: `REDEEMED` if the redemption was recorded, `EXHAUSTED` if the voucher is no longer
+          redeemable, `ALREADY_REDEEMED` if the user has already redeemed it, `MISSING` if the
+          voucher no longer exists, or `BUSY` if the database stayed locked.
         """
-        VoucherRedemption.objects.create(
-            user=user,
-            voucher=voucher,
-        )
-        voucher.redemption_count += 1
-        voucher.save()
+        try:
+            outcome = database_lock_retry.run(self.write_voucher_redemption, user, voucher, operation='redeem')
+        except IntegrityError as e:
+            if self.is_duplicate_redemption(e):
+                return self.ALREADY_REDEEMED
+            raise
+        except OperationalError as e:
+            if database_lock_retry.is_lock_error(e):
+                return self.BUSY
+            raise
+        if outcome is not None:
+            return outcome
+        if Voucher.objects.filter(pk=voucher.pk).exists():
+            return self.EXHAUSTED
+        return self.MISSING
+
+    async def acreate_voucher_redemption(self, user, voucher):
+        """
+        Async version of `create_voucher_redemption`, for async views.
+
+        The async ORM can not run transactions, so the redemption transaction (`write_voucher_redemption`) runs
+        in a worker thread, and is retried with a backoff that does not block the event loop (see `DatabaseLockRetry.arun`).
+        """
+        try:
+            outcome = await database_lock_retry.arun(self.write_voucher_redemption, user, voucher, operation='redeem')
+        except IntegrityError as e:
+            if self.is_duplicate_redemption(e):
+                return self.ALREADY_REDEEMED
+            raise
+        except OperationalError as e:
+            if database_lock_retry.is_lock_error(e):
+                return self.BUSY
+            raise
+        if outcome is not None:
+            return outcome
+        if await Voucher.objects.filter(pk=voucher.pk).aexists():
+            return self.EXHAUSTED
+        return self.MISSING
+
+    def redeem(self, user, voucher):
+        """
+        Redeems a voucher for a user and returns the redemption outcome.
+
+        Parameters:
+        - `user`: User - The user redeeming the voucher.
+        - `voucher`: Voucher - The voucher being redeemed (or None if it was not found).
+
+        Returns:
+        - str: One of `REDEEMED`, `EXHAUSTED`, `ALREADY_REDEEMED`, `MISSING` or `BUSY`.
+        """
+        if not voucher:
+            return self.MISSING
+        if self.has_been_redeemed(user, voucher):
+            return self.ALREADY_REDEEMED
+        return self.create_voucher_redemption(user, voucher)
+
+    async def aredeem(self, user, voucher):
+        """
+        Async version of `redeem`, for async views.
+        """
+        if not voucher:
+            return self.MISSING
+        if await self.ahas_been_redeemed(user, voucher):
+            return self.ALREADY_REDEEMED
+        return await self.acreate_voucher_redemption(user, voucher)
 
     def redeem_voucher(self, request, user, voucher):
         """
@@ -106,22 +491,35 @@ class VoucherRedemptionService():
         - `request`: HttpRequest - The HTTP request.
         - `user`: User - The user redeeming the voucher.
         - `voucher`: Voucher - The voucher being redeemed.
+
+        Returns:
+        - str: The redemption outcome (see `redeem`).
         """
-        form_voucher_code = request.POST.get("code")
-        if voucher:
-            has_been_redeemed = self.has_been_redeemed(user, voucher)
-            if not has_been_redeemed:
-                is_redeemable = self.is_redeemable(voucher)
-                if is_redeemable:
-                    self.create_voucher_redemption(user, voucher)
-                    alert_message = f'Voucher "{form_voucher_code}" successfully redeemed '
-                    messages.success(request, alert_message)
-                else:
-                    alert_message = f'Voucher "{form_voucher_code}" cannot be redeemed'
-                    messages.info(request, alert_message)
-            else:
-                alert_message = f'Voucher "{form_voucher_code}" has already been redeemed'
-                messages.info(request, alert_message)
+        outcome = self.redeem(user, voucher)
+        self.add_redemption_message(request, request.POST.get("code"), outcome)
+        return outcome
+
+    def add_redemption_message(self, request, form_voucher_code, outcome):
+        """
+        Adds the message describing a redemption outcome to the request.
+
+        Parameters:
+        - `request`: HttpRequest - The HTTP request.
+        - `form_voucher_code`: str - The voucher code entered by the user.
+        - `outcome`: str - The redemption outcome (see `redeem`).
+        """
+        if outcome == self.REDEEMED:
+            alert_message = f'Voucher "{form_voucher_code}" successfully redeemed '
+            messages.success(request, alert_message)
+        elif outcome == self.EXHAUSTED:
+            alert_message = f'Voucher "{form_voucher_code}" cannot be redeemed'
+            messages.info(request, alert_message)
+        elif outcome == self.ALREADY_REDEEMED:
+            alert_message = f'Voucher "{form_voucher_code}" has already been redeemed'
+            messages.info(request, alert_message)
+        elif outcome == self.BUSY:
+            alert_message = f'Voucher "{form_voucher_code}" could not be redeemed right now, please try again'
+            messages.warning(request, alert_message)
         else:
             alert_message = f'Voucher "{form_voucher_code}" does not exist!'
             messages.error(request, alert_message)
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import VoucherRedemption
+from .rollups import redemption_rollups
+
+
+@receiver(post_save, sender=VoucherRedemption)
+def record_redemption_rollups(sender, instance, created, raw=False, **kwargs):
+    """
+    Adds a new redemption to the redemption rollups, in the transaction recording it.
+    """
+    if created and not raw:
+        redemption_rollups.record([(instance.voucher_id, instance.redeemed_at)])
@@ -1,3 +1,493 @@
-from django.test import TestCase
+import datetime
+import io
+import threading
+from collections import Counter
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, tag
+from django.urls import reverse
+from django.utils import timezone
+from voucher_management.models import Voucher
+from .benchmark import RedemptionBenchmark
+from .models import ArchivedVoucherRedemption, RedemptionRollup, VoucherRedemption, VoucherRedemptionRollup
+from .rollups import redemption_rollups
+from .services import VoucherRedemptionService
 
-# Create your tests here.
+
+class RedemptionOutcomeTests(TestCase):
+    """
+    Tests the outcomes of `VoucherRedemptionService.redeem`, and that the redemption count follows the redemptions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'redeemer{index}') for index in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherRedemptionService()
+
+    def assertRedemptions(self, voucher, count):
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.redemption_count, count)
+        self.assertEqual(VoucherRedemption.objects.filter(voucher=voucher).count(), count)
+
+    def test_redeems_voucher(self):
+        voucher = Voucher.objects.create(code='REDEEM', redemption_type=Voucher.MULTIPLE_REDEMPTION)
+        version = voucher.version
+        for user in self.users:
+            self.assertEqual(self.service.redeem(user, voucher), VoucherRedemptionService.REDEEMED)
+        self.assertRedemptions(voucher, 3)
+        self.assertEqual(voucher.version, version + 3)
+
+    def test_redemption_limit(self):
+        single = Voucher.objects.create(code='SINGLE', redemption_limit=1)
+        x_times = Voucher.objects.create(code='TWICE', redemption_type=Voucher.X_TIMES_REDEMPTION, redemption_limit=2)
+        outcomes = [self.service.redeem(user, single) for user in self.users]
+        self.assertEqual(outcomes, ['redeemed', 'exhausted', 'exhausted'])
+        self.assertRedemptions(single, 1)
+        outcomes = [self.service.redeem(user, x_times) for user in self.users]
+        self.assertEqual(outcomes, ['redeemed', 'redeemed', 'exhausted'])
+        self.assertRedemptions(x_times, 2)
+
+    def test_inactive_and_expired_vouchers(self):
+        inactive = Voucher.objects.create(code='INACTIVE', is_active=False)
+        expired = Voucher.objects.create(code='EXPIRED', expiration_date=timezone.now() - datetime.timedelta(seconds=1))
+        for voucher in (inactive, expired):
+            self.assertEqual(self.service.redeem(self.users[0], voucher), VoucherRedemptionService.EXHAUSTED)
+            self.assertRedemptions(voucher, 0)
+
+    def test_already_redeemed(self):
+        voucher = Voucher.objects.create(code='ONCE', redemption_type=Voucher.MULTIPLE_REDEMPTION)
+        self.assertEqual(self.service.redeem(self.users[0], voucher), VoucherRedemptionService.REDEEMED)
+        self.assertEqual(self.service.redeem(self.users[0], voucher), VoucherRedemptionService.ALREADY_REDEEMED)
+        # A concurrent duplicate passing the EXISTS check is rejected by the unique constraint, and rolled back.
+        self.assertEqual(
+            self.service.create_voucher_redemption(self.users[0], voucher), VoucherRedemptionService.ALREADY_REDEEMED,
+        )
+        self.assertRedemptions(voucher, 1)
+
+    def test_other_integrity_errors_are_raised(self):
+        voucher = Voucher.objects.create(code='BROKEN')
+        with mock.patch.object(
+            VoucherRedemptionService, 'write_voucher_redemption', side_effect=IntegrityError('FOREIGN KEY constraint failed'),
+        ):
+            with self.assertRaises(IntegrityError):
+                self.service.redeem(self.users[0], voucher)
+
+    def test_missing_voucher(self):
+        voucher = Voucher.objects.create(code='DELETED')
+        Voucher.objects.filter(pk=voucher.pk).delete()
+        self.assertEqual(self.service.redeem(self.users[0], voucher), VoucherRedemptionService.MISSING)
+        self.assertEqual(self.service.redeem(self.users[0], None), VoucherRedemptionService.MISSING)
+
+    def test_locked_database(self):
+        voucher = Voucher.objects.create(code='LOCKED')
+        with mock.patch.object(
+            VoucherRedemptionService, 'write_voucher_redemption', side_effect=OperationalError('database is locked'),
+        ):
+            with self.assertLogs('voucher_system.db_retry', 'WARNING'):
+                self.assertEqual(self.service.redeem(self.users[0], voucher), VoucherRedemptionService.BUSY)
+        with mock.patch.object(
+            VoucherRedemptionService, 'write_voucher_redemption', side_effect=OperationalError('no such table'),
+        ):
+            with self.assertRaises(OperationalError):
+                self.service.redeem(self.users[0], voucher)
+        self.assertRedemptions(voucher, 0)
+
+
+class ConcurrentRedemptionTests(TransactionTestCase):
+    """
+    Tests that concurrent redemptions never exceed the redemption limit of a voucher.
+
+    The redemptions run in threads, each with a connection of its own, so the tests do not run in a transaction
+    (as `TestCase` would).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.users = User.objects.bulk_create(User(username=f'concurrent{index}') for index in range(12))
+        self.voucher = Voucher.objects.create(code='RUSH', redemption_type=Voucher.X_TIMES_REDEMPTION, redemption_limit=5)
+
+    def test_redemption_limit_holds(self):
+        service = VoucherRedemptionService()
+        barrier = threading.Barrier(len(self.users))
+        outcomes = Counter()
+        outcomes_lock = threading.Lock()
+
+        def redeem(user):
+            try:
+                voucher = Voucher.objects.get(pk=self.voucher.pk)
+                barrier.wait()
+                outcome = service.redeem(user, voucher)
+                with outcomes_lock:
+                    outcomes[outcome] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=redeem, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(outcomes, {VoucherRedemptionService.REDEEMED: 5, VoucherRedemptionService.EXHAUSTED: 7})
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.redemption_count, 5)
+        self.assertEqual(VoucherRedemption.objects.filter(voucher=self.voucher).count(), 5)
+
+
+class RemoveDuplicateRedemptionsMigrationTests(TransactionTestCase):
+    """
+    Tests that the migration adding the (user, voucher) unique constraint removes the duplicate redemptions
+    and recounts the redemptions of their vouchers.
+    """
+
+    migrate_from = [('voucher_redemption', '0001_initial')]
+    migrate_to = [('voucher_redemption', '0002_voucherredemption_unique_user_voucher')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_removed_and_recounted(self):
+        HistoricalVoucherRedemption = self.apps.get_model('voucher_redemption', 'VoucherRedemption')
+        users = User.objects.bulk_create(User(username=f'duplicate{index}') for index in range(2))
+        duplicated = Voucher.objects.create(code='DUPLICATED', redemption_type=Voucher.MULTIPLE_REDEMPTION, redemption_count=4)
+        untouched = Voucher.objects.create(code='UNTOUCHED', redemption_count=1)
+        HistoricalVoucherRedemption.objects.bulk_create(
+            HistoricalVoucherRedemption(user_id=user_id, voucher_id=voucher_id)
+            for user_id, voucher_id in [
+                (users[0].pk, duplicated.pk), (users[0].pk, duplicated.pk), (users[0].pk, duplicated.pk),
+                (users[1].pk, duplicated.pk), (users[0].pk, untouched.pk),
+            ]
+        )
+        MigrationExecutor(connection).migrate(self.migrate_to)
+        self.assertEqual(VoucherRedemption.objects.filter(voucher=duplicated).count(), 2)
+        duplicated.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual(duplicated.redemption_count, 2)
+        self.assertEqual(untouched.redemption_count, 1)
+
+
+class RedemptionHistoryTests(TestCase):
+    """
+    Tests the keyset pages of the redemption history, and that their cost does not depend on their length.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('historian', password='password')
+        cls.staff_user = User.objects.create_user('auditor', password='password', is_staff=True)
+        vouchers = Voucher.objects.bulk_create(
+            Voucher(code=f'HISTORY{index}', redemption_type=Voucher.MULTIPLE_REDEMPTION) for index in range(5)
+        )
+        redemptions = VoucherRedemption.objects.bulk_create(
+            VoucherRedemption(user=cls.user, voucher=voucher) for voucher in vouchers
+        )
+        now = timezone.now()
+        # The second and third redemptions share their date, and are ordered by ID.
+        for redemption, hours in zip(redemptions, [4, 3, 3, 1, 0]):
+            VoucherRedemption.objects.filter(pk=redemption.pk).update(redeemed_at=now - datetime.timedelta(hours=hours))
+        cls.expected_codes = ['HISTORY4', 'HISTORY3', 'HISTORY2', 'HISTORY1', 'HISTORY0']
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherRedemptionService()
+
+    def get_codes(self, page):
+        return [redemption.voucher.code for redemption in page['redemptions']]
+
+    def test_pages_follow_the_redemption_dates(self):
+        for page_size in (1, 2, 5):
+            with self.subTest(page_size=page_size):
+                expected_pages = [self.expected_codes[i:i + page_size] for i in range(0, 5, page_size)]
+                page = self.service.get_redemption_history_page(self.user, page_size=page_size)
+                self.assertIsNone(page['previous_cursor'])
+                pages = [self.get_codes(page)]
+                while page['next_cursor']:
+                    page = self.service.get_redemption_history_page(self.user, page['next_cursor'], page_size)
+                    pages.append(self.get_codes(page))
+                self.assertEqual(pages, expected_pages)
+                pages = [self.get_codes(page)]
+                while page['previous_cursor']:
+                    page = self.service.get_redemption_history_page(self.user, page['previous_cursor'], page_size)
+                    pages.insert(0, self.get_codes(page))
+                self.assertEqual(pages, expected_pages)
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = self.service.get_redemption_history_page(self.user, cursor='invalid', page_size=2)
+        self.assertEqual(self.get_codes(page), self.expected_codes[:2])
+
+    def test_view_query_count_does_not_depend_on_page_length(self):
+        self.client.force_login(self.user)
+        query_counts = []
+        for page_size in (1, 5):
+            with mock.patch.object(VoucherRedemptionService, 'history_page_size', page_size):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse('redeem_voucher'))
+            self.assertEqual(len(response.context['redeemed_vouchers']), page_size)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_api_lists_redemptions_of_a_user_or_a_voucher(self):
+        url = reverse('api_redemption_history')
+        self.assertEqual(self.client.get(url, {'user': self.user.pk}).status_code, 401)
+        self.client.force_login(self.staff_user)
+        response = self.client.get(url, {'user': self.user.pk, 'page_size': 2})
+        self.assertEqual([redemption['code'] for redemption in response.json()['results']], self.expected_codes[:2])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([redemption['code'] for redemption in response.json()['results']], self.expected_codes[2:4])
+        voucher = Voucher.objects.get(code='HISTORY0')
+        response = self.client.get(url, {'voucher': voucher.pk})
+        self.assertEqual([redemption['user'] for redemption in response.json()['results']], [self.user.pk])
+        self.assertEqual(self.client.get(url, {'user': self.user.pk, 'voucher': voucher.pk}).status_code, 400)
+
+
+class RedemptionRollupTests(TestCase):
+    """
+    Tests that the rollups incremented by the redemptions match the rollups rebuilt from the redemptions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'rollup{index}') for index in range(3)]
+        cls.staff_user = User.objects.create_user('analyst', is_staff=True)
+        cls.vouchers = Voucher.objects.bulk_create(
+            Voucher(code=f'ROLLUP{index}', redemption_type=Voucher.MULTIPLE_REDEMPTION) for index in range(2)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherRedemptionService()
+
+    def get_rollups(self):
+        return (
+            sorted(VoucherRedemptionRollup.objects.values_list('voucher_id', 'period', 'period_start', 'redemption_count')),
+            sorted(RedemptionRollup.objects.values_list('period', 'period_start', 'redemption_count')),
+        )
+
+    def redeem_at(self, user, voucher, redeemed_at):
+        with mock.patch('django.utils.timezone.now', return_value=redeemed_at):
+            self.assertEqual(self.service.redeem(user, voucher), VoucherRedemptionService.REDEEMED)
+
+    def test_recorded_rollups_match_rebuilt_rollups(self):
+        now = timezone.now()
+        for index, (user, voucher) in enumerate((user, voucher) for user in self.users for voucher in self.vouchers):
+            self.redeem_at(user, voucher, now - datetime.timedelta(hours=index * 7, minutes=index))
+        # A duplicate redemption is rolled back along with its rollups.
+        self.assertEqual(
+            self.service.create_voucher_redemption(self.users[0], self.vouchers[0]), VoucherRedemptionService.ALREADY_REDEEMED,
+        )
+        recorded_rollups = self.get_rollups()
+        self.assertEqual(redemption_rollups.get_total(), 6)
+        self.assertEqual(redemption_rollups.get_total(self.vouchers[0].id), 3)
+        RedemptionRollup.objects.all().delete()
+        call_command('rebuild_redemption_rollups', stdout=io.StringIO())
+        self.assertEqual(self.get_rollups(), recorded_rollups)
+
+    def test_summary(self):
+        now = timezone.now()
+        self.redeem_at(self.users[0], self.vouchers[0], now - datetime.timedelta(days=2))
+        self.redeem_at(self.users[1], self.vouchers[1], now)
+        self.redeem_at(self.users[2], self.vouchers[1], now)
+        summary = redemption_rollups.get_summary(hours=24, days=30, top=1)
+        self.assertEqual(summary['total'], 3)
+        self.assertEqual([row['redemptions'] for row in summary['hourly']], [2])
+        self.assertEqual(sum(row['redemptions'] for row in summary['daily']), 3)
+        self.assertEqual(summary['top_vouchers'], [{'voucher_id': self.vouchers[1].id, 'code': 'ROLLUP1', 'redemptions': 2}])
+        voucher_summary = redemption_rollups.get_summary(days=1, voucher_id=self.vouchers[0].id)
+        self.assertEqual((voucher_summary['total'], voucher_summary['daily']), (1, []))
+        self.assertNotIn('top_vouchers', voucher_summary)
+        self.client.force_login(self.staff_user)
+        response = self.client.get(reverse('api_redemption_analytics'), {'top': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 3)
+
+
+class RedemptionArchivalTests(TestCase):
+    """
+    Tests that archived redemptions keep their IDs, still count as redeemed, and stay in the merged history
+    and the rollups.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('archivist')
+        cls.vouchers = Voucher.objects.bulk_create(
+            Voucher(code=f'ARCHIVE{index}', redemption_type=Voucher.MULTIPLE_REDEMPTION) for index in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.service = VoucherRedemptionService()
+        now = timezone.now()
+        for voucher, days in zip(self.vouchers, [400, 300, 200, 10, 0]):
+            with mock.patch('django.utils.timezone.now', return_value=now - datetime.timedelta(days=days)):
+                self.assertEqual(self.service.redeem(self.user, voucher), VoucherRedemptionService.REDEEMED)
+        self.redemption_ids = list(VoucherRedemption.objects.order_by('id').values_list('id', flat=True))
+
+    def get_rollups(self):
+        return sorted(VoucherRedemptionRollup.objects.values_list('voucher_id', 'period', 'period_start', 'redemption_count'))
+
+    def get_ids(self, model):
+        return list(model.objects.order_by('id').values_list('id', flat=True))
+
+    def get_entries(self, page):
+        return [(redemption.voucher.code, redemption.pk in self.redemption_ids[:3]) for redemption in page['redemptions']]
+
+    def test_archives_old_redemptions_in_batches(self):
+        rollups = self.get_rollups()
+        batches = []
+        archived = self.service.archive_redemptions(
+            older_than=datetime.timedelta(days=100), batch_size=2, progress=batches.append,
+        )
+        self.assertEqual((archived, batches), (3, [2, 3]))
+        self.assertEqual(self.get_ids(ArchivedVoucherRedemption), self.redemption_ids[:3])
+        self.assertEqual(self.get_ids(VoucherRedemption), self.redemption_ids[3:])
+        self.assertEqual(self.get_rollups(), rollups)
+        redemption_rollups.rebuild()
+        self.assertEqual(self.get_rollups(), rollups)
+
+    def test_archived_redemptions_count_as_redeemed(self):
+        self.service.archive_redemptions(older_than=datetime.timedelta(days=100))
+        voucher = Voucher.objects.get(pk=self.vouchers[0].pk)
+        self.assertTrue(self.service.has_been_redeemed(self.user, voucher))
+        self.assertEqual(self.service.create_voucher_redemption(self.user, voucher), VoucherRedemptionService.ALREADY_REDEEMED)
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.redemption_count, 1)
+
+    def test_history_merges_live_and_archived_redemptions(self):
+        self.service.archive_redemptions(older_than=datetime.timedelta(days=100))
+        page = self.service.get_redemption_history_page(self.user, page_size=2)
+        pages = [self.get_entries(page)]
+        while page['next_cursor']:
+            page = self.service.get_redemption_history_page(self.user, page['next_cursor'], 2)
+            pages.append(self.get_entries(page))
+        self.assertEqual(pages, [
+            [('ARCHIVE4', False), ('ARCHIVE3', False)],
+            [('ARCHIVE2', True), ('ARCHIVE1', True)],
+            [('ARCHIVE0', True)],
+        ])
+        self.assertTrue(all(isinstance(redemption, ArchivedVoucherRedemption) for redemption in page['redemptions']))
+        page = self.service.get_redemption_history_page(self.user, page['previous_cursor'], 2)
+        self.assertEqual([redemption.voucher.code for redemption in page['redemptions']], ['ARCHIVE2', 'ARCHIVE1'])
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command('archive_redemptions', days=250, pause=0, stdout=stdout)
+        self.assertIn('Successfully archived 2 redemptions older than 250 days', stdout.getvalue())
+        with self.assertRaisesMessage(CommandError, '--days cannot be negative'):
+            call_command('archive_redemptions', days=-1)
+
+
+class AsyncVoucherRedemptionViewTests(TransactionTestCase):
+    """
+    Tests the outcomes of the async JSON redemption endpoint.
+
+    The redemption transaction runs in a worker thread with a connection of its own, so the tests do not run
+    in a transaction (as `TestCase` would).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('redeemer', password='password')
+        self.voucher = Voucher.objects.create(code='ASYNC10', discount_percentage=10)
+
+    async def redeem(self, code, login=True):
+        if login:
+            await self.async_client.aforce_login(self.user)
+        return await self.async_client.post(reverse('redeem_voucher_async'), {'code': code}, content_type='application/json')
+
+    async def test_redeems_voucher_once(self):
+        response = await self.redeem('async10')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'code': 'async10', 'outcome': 'redeemed', 'discount_percentage': 10})
+        response = await self.redeem('ASYNC10')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['outcome'], 'already_redeemed')
+        self.assertEqual(await VoucherRedemption.objects.filter(voucher=self.voucher).acount(), 1)
+
+    async def test_missing_voucher(self):
+        response = await self.redeem('UNKNOWN')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['outcome'], 'missing')
+
+    async def test_requires_authentication(self):
+        response = await self.redeem('ASYNC10', login=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(await VoucherRedemption.objects.aexists())
+
+
+class IdempotentVoucherRedemptionTests(TestCase):
+    """
+    Tests that redemptions sent with an Idempotency-Key header run once, and that retries show the first outcome.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('retrier', password='password')
+        Voucher.objects.create(code='RETRY10')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def redeem(self, code, key):
+        response = self.client.post(
+            reverse('redeem_voucher'), {'code': code}, headers={'Idempotency-Key': key}, follow=True,
+        )
+        self.assertEqual(response.redirect_chain, [(reverse('redeem_voucher'), 302)])
+        return [str(message) for message in response.context['messages']]
+
+    def test_retry_replays_outcome(self):
+        self.assertEqual(self.redeem('RETRY10', 'redeem-1'), ['Voucher "RETRY10" successfully redeemed '])
+        self.assertEqual(self.redeem('RETRY10', 'redeem-1'), ['Voucher "RETRY10" successfully redeemed '])
+        self.assertEqual(self.redeem('RETRY10', 'redeem-2'), ['Voucher "RETRY10" has already been redeemed'])
+        self.assertEqual(VoucherRedemption.objects.filter(user=self.user).count(), 1)
+
+
+@tag('benchmark')
+class RedemptionBenchmarkTests(TransactionTestCase):
+    """
+    Runs a small redemption benchmark in each mode, from concurrent threads, and checks that no voucher exceeded
+    its redemption limit and that every redemption counted was recorded.
+
+    Exclude these tests with `python manage.py test --exclude-tag benchmark`.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.benchmark = RedemptionBenchmark(vouchers_per_type=2, users=12, operations=90, x_times_limit=5)
+        self.benchmark.setup()
+
+    def get_expected_redemptions(self):
+        users_per_voucher = {}
+        for user_index, voucher_index in self.benchmark.get_plan():
+            users_per_voucher.setdefault(voucher_index, set()).add(user_index)
+        return sum(
+            min(len(users), self.benchmark.vouchers[voucher_index].redemption_limit or len(users))
+            for voucher_index, users in users_per_voucher.items()
+        )
+
+    def test_redemption_limits_hold_under_concurrency(self):
+        for mode in RedemptionBenchmark.MODES:
+            with self.subTest(mode=mode):
+                VoucherRedemption.objects.all().delete()
+                Voucher.objects.update(redemption_count=0)
+                cache.clear()
+                result = self.benchmark.run(mode, threads=6)
+                self.assertEqual(result['operations'], 90)
+                self.assertEqual(self.benchmark.verify(), [])
+                self.assertNotIn('busy', result['outcomes'])
+                self.assertEqual(result['outcomes']['redeemed'], self.get_expected_redemptions())
+                self.assertEqual(VoucherRedemption.objects.count(), self.get_expected_redemptions())
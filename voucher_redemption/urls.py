@@ -1,9 +1,10 @@
 from django.urls import path
 from django.views.generic import RedirectView
-from .views import VoucherRedemptionView
+from .views import AsyncVoucherRedemptionView, VoucherRedemptionView
 
 
 urlpatterns = [
     path('', RedirectView.as_view(url='redeem/', permanent=False)),
     path('redeem/', VoucherRedemptionView.as_view(), name='redeem_voucher'),
+    path('redeem/async/', AsyncVoucherRedemptionView.as_view(), name='redeem_voucher_async'),
 ]
\ No newline at end of file
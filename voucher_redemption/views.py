@@ -1,8 +1,13 @@
+import json
+from django.contrib import messages
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.views import View
 from dashboard.views import DashboardView
 from .forms import VoucherRedemptionForm
 from .services import VoucherRedemptionService
 from voucher_management.services import VoucherManagementService
+from voucher_system.idempotency import idempotency_store
 
 
 class VoucherRedemptionView(DashboardView):
@@ -16,10 +21,12 @@ class VoucherRedemptionView(DashboardView):
     - `voucher_redemption_service`: VoucherRedemptionService - Service for voucher redemption.
     - `voucher_management_service`: VoucherManagementService - Service for voucher management.
     - `base_context`: dict - Base context for the view.
+    - `use_read_replica`: bool - Reads of GET requests may go to the read replica (see `ReplicaRouter`).
 
     Methods:
     - `get`: Handles GET requests, retrieves redeemed vouchers, and renders the redemption form.
     - `post`: Handles POST requests, redeems a voucher, and redirects to the redemption page.
+    - `redeem`: Redeems the voucher with a code for a user, and returns the redemption outcome.
     """
 
     template = 'voucher_redemption/base.html'
@@ -27,6 +34,7 @@ class VoucherRedemptionView(DashboardView):
     form = VoucherRedemptionForm()
     voucher_redemption_service = VoucherRedemptionService()
     voucher_management_service = VoucherManagementService()
+    use_read_replica = True
 
     base_context = {
         'application_name': 'Voucher Redemption',
@@ -37,6 +45,9 @@ class VoucherRedemptionView(DashboardView):
         """
         Handles GET requests, retrieves redeemed vouchers, and renders the redemption form.
 
+        The redemption history is paginated with the `cursor` query parameter
+        (see `VoucherRedemptionService.get_redemption_history_page`).
+
         Parameters:
         - `request`: HttpRequest - The HTTP request.
         - `args`: Any - Variable-length argument list.
@@ -46,12 +57,14 @@ class VoucherRedemptionView(DashboardView):
         - HttpResponse: Rendered response with voucher redemption form and redeemed vouchers.
         """
         user = request.user
-        redeemed_vouchers = self.voucher_redemption_service.get_redeemed_vouchers(user)
+        page = self.voucher_redemption_service.get_redemption_history_page(user, cursor=request.GET.get('cursor'))
         voucher_management_access = user.is_staff or user.is_superuser
         context = {
             'voucher_management_access': voucher_management_access,
             'form': self.form,
-            'redeemed_vouchers': redeemed_vouchers,
+            'redeemed_vouchers': page['redemptions'],
+            'next_page_url': f'?cursor={page["next_cursor"]}' if page['next_cursor'] else None,
+            'previous_page_url': f'?cursor={page["previous_cursor"]}' if page['previous_cursor'] else None,
         }
         context.update(self.dashboard_context)
         context.update(self.base_context)
@@ -61,6 +74,10 @@ class VoucherRedemptionView(DashboardView):
         """
         Handles POST requests, redeems a voucher, and redirects to the redemption page.
 
+        A request sent with an `Idempotency-Key` header redeems the voucher once: retries with the same key
+        show the outcome of the first attempt without querying the vouchers or the redemptions
+        (see `IdempotencyStore`).
+
         Parameters:
         - `request`: HttpRequest - The HTTP request.
         - `args`: Any - Variable-length argument list.
@@ -71,6 +88,106 @@ class VoucherRedemptionView(DashboardView):
         """
         voucher_code = request.POST.get('code', None)
         user = request.user
-        voucher = self.voucher_management_service.get_voucher_by_code(voucher_code)
-        self.voucher_redemption_service.redeem_voucher(request, user, voucher)
+        try:
+            request_key = idempotency_store.get_request_key(request, 'redeem_voucher', {'code': voucher_code})
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('redeem_voucher')
+        if request_key is None:
+            outcome = self.redeem(user, voucher_code)
+        else:
+            state, outcome = idempotency_store.run(
+                *request_key,
+                self.redeem,
+                user,
+                voucher_code,
+                should_store=lambda outcome: outcome != VoucherRedemptionService.BUSY,
+            )
+            if state == idempotency_store.IN_PROGRESS:
+                messages.warning(request, f'Voucher "{voucher_code}" is being redeemed, please try again')
+                return redirect('redeem_voucher')
+            if state == idempotency_store.MISMATCH:
+                messages.error(request, f'The {idempotency_store.header} was already used for another voucher')
+                return redirect('redeem_voucher')
+        self.voucher_redemption_service.add_redemption_message(request, voucher_code, outcome)
         return redirect('redeem_voucher')
+
+    def redeem(self, user, voucher_code):
+        """
+        Redeems the voucher with a code for a user, and returns the redemption outcome.
+        """
+        voucher = self.voucher_management_service.get_voucher_by_code(voucher_code)
+        return self.voucher_redemption_service.redeem(user, voucher)
+
+
+class AsyncVoucherRedemptionView(View):
+    """
+    Async JSON endpoint redeeming a voucher, for ASGI deployments (see `voucher_system/asgi.py`).
+
+    The voucher is looked up and the user's previous redemptions are checked with the async ORM, and the
+    redemption transaction runs in a worker thread (see `VoucherRedemptionService.aredeem`), so requests waiting
+    on the database do not hold a worker. The code is read from a JSON body (`{"code": ...}`) or form data;
+    the response is the `outcome` of the redemption, with a status code per outcome.
+
+    Attributes:
+    - `http_method_names`: list - Only POST requests are accepted.
+    - `voucher_redemption_service`: VoucherRedemptionService - Service for voucher redemption.
+    - `voucher_management_service`: VoucherManagementService - Service for voucher management.
+    - `outcome_statuses`: dict - HTTP status code of each redemption outcome.
+    """
+
+    http_method_names = ['post']
+    voucher_redemption_service = VoucherRedemptionService()
+    voucher_management_service = VoucherManagementService()
+    outcome_statuses = {
+        VoucherRedemptionService.REDEEMED: 201,
+        VoucherRedemptionService.EXHAUSTED: 409,
+        VoucherRedemptionService.ALREADY_REDEEMED: 409,
+        VoucherRedemptionService.MISSING: 404,
+        VoucherRedemptionService.BUSY: 503,
+    }
+
+    def get_voucher_code(self, request):
+        """
+        Returns the voucher code of the request, from its JSON body or its form data.
+
+        Raises:
+        - ValueError: If the JSON body is invalid.
+        """
+        if request.content_type == 'application/json':
+            data = json.loads(request.body or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError('The body must be a JSON object.')
+            code = data.get('code')
+        else:
+            code = request.POST.get('code')
+        return code if isinstance(code, str) else None
+
+    async def post(self, request, *args, **kwargs):
+        """
+        Handles POST requests, redeeming a voucher for the logged in user.
+
+        Parameters:
+        - `request`: HttpRequest - The HTTP request.
+        - `args`: Any - Variable-length argument list.
+        - `kwargs`: Any - Arbitrary keyword arguments.
+
+        Returns:
+        - JsonResponse: The `code` and the `outcome` of the redemption, with the `discount_percentage` of
+          the voucher once redeemed.
+        """
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        try:
+            voucher_code = self.get_voucher_code(request)
+        except ValueError as e:
+            return JsonResponse({'detail': f'Invalid request body: {e}'}, status=400)
+        if not voucher_code:
+            return JsonResponse({'code': ['This field is required.']}, status=400)
+        voucher = await self.voucher_management_service.aget_voucher_by_code(voucher_code)
+        outcome = await self.voucher_redemption_service.aredeem(user, voucher)
+        data = {'code': voucher_code, 'outcome': outcome}
+        if outcome == VoucherRedemptionService.REDEEMED:
+            data['discount_percentage'] = voucher.discount_percentage
+        return JsonResponse(data, status=self.outcome_statuses[outcome])
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseLockRetry:
+    """
+    Retries database writes failing on lock contention, with a bounded exponential backoff.
+
+    A write is retried when it fails with an `OperationalError` reporting a locked (or busy) SQLite database,
+    or a serialization failure or deadlock on other databases, after sleeping a random delay of up to
+    `DATABASE_LOCK_RETRY_BASE_DELAY * 2 ** retry` seconds (at most `DATABASE_LOCK_RETRY_MAX_DELAY`), up to
+    `DATABASE_LOCK_RETRY_ATTEMPTS` attempts. The write must be a whole transaction: inside an atomic block,
+    the error is raised at once, since only the outermost transaction can be retried.
+
+    Lock errors, retries, exhausted retries and the time spent in failed attempts (including the busy timeout
+    waited for the lock) and in backoff are counted per operation, in the process (see `get_stats`).
+
+    Attributes:
+    - `lock_messages` (tuple): Fragments of the SQLite error messages reporting lock contention.
+    - `lock_sqlstates` (tuple): SQLSTATE codes of serialization failures and deadlocks.
+    """
+
+    lock_messages = ('database is locked', 'database table is locked', 'database is busy')
+    lock_sqlstates = ('40001', '40P01')
+
+    def __init__(self):
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+
+    def is_lock_error(self, error):
+        """
+        Returns whether a database error was caused by lock contention.
+        """
+        cause = error.__cause__
+        if getattr(cause, 'sqlstate', None) in self.lock_sqlstates or getattr(cause, 'pgcode', None) in self.lock_sqlstates:
+            return True
+        message = str(error).lower()
+        return any(lock_message in message for lock_message in self.lock_messages)
+
+    def record(self, operation, **counts):
+        with self.stats_lock:
+            self.stats.setdefault(operation, Counter()).update(counts)
+
+    def get_delay(self, retry):
+        """
+        Returns the backoff delay (in seconds) before a retry, with full jitter.
+        """
+        return random.uniform(0, min(settings.DATABASE_LOCK_RETRY_MAX_DELAY, settings.DATABASE_LOCK_RETRY_BASE_DELAY * 2 ** retry))
+
+    def run(self, function, *args, operation='write', using=DEFAULT_DB_ALIAS, **kwargs):
+        """
+        Calls a function writing to the database, retrying it while it fails on lock contention.
+
+        Parameters:
+        - `function` (callable): The function, running its writes in a transaction of its own.
+        - `args`, `kwargs`: Arguments of the function.
+        - `operation` (str): Name of the write in the statistics.
+        - `using` (str): Alias of the database written to.
+
+        Returns:
+        - The return value of the function.
+
+        Raises:
+        - OperationalError: If the function fails with another error, or on lock contention after the last attempt.
+        """
+        attempts = 1 if connections[using].in_atomic_block else settings.DATABASE_LOCK_RETRY_ATTEMPTS
+        for attempt in range(attempts):
+            started_at = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except OperationalError as e:
+                if not self.is_lock_error(e):
+                    raise
+                self.record(operation, lock_errors=1, lock_wait_seconds=time.monotonic() - started_at)
+                if attempt + 1 >= attempts:
+                    self.record(operation, exhausted=1)
+                    logger.warning('%s failed on lock contention after %d attempts: %s', operation, attempt + 1, e)
+                    raise
+                delay = self.get_delay(attempt)
+                self.record(operation, retries=1, backoff_seconds=delay)
+                logger.debug('%s failed on lock contention, retrying in %.3fs: %s', operation, delay, e)
+                time.sleep(delay)
+            else:
+                self.record(operation, calls=1)
+                return result
+
+    def call_in_worker(self, function, *args, **kwargs):
+        close_old_connections()
+        return function(*args, **kwargs)
+
+    async def arun(self, function, *args, operation='write', **kwargs):
+        """
+        Async version of `run`, for async views: each attempt calls the (sync) function in a worker thread,
+        as the async ORM can not run transactions, and the backoff sleeps without blocking the event loop
+        or holding a thread.
+
+        The attempts run in the event loop's default executor, a bounded pool of threads, so at most that many
+        transactions compete for the database write lock, however many requests are in flight. The connections
+        of the pool threads are closed once obsolete or unusable, as request threads do (`CONN_MAX_AGE`).
+
+        Parameters:
+        - `function` (callable): The sync function, running its writes in a transaction of its own.
+        - `args`, `kwargs`: Arguments of the function.
+        - `operation` (str): Name of the write in the statistics.
+
+        Returns:
+        - The return value of the function.
+
+        Raises:
+        - OperationalError: If the function fails with another error, or on lock contention after the last attempt.
+        """
+        attempts = settings.DATABASE_LOCK_RETRY_ATTEMPTS
+        for attempt in range(attempts):
+            started_at = time.monotonic()
+            try:
+                result = await sync_to_async(self.call_in_worker, thread_sensitive=False)(function, *args, **kwargs)
+            except OperationalError as e:
+                if not self.is_lock_error(e):
+                    raise
+                self.record(operation, lock_errors=1, lock_wait_seconds=time.monotonic() - started_at)
+                if attempt + 1 >= attempts:
+                    self.record(operation, exhausted=1)
+                    logger.warning('%s failed on lock contention after %d attempts: %s', operation, attempt + 1, e)
+                    raise
+                delay = self.get_delay(attempt)
+                self.record(operation, retries=1, backoff_seconds=delay)
+                logger.debug('%s failed on lock contention, retrying in %.3fs: %s', operation, delay, e)
+                await asyncio.sleep(delay)
+            else:
+                self.record(operation, calls=1)
+                return result
+
+    def get_stats(self):
+        """
+        Returns the counts of calls, lock errors, retries and exhausted retries, and the seconds spent waiting
+        for locks and in backoff, keyed by operation, since the process started (or the last `reset_stats`).
+        """
+        with self.stats_lock:
+            return {operation: dict(counts) for operation, counts in self.stats.items()}
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {}
+
+
+database_lock_retry = DatabaseLockRetry()
@@ -0,0 +1,203 @@
+import datetime
+import hashlib
+import json
+import pickle
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from api.models import IdempotencyKey
+from .db_retry import database_lock_retry
+
+
+class IdempotencyStore:
+    """
+    Database-backed store of the results of requests sent with an `Idempotency-Key` header, so a client retrying
+    a request (e.g. after a timeout) gets the result of the first attempt instead of running it again.
+
+    Keys are scoped to an operation and to the user sending them, and are stored (as `IdempotencyKey` rows,
+    shared by every process) with a fingerprint of the request payload: reusing a key for another payload is
+    a conflict. A request claims its key in one short transaction before running (see `claim`), so a duplicate
+    sent while the first attempt is running is answered as in progress; the claim expires after
+    `IDEMPOTENCY_PENDING_TIMEOUT` seconds if the attempt died. Results are kept `IDEMPOTENCY_KEY_TIMEOUT` seconds,
+    then purged in batches (see `purge_expired`). Results that may succeed on a retry (e.g. a busy database)
+    are not stored.
+
+    The writes are retried on lock contention (see `DatabaseLockRetry`); a database error left after the retries
+    is raised, never mistaken for a key in progress or silently dropping a result.
+
+    Attributes:
+    - `STARTED`: State of a request that claimed its key, and must run.
+    - `REPLAYED`: State of a request whose key has a stored result.
+    - `IN_PROGRESS`: State of a request whose key is claimed by a request still running.
+    - `MISMATCH`: State of a request whose key was used with another payload.
+    - `header` (str): Name of the request header holding the key.
+    - `max_key_length` (int): Maximum length of a key.
+    - `purge_batch_size` (int): Default number of expired keys deleted per transaction.
+    """
+
+    STARTED = 'started'
+    REPLAYED = 'replayed'
+    IN_PROGRESS = 'in_progress'
+    MISMATCH = 'mismatch'
+
+    header = 'Idempotency-Key'
+    max_key_length = 255
+    purge_batch_size = 1000
+
+    def get_request_key(self, request, operation, payload):
+        """
+        Returns the cache key and the payload fingerprint of a request sent with an `Idempotency-Key` header.
+
+        Parameters:
+        - `request` (HttpRequest): The request, with its authenticated user.
+        - `operation` (str): Name of the operation the key is scoped to.
+        - `payload` (dict): Data of the request, serializable to JSON.
+
+        Returns:
+        - tuple: The stored key and the fingerprint, or None if the request has no `Idempotency-Key` header.
+
+        Raises:
+        - ValueError: If the key is empty or longer than `max_key_length`.
+        """
+        idempotency_key = request.headers.get(self.header)
+        if idempotency_key is None:
+            return None
+        idempotency_key = idempotency_key.strip()
+        if not idempotency_key or len(idempotency_key) > self.max_key_length:
+            raise ValueError(f'The {self.header} header must have between 1 and {self.max_key_length} characters.')
+        user = request.user.pk if request.user.is_authenticated else 'anonymous'
+        key_hash = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+        return f'{operation}:{user}:{key_hash}', fingerprint
+
+    def claim(self, key, fingerprint):
+        """
+        Claims a key in one transaction: takes it over if it expired, inserts it if it does not exist,
+        and reads it otherwise.
+
+        Returns:
+        - tuple: None if the key was claimed, otherwise its fingerprint, completion and pickled result.
+        """
+        now = timezone.now()
+        claim_fields = {
+            'fingerprint': fingerprint,
+            'completed': False,
+            'result': None,
+            'expires_at': now + datetime.timedelta(seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT),
+        }
+        keys = IdempotencyKey.objects.filter(key=key)
+        with transaction.atomic():
+            if keys.filter(expires_at__lte=now).update(**claim_fields):
+                return None
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(key=key, **claim_fields)
+                return None
+            except IntegrityError:
+                return keys.values_list('fingerprint', 'completed', 'result').first()
+
+    def begin(self, key, fingerprint):
+        """
+        Claims a key for a request, unless it is claimed or has a stored result.
+
+        Returns:
+        - tuple: The state of the request (`STARTED`, `REPLAYED`, `IN_PROGRESS` or `MISMATCH`), and the stored
+          result when `REPLAYED`.
+
+        Raises:
+        - DatabaseError: If the key could not be claimed or read (e.g. the database stayed locked).
+        """
+        entry = database_lock_retry.run(self.claim, key, fingerprint, operation='idempotency_claim')
+        if entry is None:
+            return self.STARTED, None
+        stored_fingerprint, completed, result = entry
+        if stored_fingerprint != fingerprint:
+            return self.MISMATCH, None
+        if not completed:
+            return self.IN_PROGRESS, None
+        return self.REPLAYED, pickle.loads(result)
+
+    def complete(self, key, fingerprint, result):
+        """
+        Stores the (picklable) result of the request that claimed a key.
+
+        Raises:
+        - DatabaseError: If the result could not be stored (e.g. the database stayed locked).
+        """
+        database_lock_retry.run(
+            IdempotencyKey.objects.filter(key=key, fingerprint=fingerprint).update,
+            completed=True,
+            result=pickle.dumps(result, pickle.HIGHEST_PROTOCOL),
+            expires_at=timezone.now() + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TIMEOUT),
+            operation='idempotency_complete',
+        )
+
+    def abandon(self, key):
+        """
+        Releases the claim on a key without storing a result, so the request can be retried.
+        """
+        database_lock_retry.run(IdempotencyKey.objects.filter(key=key).delete, operation='idempotency_abandon')
+
+    def purge_expired(self, now=None, batch_size=None, pause=0):
+        """
+        Deletes the expired keys, in batches read from the index on `expires_at`, each in its own short
+        transaction (retried on lock contention), so requests can write between batches.
+
+        Parameters:
+        - `now` (datetime): Date the keys are expired at (default: the start of the purge).
+        - `batch_size` (int): Number of keys deleted per transaction (default: `purge_batch_size`).
+        - `pause` (float): Number of seconds to sleep between batches.
+
+        Returns:
+        - int: Number of keys deleted.
+        """
+        now = now or timezone.now()
+        batch_size = batch_size or self.purge_batch_size
+        expired_keys = IdempotencyKey.objects.filter(expires_at__lte=now)
+        purged = 0
+        while True:
+            key_ids = list(expired_keys.order_by('expires_at').values_list('id', flat=True)[:batch_size])
+            if not key_ids:
+                break
+            deleted, _ = database_lock_retry.run(
+                expired_keys.filter(id__in=key_ids).delete, operation='idempotency_purge',
+            )
+            purged += deleted
+            if len(key_ids) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return purged
+
+    def run(self, key, fingerprint, function, *args, should_store=None, **kwargs):
+        """
+        Calls a function once per key, and stores its result for the retries.
+
+        Parameters:
+        - `key`, `fingerprint`: The stored key and payload fingerprint of the request (see `get_request_key`).
+        - `function` (callable): The function running the request.
+        - `args`, `kwargs`: Arguments of the function.
+        - `should_store` (callable): Returns whether a result is stored (all results are by default); the
+          claim on the key is released for the results that are not.
+
+        Returns:
+        - tuple: The state of the request (see `begin`), and the result of the function (`STARTED`) or the
+          stored result (`REPLAYED`).
+        """
+        state, result = self.begin(key, fingerprint)
+        if state != self.STARTED:
+            return state, result
+        try:
+            result = function(*args, **kwargs)
+        except BaseException:
+            self.abandon(key)
+            raise
+        if should_store is None or should_store(result):
+            self.complete(key, fingerprint, result)
+        else:
+            self.abandon(key)
+        return state, result
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,91 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .routers import ReplicaReadState, replica_state
+
+
+class ReadReplicaMiddleware:
+    """
+    Middleware deciding, per request, whether the reads of the request may go to the read replica
+    (see `ReplicaRouter`).
+
+    Only GET and HEAD requests to views with a true `use_read_replica` attribute read from the replica.
+    After a request that writes (any request with another method, or a request the router saw a write in),
+    the client is pinned to the primary for `DATABASE_REPLICA_STICKY_SECONDS` with a cookie, so it reads its
+    own writes while the replica catches up. The cookie is not signed: forging it only sends reads to the primary.
+    Streamed responses are produced under the routing state of their request, as their queries run while
+    the response is iterated. The middleware is async-capable, so async views run without a thread under ASGI.
+
+    Attributes:
+    - `cookie_name` (str): Name of the cookie holding the time until which the client reads from the primary.
+    """
+
+    cookie_name = 'db_primary_until'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = ReplicaReadState(pinned=self.is_pinned(request))
+        request.replica_state = state
+        token = replica_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_state.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        state = ReplicaReadState(pinned=self.is_pinned(request))
+        request.replica_state = state
+        token = replica_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_state.reset(token)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        state = request.replica_state
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(state, response.streaming_content)
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            sticky_seconds = settings.DATABASE_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                self.cookie_name,
+                f'{time.time() + sticky_seconds:.3f}',
+                max_age=sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def stream(self, state, streaming_content):
+        iterator = iter(streaming_content)
+        while True:
+            token = replica_state.set(state)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                replica_state.reset(token)
+            yield chunk
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        if request.method in ('GET', 'HEAD') and getattr(view_class, 'use_read_replica', False):
+            request.replica_state.use_replica = True
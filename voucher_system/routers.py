@@ -0,0 +1,63 @@
+import contextvars
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+replica_state = contextvars.ContextVar('replica_state', default=None)
+
+
+class ReplicaReadState:
+    """
+    Routing state of the current request (see `ReadReplicaMiddleware`).
+
+    Attributes:
+    - `use_replica` (bool): Whether the reads of the request may go to the replica.
+    - `pinned` (bool): Whether the reads of the request go to the primary: set when the client wrote recently
+      (read-your-writes stickiness) or when the request itself writes.
+    - `wrote` (bool): Whether the request wrote to the primary.
+    """
+
+    def __init__(self, use_replica=False, pinned=False):
+        self.use_replica = use_replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of read-only requests to the read replica `DATABASE_REPLICA_ALIAS`,
+    and every other query to the primary (`default`) database.
+
+    Reads only go to the replica while the current request allows it (see `ReadReplicaMiddleware`), it
+    has not written, and no transaction is open on the primary, so a transaction never reads from the replica.
+    Writes always go to the primary, and pin the reads of the rest of the request to it.
+    Without `DATABASE_REPLICA_ALIAS`, every query goes to the primary.
+
+    Attributes:
+    - `primary_app_labels` (tuple): Apps always read from the primary, so a session or user created
+      moments ago is never missing from a lagging replica.
+    """
+
+    primary_app_labels = ('auth', 'sessions')
+
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+        if (
+            settings.DATABASE_REPLICA_ALIAS is None
+            or model._meta.app_label in self.primary_app_labels
+            or state is None
+            or not state.use_replica
+            or state.pinned
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return settings.DATABASE_REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = replica_state.get()
+        if state is not None:
+            state.pinned = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 from django.contrib.messages import constants as messages
 
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'voucher_system.middleware.ReadReplicaMiddleware',
 ]
 
 MESSAGE_TAGS = {
@@ -93,13 +96,108 @@ WSGI_APPLICATION = 'voucher_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Database profiles, selected by the VOUCHER_DATABASE_PROFILE environment variable (development by default).
+# The production profile keeps connections open, runs SQLite in WAL mode (readers do not block the writer), waits up to `timeout`
+# seconds for locks and starts transactions with the write lock (see voucher_system.sqlite3).
+# The test databases are files (instead of shared in-memory databases, whose table locks fail concurrent
+# readers at once), so the tests redeeming from concurrent threads run against the locking of the profile.
+# They are created in the temporary directory, under names holding the process ID, so concurrent test runs
+# (e.g. of two checkouts) do not share them.
+TEST_DATABASE_PREFIX = Path(tempfile.gettempdir()) / f'voucher-system-test-{os.getpid()}'
+DATABASE_PROFILES = {
+    'development': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'NAME': f'{TEST_DATABASE_PREFIX}.sqlite3'},
+    },
+    'production': {
+        'ENGINE': 'voucher_system.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'NAME': f'{TEST_DATABASE_PREFIX}.sqlite3'},
+        'OPTIONS': {
+            'timeout': 5,
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'temp_store': 'MEMORY',
+                'cache_size': -20000,
+            },
+        },
+    },
+}
+
+DATABASES = {
+    'default': DATABASE_PROFILES[os.environ.get('VOUCHER_DATABASE_PROFILE', 'development')],
+}
+
+# Read replica of the default database (e.g. a copy kept up to date with `python manage.py sync_read_replica`),
+# defined when the VOUCHER_READ_REPLICA_NAME environment variable gives its path (voucher_system.settings_test
+# defines it for the tests). The reads of the read-only views (see voucher_system.routers) go to it when the
+# VOUCHER_READ_REPLICA environment variable is also set, and to the default database otherwise.
+if os.environ.get('VOUCHER_READ_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['VOUCHER_READ_REPLICA_NAME'],
+        'TEST': {'NAME': f'{TEST_DATABASE_PREFIX}-replica.sqlite3'},
     }
+DATABASE_REPLICA_ALIAS = 'replica' if os.environ.get('VOUCHER_READ_REPLICA') and 'replica' in DATABASES else None
+# Seconds during which a client that wrote keeps reading from the default database (read-your-writes)
+DATABASE_REPLICA_STICKY_SECONDS = 5
+DATABASE_ROUTERS = ['voucher_system.routers.ReplicaRouter']
+
+# Bounded exponential backoff of the database writes retried on lock contention (voucher_system.db_retry)
+DATABASE_LOCK_RETRY_ATTEMPTS = 5
+DATABASE_LOCK_RETRY_BASE_DELAY = 0.01
+DATABASE_LOCK_RETRY_MAX_DELAY = 0.5
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+    'PAGE_SIZE': 100,
 }
 
+# Seconds the API tokens resolved by api.authentication stay cached in process, and maximum number of cached tokens
+API_TOKEN_CACHE_TIMEOUT = 60
+API_TOKEN_CACHE_SIZE = 10000
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds the results of requests sent with an Idempotency-Key header (voucher_system.idempotency) are kept,
+# and seconds a key stays claimed by a request that did not complete
+IDEMPOTENCY_KEY_TIMEOUT = 24 * 60 * 60
+IDEMPOTENCY_PENDING_TIMEOUT = 60
+
+# Cache alias and timeout (in seconds) of the voucher snapshots cached by voucher_management.cache
+VOUCHER_CACHE_ALIAS = 'default'
+VOUCHER_CACHE_TIMEOUT = 300
+
+# Bloom filter of voucher codes (voucher_management.code_filter) rejecting unknown codes without a query
+VOUCHER_CODE_FILTER_ENABLED = True
+VOUCHER_CODE_FILTER_ERROR_RATE = 0.01
+VOUCHER_CODE_FILTER_REFRESH_INTERVAL = 5
+
+# Age (in days) after which redemptions are moved to the archive table by the archive_redemptions command
+REDEMPTION_ARCHIVE_AFTER_DAYS = 365
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -0,0 +1,18 @@
+"""
+Django settings for the test runs of voucher_system: the project settings, with a read replica of the default
+database, so the tests of the routing to the replica run.
+
+    python manage.py test --settings=voucher_system.settings_test
+"""
+
+from .settings import *  # noqa: F401, F403
+from .settings import BASE_DIR, DATABASES, TEST_DATABASE_PREFIX
+
+DATABASES = {
+    'replica': {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'TEST': {'NAME': f'{TEST_DATABASE_PREFIX}-replica.sqlite3'},
+    },
+    **DATABASES,
+}
@@ -0,0 +1,44 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend configuring every new connection from two extra `OPTIONS`:
+
+    - `pragmas` (dict): PRAGMA statements run when a connection is opened (e.g. `journal_mode`, `synchronous`),
+      which the sqlite3 module has no connection parameters for.
+    - `transaction_mode` (str): `DEFERRED`, `IMMEDIATE` or `EXCLUSIVE`, the mode transactions are started in
+      (as the option of the same name of Django 5.1). In `IMMEDIATE` mode, a transaction takes the write lock
+      when it starts, waiting up to the busy timeout (the `timeout` option) for it, instead of failing with
+      "database is locked" when a read transaction upgrades to a write while another connection writes.
+
+    The other `OPTIONS` are passed to `sqlite3.connect` as usual.
+    """
+
+    transaction_modes = ['DEFERRED', 'IMMEDIATE', 'EXCLUSIVE']
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.transaction_mode = params.pop('transaction_mode', None)
+        if self.transaction_mode is not None:
+            self.transaction_mode = self.transaction_mode.upper()
+            if self.transaction_mode not in self.transaction_modes:
+                raise ImproperlyConfigured(
+                    f'settings.DATABASES[{self.alias!r}]["OPTIONS"]["transaction_mode"] must be one of '
+                    f'{", ".join(self.transaction_modes)}.'
+                )
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
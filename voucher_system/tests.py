@@ -0,0 +1,161 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from api.models import IdempotencyKey
+from .db_retry import DatabaseLockRetry
+from .idempotency import IdempotencyStore
+from .sqlite3.base import DatabaseWrapper
+
+
+class FlakyWrite:
+    """
+    Write failing with the given errors before succeeding.
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'written'
+
+
+@override_settings(DATABASE_LOCK_RETRY_ATTEMPTS=3, DATABASE_LOCK_RETRY_BASE_DELAY=0, DATABASE_LOCK_RETRY_MAX_DELAY=0)
+class DatabaseLockRetryTests(SimpleTestCase):
+    """
+    Tests that writes are retried on lock contention only, a bounded number of times.
+    """
+
+    def setUp(self):
+        self.database_lock_retry = DatabaseLockRetry()
+
+    def test_retries_lock_errors(self):
+        write = FlakyWrite(OperationalError('database is locked'), OperationalError('database table is locked'))
+        self.assertEqual(self.database_lock_retry.run(write, operation='test'), 'written')
+        self.assertEqual(write.calls, 3)
+        stats = self.database_lock_retry.get_stats()['test']
+        self.assertEqual((stats['calls'], stats['lock_errors'], stats['retries']), (1, 2, 2))
+
+    def test_raises_after_last_attempt(self):
+        write = FlakyWrite(*[OperationalError('database is locked')] * 3)
+        with self.assertLogs('voucher_system.db_retry', 'WARNING'), self.assertRaises(OperationalError):
+            self.database_lock_retry.run(write, operation='test')
+        self.assertEqual(write.calls, 3)
+        self.assertEqual(self.database_lock_retry.get_stats()['test']['exhausted'], 1)
+
+    def test_raises_other_errors_at_once(self):
+        write = FlakyWrite(OperationalError('no such table: voucher'))
+        with self.assertRaises(OperationalError):
+            self.database_lock_retry.run(write)
+        self.assertEqual(write.calls, 1)
+
+    async def test_async_retries_lock_errors(self):
+        write = FlakyWrite(OperationalError('database is locked'))
+        self.assertEqual(await self.database_lock_retry.arun(write, operation='test'), 'written')
+        self.assertEqual(write.calls, 2)
+
+
+@override_settings(DATABASE_LOCK_RETRY_ATTEMPTS=3, DATABASE_LOCK_RETRY_BASE_DELAY=0, DATABASE_LOCK_RETRY_MAX_DELAY=0)
+class AtomicDatabaseLockRetryTests(TestCase):
+    """
+    Tests that writes run inside a transaction are not retried, as only the outermost transaction can be.
+    """
+
+    def test_does_not_retry_inside_transaction(self):
+        write = FlakyWrite(OperationalError('database is locked'))
+        with transaction.atomic(), self.assertLogs('voucher_system.db_retry', 'WARNING'):
+            with self.assertRaises(OperationalError):
+                DatabaseLockRetry().run(write)
+        self.assertEqual(write.calls, 1)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """
+    Tests that the SQLite backend of the production profile runs its pragmas and starts transactions in its mode.
+    """
+
+    def get_connection(self, path, **options):
+        settings_dict = {**connections[DEFAULT_DB_ALIAS].settings_dict, 'NAME': path, 'OPTIONS': options}
+        settings_dict.pop('TEST', None)
+        return DatabaseWrapper(settings_dict, alias='production')
+
+    def test_pragmas_and_transaction_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            connection = self.get_connection(
+                path, timeout=0, transaction_mode='immediate', pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+            )
+            try:
+                with connection.cursor() as cursor:
+                    self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+                    self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone(), (1,))
+                connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                # The transaction holds the write lock before writing anything.
+                other_connection = sqlite3.connect(path, timeout=0)
+                with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                    other_connection.execute('BEGIN IMMEDIATE')
+                other_connection.close()
+                connection.rollback()
+                connection.set_autocommit(True)
+            finally:
+                connection.close()
+
+    def test_invalid_transaction_mode(self):
+        connection = self.get_connection(':memory:', transaction_mode='LAZY')
+        with self.assertRaises(ImproperlyConfigured):
+            connection.ensure_connection()
+
+
+class IdempotencyStoreTests(TestCase):
+    """
+    Tests the claims and results of idempotency keys, that database errors are raised, and the purge of expired keys.
+    """
+
+    def setUp(self):
+        self.idempotency_store = IdempotencyStore()
+
+    def test_claim_and_replay(self):
+        self.assertEqual(self.idempotency_store.begin('op:1:key', 'payload'), (IdempotencyStore.STARTED, None))
+        self.assertEqual(self.idempotency_store.begin('op:1:key', 'payload'), (IdempotencyStore.IN_PROGRESS, None))
+        self.assertEqual(self.idempotency_store.begin('op:1:key', 'other'), (IdempotencyStore.MISMATCH, None))
+        self.idempotency_store.complete('op:1:key', 'payload', (201, {'id': 1}))
+        self.assertEqual(
+            self.idempotency_store.begin('op:1:key', 'payload'), (IdempotencyStore.REPLAYED, (201, {'id': 1})),
+        )
+        self.idempotency_store.abandon('op:1:key')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_key_is_claimed_again(self):
+        self.idempotency_store.begin('op:1:key', 'payload')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.idempotency_store.begin('op:1:key', 'other'), (IdempotencyStore.STARTED, None))
+        self.assertEqual(IdempotencyKey.objects.get().fingerprint, 'other')
+
+    def test_lock_error_is_raised(self):
+        with (
+            mock.patch.object(IdempotencyKey.objects, 'create', side_effect=OperationalError('database is locked')),
+            self.assertLogs('voucher_system.db_retry', 'WARNING'),
+            self.assertRaises(OperationalError),
+        ):
+            self.idempotency_store.begin('op:1:key', 'payload')
+
+    def test_purge_expired_keys(self):
+        now = timezone.now()
+        IdempotencyKey.objects.bulk_create([
+            IdempotencyKey(key=f'op:1:{i}', fingerprint='payload', expires_at=now + datetime.timedelta(seconds=i - 5))
+            for i in range(8)
+        ])
+        self.assertEqual(self.idempotency_store.purge_expired(now=now, batch_size=2), 6)
+        self.assertEqual(sorted(IdempotencyKey.objects.values_list('key', flat=True)), ['op:1:6', 'op:1:7'])
+        with self.assertRaises(CommandError):
+            call_command('purge_idempotency_keys', batch_size=0)